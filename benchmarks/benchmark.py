@@ -0,0 +1,346 @@
+'''
+Набор бенчмарков: word count, tf-idf, инвертированный индекс (PMI) и
+статистика рёбер дорожного графа на синтетических данных нескольких размеров
+и на данных из data/. Результаты сохраняются в JSON и могут сравниваться
+с сохранёнными ранее результатами.
+
+Пример запуска из корня репозитория:
+    python benchmarks/benchmark.py --sizes 10000 100000 --output results.json
+    python benchmarks/benchmark.py --sizes 10000 100000 --baseline results.json
+'''
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'examples'))
+import mrop
+import invert_index
+import tf_idf
+import word_count
+
+DATA = os.path.join(ROOT, 'data')
+
+WORDS = ['the', 'of', 'and', 'to', 'in', 'a', 'is', 'that', 'for', 'it',
+         'as', 'was', 'with', 'be', 'by', 'on', 'not', 'he', 'this', 'are',
+         'city', 'road', 'river', 'night', 'letter', 'window', 'street',
+         'garden', 'winter', 'summer', 'station', 'bridge', 'market',
+         'soldier', 'captain', 'doctor', 'village', 'forest', 'mountain']
+
+
+def generate_documents(rows, seed=0, words_per_doc=10):
+    '''
+    Генерирует документы для текстовых бенчмарков. Частоты слов убывают
+    примерно по закону Ципфа, к словарю добавляются редкие слова.
+    :param rows: int, число документов
+    :param seed: int, зерно генератора случайных чисел
+    :param words_per_doc: int, число слов в документе
+    :return: генератор строк {'doc_id', 'text'}
+    '''
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+    for doc_id in range(rows):
+        words = rng.choices(WORDS, weights, k=words_per_doc)
+        words[rng.randrange(words_per_doc)] = 'w{}'.format(rng.randrange(rows))
+        yield {'doc_id': 'doc{}'.format(doc_id), 'text': ' '.join(words)}
+
+
+def generate_edges(rows, seed=0):
+    '''
+    Генерирует рёбра дорожного графа в формате data/graph_data.txt.
+    :param rows: int, число рёбер
+    :param seed: int, зерно генератора случайных чисел
+    :return: генератор строк {'start', 'end', 'edge_id'}
+    '''
+    rng = random.Random(seed)
+    for _ in range(rows):
+        lon = rng.uniform(37.3, 37.9)
+        lat = rng.uniform(55.5, 55.95)
+        yield {
+            'start': [lon, lat],
+            'end': [lon + rng.uniform(-0.002, 0.002),
+                    lat + rng.uniform(-0.002, 0.002)],
+            'edge_id': rng.getrandbits(63)
+        }
+
+
+def mapper_edge_length(row):
+    lon1, lat1 = map(math.radians, row['start'])
+    lon2, lat2 = map(math.radians, row['end'])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    yield {
+        'cell': '{:.2f}:{:.2f}'.format(*row['start']),
+        'length': 2 * 6373 * math.asin(math.sqrt(a)),
+        'edges': 1
+    }
+
+
+def folder_edge_stats(state, row):
+    state['length'] += row['length']
+    state['edges'] += row['edges']
+    return state
+
+
+def mapper_mean_length(row):
+    yield {
+        'cell': row['cell'],
+        'edges': row['edges'],
+        'mean_length': row['length'] / row['edges']
+    }
+
+
+def build_word_count():
+    graph = mrop.ComputeGraph() \
+        .map(word_count.split_input) \
+        .sort('word') \
+        .reduce(word_count.word_counter, 'word')
+    graph.compile()
+    return graph, None
+
+
+def build_tf_idf():
+    split_word = mrop.ComputeGraph() \
+        .map(tf_idf.split_input)
+
+    count_docs = mrop.ComputeGraph() \
+        .fold(tf_idf.row_counter, {'docs_count': 0})
+
+    count_idf = mrop.ComputeGraph() \
+        .input(split_word) \
+        .sort(['doc_id', 'word']) \
+        .reduce(tf_idf.reducer_unique, ['doc_id', 'word']) \
+        .join(count_docs, strategy='cross') \
+        .sort('word') \
+        .reduce(tf_idf.reducer_calc_idf, 'word', preserves_order=True)
+
+    graph = mrop.ComputeGraph() \
+        .input(split_word) \
+        .sort(['doc_id']) \
+        .reduce(tf_idf.reducer_calc_tf, ['doc_id']) \
+        .join(count_idf, strategy='left', key='word') \
+        .map(tf_idf.mapper_calc_tf_idf, preserves_order=True) \
+        .sort('word') \
+        .reduce(tf_idf.reducer_top_doc_counter, key='word')
+    graph.compile()
+    return graph, [split_word, count_docs]
+
+
+def build_invert_index():
+    split_word = mrop.ComputeGraph() \
+        .map(invert_index.split_input)
+
+    count_words = mrop.ComputeGraph() \
+        .input(split_word) \
+        .fold(invert_index.row_counter, {'word_count': 0})
+
+    cumul_frequency = mrop.ComputeGraph() \
+        .input(split_word) \
+        .sort('word') \
+        .reduce(invert_index.reducer_num_of_occurences, 'word',
+                preserves_order=True) \
+        .join(count_words, strategy='cross') \
+        .map(invert_index.mapper_count_cumul_frequency, preserves_order=True)
+
+    graph = mrop.ComputeGraph() \
+        .input(split_word) \
+        .sort('doc_id') \
+        .reduce(invert_index.reducer_frequency, 'doc_id') \
+        .join(cumul_frequency, key='word') \
+        .map(invert_index.mapper_index)
+    graph.compile()
+    return graph, [split_word]
+
+
+def build_edge_stats():
+    graph = mrop.ComputeGraph() \
+        .map(mapper_edge_length) \
+        .aggregate(folder_edge_stats, 'cell') \
+        .map(mapper_mean_length)
+    graph.compile()
+    return graph, None
+
+
+BENCHMARKS = {
+    'word_count': (build_word_count, generate_documents, 'input.txt'),
+    'tf_idf': (build_tf_idf, generate_documents, 'input.txt'),
+    'invert_index': (build_invert_index, generate_documents, 'input.txt'),
+    'edge_stats': (build_edge_stats, generate_edges, 'graph_data.txt')
+}
+
+
+def write_rows(path, rows):
+    with open(path, 'w') as f:
+        for row in rows:
+            f.write(json.dumps(row))
+            f.write('\n')
+
+
+def run_graph(name, path, profile=None):
+    '''
+    Один раз вычисляет бенчмарк на входном файле.
+    :param name: string, имя бенчмарка из BENCHMARKS
+    :param path: string, путь к входному файлу
+    :param profile: mrop.Profile или None
+    :return: float, время вычисления в секундах
+    '''
+    graph, subgraphs = BENCHMARKS[name][0]()
+    output = io.StringIO()
+    start = time.perf_counter()
+    with open(path) as in_file:
+        if subgraphs is None:
+            graph.run(input=in_file, output=output, profile=profile)
+        else:
+            graph.run(subgraph_inputs={subgraph: in_file
+                                       for subgraph in subgraphs},
+                      output=output, profile=profile)
+    return time.perf_counter() - start
+
+
+def run_benchmark(name, path, rows, memory=False, repeat=1):
+    '''
+    Запускает один бенчмарк на входном файле. Время -- лучшее из repeat
+    запусков без профилирования, чтобы издержки профилировщика не влияли на
+    сравнение с сохранёнными результатами; профиль операций и пик памяти
+    записываются в отдельном запуске.
+    :param name: string, имя бенчмарка из BENCHMARKS
+    :param path: string, путь к входному файлу
+    :param rows: int, число строк во входном файле
+    :param memory: bool, замерять ли пик памяти (замедляет профилируемый
+    запуск)
+    :param repeat: int, число запусков без профилирования
+    :return: dict, результат
+    '''
+    seconds = min(run_graph(name, path) for _ in range(repeat))
+    profile = mrop.Profile(memory=memory)
+    run_graph(name, path, profile)
+    peaks = [record.peak_memory for record in profile.graphs
+             if record.peak_memory is not None]
+    return {
+        'benchmark': name,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds > 0 else None,
+        'peak_memory': max(peaks) if len(peaks) > 0 else None,
+        'graphs': profile.as_dict()
+    }
+
+
+def run_suite(names, sizes, bundled=True, memory=False, repeat=1, seed=0):
+    '''
+    Запускает бенчмарки names на синтетических данных размеров sizes
+    и, если bundled=True, на данных из data/.
+    :return: list of dicts, результаты
+    '''
+    results = []
+    directory = tempfile.mkdtemp(prefix='mrop-bench-')
+    try:
+        for name in names:
+            generate, dataset = BENCHMARKS[name][1:]
+            inputs = []
+            if bundled:
+                path = os.path.join(DATA, dataset)
+                with open(path) as f:
+                    rows = sum(1 for line in f if line.strip())
+                inputs.append((dataset, path, rows))
+            for size in sizes:
+                path = os.path.join(directory, '{}-{}.txt'.format(
+                    generate.__name__, size))
+                if not os.path.exists(path):
+                    write_rows(path, generate(size, seed))
+                inputs.append((size, path, size))
+            for size, path, rows in inputs:
+                result = run_benchmark(name, path, rows, memory, repeat)
+                result['size'] = size
+                results.append(result)
+                print(format_result(result))
+    finally:
+        for file_name in os.listdir(directory):
+            os.remove(os.path.join(directory, file_name))
+        os.rmdir(directory)
+    return results
+
+
+def format_result(result, baseline=None):
+    line = '{:<14} {:>14} {:>10.3f} s {:>12.0f} rows/s'.format(
+        result['benchmark'], str(result['size']), result['seconds'],
+        result['rows_per_second'] or 0)
+    if result['peak_memory'] is not None:
+        line += ' {:>8.1f} MB'.format(result['peak_memory'] / 2 ** 20)
+    if baseline is not None:
+        line += ' {:>+7.1%}'.format(result['seconds'] / baseline['seconds'] - 1)
+    return line
+
+
+def compare(results, baseline, threshold=0.1):
+    '''
+    Сравнивает результаты с сохранёнными ранее.
+    :param results: list of dicts, текущие результаты
+    :param baseline: list of dicts, результаты, с которыми сравнивать
+    :param threshold: float, допустимое относительное замедление
+    :return: list of dicts, результаты, замедлившиеся больше чем на threshold
+    '''
+    previous = {(result['benchmark'], str(result['size'])): result
+                for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['benchmark'], str(result['size'])))
+        if old is None:
+            continue
+        print(format_result(result, old))
+        if result['seconds'] > old['seconds'] * (1 + threshold):
+            regressions.append(result)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='mrop benchmarks')
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS),
+                        default=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='*', type=int,
+                        default=[10 ** 4, 10 ** 5, 10 ** 6],
+                        help='synthetic input sizes in rows, e.g. 10000 10000000')
+    parser.add_argument('--no-bundled', action='store_true',
+                        help='skip the datasets in data/')
+    parser.add_argument('--memory', action='store_true',
+                        help='record peak memory with tracemalloc in the '
+                             'profiled run')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save results to this JSON file')
+    parser.add_argument('--baseline', help='compare with results saved earlier')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed relative slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.benchmarks, args.sizes, not args.no_bundled,
+                        args.memory, args.repeat, args.seed)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results
+            }, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for result in regressions:
+            print('regression: {} {}'.format(result['benchmark'],
+                                             result['size']))
+        return 1 if len(regressions) > 0 else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -75,9 +75,9 @@ if __name__ == '__main__':
     cumul_frequency = mrop.ComputeGraph() \
         .input(split_word) \
         .sort('word') \
-        .reduce(reducer_num_of_occurences, 'word') \
+        .reduce(reducer_num_of_occurences, 'word', preserves_order=True) \
         .join(count_words, strategy='cross') \
-        .map(mapper_count_cumul_frequency)
+        .map(mapper_count_cumul_frequency, preserves_order=True)
 
     count_index = mrop.ComputeGraph() \
         .input(split_word) \
@@ -81,14 +81,14 @@ if __name__ == '__main__':
         .reduce(reducer_unique, ['doc_id', 'word']) \
         .join(count_docs, strategy='cross') \
         .sort('word') \
-        .reduce(reducer_calc_idf, 'word')
+        .reduce(reducer_calc_idf, 'word', preserves_order=True)
 
     calc_index = mrop.ComputeGraph() \
         .input(split_word) \
         .sort(['doc_id']) \
         .reduce(reducer_calc_tf, ['doc_id']) \
         .join(count_idf, strategy='left', key='word') \
-        .map(mapper_calc_tf_idf) \
+        .map(mapper_calc_tf_idf, preserves_order=True) \
         .sort('word') \
         .reduce(reducer_top_doc_counter, key='word')
 
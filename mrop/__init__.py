@@ -6,3 +6,13 @@ from .mrop import Reduce
 from .mrop import Join
 from .mrop import Sort
 from .mrop import Fold
+from .mrop import Aggregate
+from .mrop import MapBatches
+from .mrop import ReduceBatches
+from .mrop import TopK
+from .mrop import Limit
+from .mrop import JsonCodec
+from .mrop import PickleCodec
+from .mrop import ColumnarCodec
+from .mrop import ResultCache
+from .mrop import Profile
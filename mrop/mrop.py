@@ -1,32 +1,100 @@
+import array
+import bisect
+import bz2
+import concurrent.futures
+import copy
+import glob
+import gzip
+import hashlib
+import heapq
+import io
 import json
+import lzma
+import marshal
+import mmap
+import operator
+import os
+import pickle
+import queue
+import random
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+from collections.abc import Mapping, MutableMapping
+from itertools import chain, groupby, islice
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class ComputeGraph(object):
     '''
     Вычислительный граф. Используется для вычислений над таблицами.
     Таблицы задаются как последовательность словарей.
-    Поддерживаемые операции: Input, Map, Reduce, Sort, Join, Fold.
+    Поддерживаемые операции: Input, Map, Reduce, Sort, Join, Fold, Aggregate,
+    MapBatches, ReduceBatches, TopK, Limit.
     Добавление операции: graph.add(Map(mapper)) или graph.map(mapper)
     Перед вычислением графа его нужно скомпилировать, вызвав compile
     Выполнение вычислений -- run
     '''
 
-    def __init__(self):
+    def __init__(self, sort_buffer_size=None, schema=None, workers=None):
         '''
         Инициализирует вычислительный граф.
+        :param sort_buffer_size: int или None, сколько строк операции Sort, Join
+        и ReduceBatches графа могут держать в памяти при сортировке (см. Sort). Используется для
+        операций, у которых этот параметр не задан явно.
+        :param schema: list of strings или None, столбцы результата графа. Если
+        задана, результат хранится в виде компактных записей (см. record_type),
+        а не словарей; каждая строка результата должна содержать ровно эти
+        столбцы.
+        :param workers: int или None, число процессов для параллельного
+        выполнения операций Sort, Reduce и Join графа (см. эти операции).
+        Используется для операций, у которых этот параметр не задан явно.
         '''
+        if workers is not None and workers < 1:
+            raise ValueError('workers must be positive')
+        self.sort_buffer_size = sort_buffer_size
+        self.workers = workers
+        self.schema = None
+        self.make_record = None
+        if schema is not None:
+            self.schema = record_type(schema).fields
+            self.make_record = record_maker(self.schema)
         self.operations = []
         self.result = None
         self.source = None
         self.dependencies = []
         self.compiled = False
         self.compute_order = []
+        self.plan = []
+        self.output_order = None
+        self.consumer_counts = {}
+        self.inlined = set()
+        self.streamed = False
+        self.profile = None
+        self.pending_consumers = None
+        self.keep_result = True
+        self.result_lock = threading.Lock()
 
-    def compile(self, topsort_needed=True):
+    def compile(self, topsort_needed=True, optimize=True):
         '''
         Компилирует граф, после чего тот становится готов к запуску вычислений.
         :param topsort_needed: bool, провести ли топологическую сортировку зависимостей
         графа для определения порядка вычислений.
+        :param optimize: bool, оптимизировать ли план выполнения (см. build_plan
+        и inline_subgraphs)
         :return: None
         '''
         # print('compiling graph {}...'.format(self))
@@ -40,44 +108,397 @@ class ComputeGraph(object):
             del self.compute_order[-1]
             for graph in self.compute_order:
                 if not graph.compiled:
-                    graph.compile(topsort_needed=False)
+                    graph.compile(topsort_needed=False, optimize=optimize)
+            self.count_result_consumers()
 
-        if len(self.operations) == 0:
-            self.compiled = True
-            return
-        if self.source is not None:
-            self.operations[0].set_input_gen(self.source)
+        for op in self.operations:
+            if isinstance(op, (Sort, Join, ReduceBatches)) and \
+                    op.buffer_size is None:
+                op.buffer_size = self.sort_buffer_size
+            if isinstance(op, (Sort, Reduce, Join)) and op.workers is None:
+                op.workers = self.workers
+        self.build_plan(optimize)
+        if topsort_needed and optimize:
+            self.inline_subgraphs()
+        if len(self.plan) > 0 and self.source is not None:
+            self.plan[0].set_input_gen(self.source)
 
-        for (i, op) in enumerate(self.operations):
+        for (i, op) in enumerate(self.plan):
             if i == 0:
                 continue
-            op.set_input_gen(self.operations[i - 1])
+            op.set_input_gen(self.plan[i - 1])
 
         self.compiled = True
 
-    def compute(self, verbose=0):
+    def count_result_consumers(self):
+        '''
+        Подсчитывает для каждого подграфа из compute_order, сколько раз его
+        результат читается другими графами (через Input или Join). Когда все
+        читатели закончили чтение, результат подграфа освобождается
+        (см. release_result).
+        :return: None
+        '''
+        self.consumer_counts = self.result_consumers(self.compute_order + [self])
+
+    def result_consumers(self, graphs):
+        '''
+        Подсчитывает для каждого подграфа из compute_order, сколько раз его
+        результат читают графы из graphs.
+        :param graphs: list of ComputeGraph, читающие графы
+        :return: dict вида {subgraph: count}
+        '''
+        counts = {graph: 0 for graph in self.compute_order}
+        for graph in graphs:
+            if isinstance(graph.source, Input) and \
+                    isinstance(graph.source.data_from, ComputeGraph):
+                counts[graph.source.data_from] += 1
+            for op in graph.operations:
+                if isinstance(op, Join):
+                    counts[op.graph] += 1
+        return counts
+
+    def release_result(self):
+        '''
+        Сообщает, что один из читателей результата графа закончил чтение.
+        После последнего читателя результат освобождается, если при вычислении
+        не было запрошено сохранить результаты подграфов.
+        :return: None
+        '''
+        with self.result_lock:
+            if self.pending_consumers is None:
+                return
+            self.pending_consumers -= 1
+            if self.pending_consumers <= 0 and not self.keep_result:
+                self.result = None
+
+    def build_plan(self, optimize=True):
+        '''
+        Строит план выполнения self.plan -- список операций, которые будут
+        выполнены при вычислении графа. Вместе с планом вычисляется порядок
+        строк после каждой операции (см. Operation.propagate_order): сортировки
+        таблиц, уже отсортированных по нужному ключу, в план не попадают,
+        а Join узнаёт, какие из его входов уже отсортированы.
+        При optimize=True план дополнительно оптимизируется: подряд идущие
+        последовательные Map сливаются в один FusedMap, подряд идущие Sort --
+        в один Sort (Sort(a), Sort(b) эквивалентно Sort(b + a) в силу
+        устойчивости), Sort и следующий за ним Reduce -- в один SortReduce,
+        а Sort и следующий за ним Limit(n) -- в TopK, выбирающий n наименьших
+        строк с помощью кучи.
+        :param optimize: bool, оптимизировать ли план
+        :return: None
+        '''
+        order = None
+        if isinstance(self.source, Input) and \
+                isinstance(self.source.data_from, ComputeGraph):
+            order = self.source.data_from.output_order
+
+        operations = self.operations
+        if optimize:
+            operations = fuse_operations(operations)
+
+        self.plan = []
+        for op in operations:
+            if isinstance(op, Sort) and is_sorted_by(order, op.key):
+                continue
+            order = op.propagate_order(order)
+            if optimize and isinstance(op, Reduce) and len(self.plan) > 0 \
+                    and type(self.plan[-1]) is Sort:
+                self.plan[-1] = SortReduce(self.plan[-1], op)
+                continue
+            if optimize and isinstance(op, Limit) and len(self.plan) > 0 \
+                    and type(self.plan[-1]) is Sort:
+                self.plan[-1] = TopK(None, op.n, self.plan[-1].key,
+                                     largest=False)
+                continue
+            self.plan.append(op)
+        self.output_order = order
+
+    def inline_subgraphs(self):
+        '''
+        Встраивает подграфы, результат которых читает ровно один граф, и
+        читает через Input: такой подграф не вычисляется отдельно, а его
+        операции выполняются потоково внутри читающего графа, без
+        сохранения результата. Вызывается при компиляции с optimize=True.
+        При вычислении с keep_results=True подграфы не встраиваются.
+        :return: None
+        '''
+        self.inlined = set()
+        for graph in self.compute_order + [self]:
+            source = graph.source
+            if isinstance(source, Input) and \
+                    isinstance(source.data_from, ComputeGraph) and \
+                    self.consumer_counts.get(source.data_from) == 1:
+                self.inlined.add(source.data_from)
+
+    def effective_dependencies(self, graph):
+        '''
+        Возвращает подграфы, которые должны быть вычислены до graph, с учётом
+        того, что зависимости встроенных подграфов становятся зависимостями
+        читающего их графа.
+        :param graph: ComputeGraph
+        :return: set of ComputeGraph
+        '''
+        dependencies = set()
+        for dependency in graph.dependencies:
+            if dependency.streamed:
+                dependencies |= self.effective_dependencies(dependency)
+            else:
+                dependencies.add(dependency)
+        return dependencies
+
+    def dump_plan(self):
+        '''
+        Возвращает текстовое описание планов графа и всех его подграфов:
+        операции в том виде, в котором они были добавлены, и план после
+        оптимизации.
+        :return: string
+        '''
+        names = self.graph_names()
+        lines = []
+        for graph in self.compute_order + [self]:
+            title = names[graph]
+            if graph in self.inlined:
+                title += ' (inlined)'
+            lines.append(title)
+            if isinstance(graph.source, Input):
+                lines.append('  source: {}'.format(
+                    graph.source.describe(names)))
+            lines.append('  operations:')
+            lines.extend('    ' + op.describe(names) for op in graph.operations)
+            lines.append('  plan:')
+            lines.extend('    ' + op.describe(names) for op in graph.plan)
+        return '\n'.join(lines)
+
+    def graph_names(self):
+        '''
+        Возвращает короткие имена графа и его подграфов для dump_plan
+        и Profile: 'subgraph i' для i-го подграфа в compute_order и 'graph'
+        для самого графа.
+        :return: dict вида {graph: name}
+        '''
+        names = {graph: 'subgraph {}'.format(i)
+                 for i, graph in enumerate(self.compute_order)}
+        names[self] = 'graph'
+        return names
+
+    def compute(self, verbose=0, parallelism=1, keep_results=False,
+                cache=None, profile=None):
         '''
         Проводит вычисления и записывает результат в self.result.
         :param verbose: если 1, то выводить информацию о ходе выполнения
+        :param parallelism: int, сколько независимых подграфов вычислять
+        одновременно (см. compute_dependencies)
+        :param keep_results: bool, сохранять ли результаты подграфов
+        (см. compute_dependencies)
+        :param cache: ResultCache или None, кэш результатов подграфов
+        :param profile: Profile или None, куда записывать профиль вычислений
+        :return: None
+        '''
+        self.compute_dependencies(verbose=verbose, parallelism=parallelism,
+                                  keep_results=keep_results, cache=cache,
+                                  profile=profile)
+        self.profile = profile
+        try:
+            self.compute_result(verbose=verbose)
+        finally:
+            if profile is not None:
+                profile.finish()
+
+    def compute_dependencies(self, verbose=0, parallelism=1,
+                             keep_results=False, cache=None, profile=None):
+        '''
+        Вычисляет все подграфы, от которых зависит граф. При parallelism=1
+        подграфы вычисляются по очереди в порядке compute_order, иначе
+        независимые подграфы вычисляются одновременно в пуле из parallelism
+        потоков, и подграф запускается, как только вычислены все подграфы,
+        от которых он зависит.
+        Результат подграфа освобождается, как только его прочитали все графы,
+        которые от него зависят, если не задано keep_results=True.
+        Если задан cache, результаты подграфов, уже сохранённые в нём (см.
+        ResultCache и fingerprint), загружаются из кэша, подграфы, нужные
+        только для них, не вычисляются, а остальные результаты сохраняются
+        в кэш.
+        :param verbose: если 1, то выводить информацию о ходе выполнения
+        :param parallelism: int, число одновременно вычисляемых подграфов
+        :param keep_results: bool, сохранять ли результаты подграфов
+        (например, для отладки)
+        :param cache: ResultCache или None
+        :param profile: Profile или None, куда записывать профиль вычислений
+        (см. Profile)
         :return: None
         '''
-        if verbose:
-            print('computing graph {}'.format(self))
         if not self.compiled:
             raise AttributeError('Graph should be compiled before compute')
+        if parallelism < 1:
+            raise ValueError('parallelism must be positive')
+
+        if profile is not None:
+            profile.start(self)
+        for graph in self.compute_order:
+            graph.profile = profile
+            graph.streamed = graph in self.inlined and not keep_results
+        keys = {}
+        cached = set()
+        if cache is not None:
+            memo = {}
+            for graph in self.compute_order:
+                keys[graph] = graph.fingerprint(cache.hash_content, memo)
+            cached = {graph for graph in self.compute_order
+                      if keys[graph] is not None and keys[graph] in cache}
+            for graph in cached:
+                graph.streamed = False
+        active = self.needed_graphs(cached) + [self]
+        graphs = [graph for graph in active[:-1] if not graph.streamed]
+
+        self.count_input_consumers(active)
+        consumer_counts = self.consumer_counts
+        if cache is not None:
+            consumer_counts = self.result_consumers(active)
+        for graph in self.compute_order:
+            graph.pending_consumers = consumer_counts.get(graph, 0)
+            graph.keep_result = keep_results
+        for graph in graphs:
+            if graph in cached:
+                if verbose:
+                    print('loading graph {} from cache'.format(graph))
+                graph.result = cache.load(keys[graph])
+        graphs = [graph for graph in graphs if graph not in cached]
+        store = {graph: keys.get(graph) for graph in graphs}
+
+        def compute_graph(graph):
+            graph.compute_result(verbose=verbose)
+            if store[graph] is not None:
+                cache.store(store[graph], graph.result)
+
+        if parallelism == 1:
+            for graph in graphs:
+                compute_graph(graph)
+            return
+
+        waiting = {graph: self.effective_dependencies(graph) & set(graphs)
+                   for graph in graphs}
+        dependents = {graph: [] for graph in graphs}
+        for graph, dependencies in waiting.items():
+            for dependency in dependencies:
+                dependents[dependency].append(graph)
+
+        ready = [graph for graph in graphs if not waiting[graph]]
+        running = {}
+        pool = concurrent.futures.ThreadPoolExecutor(parallelism)
+        try:
+            while len(ready) > 0 or len(running) > 0:
+                for graph in ready:
+                    future = pool.submit(compute_graph, graph)
+                    running[future] = graph
+                ready = []
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    graph = running.pop(future)
+                    future.result()
+                    for dependent in dependents[graph]:
+                        waiting[dependent].discard(graph)
+                        if not waiting[dependent]:
+                            ready.append(dependent)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def compute_result(self, verbose=0):
+        '''
+        Вычисляет результат самого графа, считая, что все подграфы,
+        от которых он зависит, уже вычислены.
+        :param verbose: если 1, то выводить информацию о ходе выполнения
+        :return: None
+        '''
+        if verbose:
+            print('computing graph {}'.format(self))
+        if self.profile is not None:
+            self.profile.begin(self)
+        try:
+            if self.make_record is not None:
+                self.result = list(map(self.make_record, self.iter_result()))
+            else:
+                self.result = list(self.iter_result())
+        finally:
+            if self.profile is not None:
+                self.profile.end(self)
+
+    def iter_result(self):
+        '''
+        Генератор строк результата графа. В отличие от compute_result, не
+        сохраняет результат, а отдаёт строки по мере их вычисления последней
+        операцией. Подграфы, от которых зависит граф, должны быть уже вычислены.
+        :return: None
+        '''
         if self.source is None:
             raise AttributeError('Cannot compute graph. Input not specified')
 
-        for graph in self.compute_order:
-            graph.compute(verbose=verbose)
+        if self.profile is not None:
+            yield from self.profile.iter_result(self)
+            return
 
-        if len(self.operations) == 0:
-            self.result = list(self.source)
+        if len(self.plan) == 0:
+            yield from self.source
             return
 
-        self.operations[0].set_input_gen(self.source)
-        self.result = list(self.operations[-1])
-        self.operations[0].del_input_gen()
+        self.plan[0].set_input_gen(self.source)
+        try:
+            yield from self.plan[-1]
+        finally:
+            self.plan[0].del_input_gen()
+
+    def write_result(self, output, flush_size=1024, codec=None):
+        '''
+        Потоково записывает результат графа в output: строки кодируются по мере
+        вычисления и записываются пачками по flush_size строк.
+        :param output: Открытый на запись выходной файл.
+        :param flush_size: int, число строк в одной записываемой пачке
+        :param codec: JsonCodec, PickleCodec, ColumnarCodec или None (JSON)
+        :return: None
+        '''
+        if flush_size < 1:
+            raise ValueError('flush_size must be positive')
+        if codec is None:
+            codec = JsonCodec()
+        codec.write_rows(output, self.iter_result(), flush_size)
+
+    def needed_graphs(self, cached=()):
+        '''
+        Возвращает подграфы из compute_order, которые нужно вычислить или
+        загрузить, чтобы вычислить граф: подграфы, от которых зависят только
+        подграфы из cached, не нужны.
+        :param cached: set of ComputeGraph, подграфы, результат которых
+        загружается из кэша
+        :return: list of ComputeGraph в порядке compute_order
+        '''
+        needed = set()
+        stack = [self]
+        while len(stack) > 0:
+            graph = stack.pop()
+            for dependency in graph.dependencies:
+                if dependency not in needed:
+                    needed.add(dependency)
+                    if dependency not in cached:
+                        stack.append(dependency)
+        return [graph for graph in self.compute_order if graph in needed]
+
+    def count_input_consumers(self, graphs=None):
+        '''
+        Подсчитывает, сколько подграфов читают каждый входной файл, и сообщает
+        это соответствующим Input (см. документацию Input).
+        :param graphs: list of ComputeGraph или None, вычисляемые графы;
+        по умолчанию все подграфы и сам граф
+        :return: None
+        '''
+        if graphs is None:
+            graphs = self.compute_order + [self]
+        counts = {}
+        for graph in graphs:
+            if isinstance(graph.source, Input) and \
+                    not isinstance(graph.source.data_from, ComputeGraph):
+                counts[graph.source] = counts.get(graph.source, 0) + 1
+        for input, count in counts.items():
+            input.set_consumers(count)
 
     def update_compute_order(self, compute_order, visited_vertices):
         '''
@@ -92,10 +513,20 @@ class ComputeGraph(object):
         compute_order.append(self)
         visited_vertices.add(self)
 
-    def set_subgraph_inputs(self, subgraph_inputs):
+    def set_subgraph_inputs(self, subgraph_inputs, streaming=False, codec=None,
+                            compression='auto', read_ahead=False, readers=4,
+                            ordered=True, processes=False):
         '''
-        Сопоставить каждому подграфу его вход.
+        Сопоставить каждому подграфу его вход. Подграфы с одинаковым входом
+        (тем же файлом, путём или списком шардов) читают один Input.
         :param subgraph_inputs: dict вида {subgraph: input}
+        :param streaming: bool, читать ли входные файлы потоково (см. Input)
+        :param codec: формат входных файлов (см. Input)
+        :param compression: сжатие входных файлов (см. Input)
+        :param read_ahead: bool, распаковывать ли их в фоновом потоке
+        :param readers: int, число потоков, читающих шарды (см. Input)
+        :param ordered: bool, сохранять ли порядок шардов (см. Input)
+        :param processes: bool, декодировать ли шарды в процессах (см. Input)
         :return: None
         '''
         # print('subgraph_inputs = {}'.format(subgraph_inputs))
@@ -116,10 +547,21 @@ class ComputeGraph(object):
                 raise AttributeError('Input for subgraph {} not specified'
                                      .format(graph))
 
-        subgraph_input_frames = {input: Input(input)
-                                 for input in set(subgraph_inputs.values())}
-        for graph in subgraph_inputs:
-            graph.source = subgraph_input_frames[subgraph_inputs[graph]]
+        subgraph_input_frames = {}
+        try:
+            for input in subgraph_inputs.values():
+                key = tuple(input) if isinstance(input, list) else input
+                if key not in subgraph_input_frames:
+                    subgraph_input_frames[key] = Input(
+                        input, streaming, codec, compression, read_ahead,
+                        readers, ordered, processes)
+        except BaseException:
+            for frame in subgraph_input_frames.values():
+                frame.close()
+            raise
+        for graph, input in subgraph_inputs.items():
+            key = tuple(input) if isinstance(input, list) else input
+            graph.source = subgraph_input_frames[key]
 
     def del_subgraph_inputs(self, subgraph_inputs):
         '''
@@ -132,17 +574,55 @@ class ComputeGraph(object):
         if subgraph_inputs is None:
             return
         for graph in subgraph_inputs:
+            if isinstance(graph.source, Input):
+                graph.source.close()
             graph.source = None
 
-    def run(self, *, input=None, output=None, subgraph_inputs=None, verbose=0):
+    def run(self, *, input=None, output=None, subgraph_inputs=None, verbose=0,
+            streaming=False, flush_size=1024, parallelism=1,
+            keep_results=False, codec=None, output_codec=None, cache=None,
+            incremental=None, profile=None, compression='auto',
+            output_compression='auto', read_ahead=False, readers=4,
+            ordered=True, processes=False):
         '''
         Выполнить вычисления, заданные в графе и сохранить результат в output.
         На этапе run можно задать входы только из файлов. Если входом является
         другой граф, то такой вход нужно задать перед compile
-        :param input: Открытый на чтение входной файл.
-        :param output: Открытый на запись выходной файл.
-        :param subgraph_inputs: Открытые на чтение входные файлы для подграфов.
+        :param input: Открытый на чтение входной файл, путь к нему, список
+        путей к шардам или шаблон glob (см. Input).
+        :param output: Открытый на запись выходной файл или путь к нему.
+        :param subgraph_inputs: Открытые на чтение входные файлы для подграфов,
+        пути к ним, списки шардов или шаблоны glob.
         :param verbose: если 1, то выводить информацию о ходе выполнения
+        :param streaming: bool, если True, то входные файлы, заданные в run,
+        читаются построчно, без загрузки всего файла в память (см. Input).
+        :param flush_size: int, число строк в одной пачке, записываемой в output.
+        :param parallelism: int, сколько независимых подграфов вычислять
+        одновременно (см. compute_dependencies).
+        :param keep_results: bool, сохранять ли результаты подграфов после того,
+        как их прочитали все зависящие от них графы.
+        :param codec: JsonCodec, PickleCodec, ColumnarCodec или None, формат
+        входных файлов, заданных в run; None -- JSON по строке на строку таблицы.
+        :param output_codec: формат output; по умолчанию совпадает с codec.
+        :param cache: ResultCache или None, кэш результатов подграфов
+        (см. compute_dependencies).
+        :param incremental: string или None, путь к файлу состояния
+        инкрементального режима (см. compute_incremental).
+        :param profile: Profile или None, куда записывать профиль вычислений
+        (см. Profile).
+        :param compression: 'auto', 'gzip', 'bz2', 'xz' или None, сжатие
+        входных файлов, заданных в run (см. Input).
+        :param output_compression: 'auto', 'gzip', 'bz2', 'xz' или None, сжатие
+        output; 'auto' -- по расширению имени файла (.gz, .bz2, .xz).
+        :param read_ahead: bool, распаковывать ли сжатые входные файлы
+        в фоновом потоке (см. ReadAhead).
+        :param readers: int, число потоков, читающих шарды входов (см. Input).
+        :param ordered: bool, выдавать ли строки шардов в порядке шардов.
+        :param processes: bool, декодировать ли шарды в процессах (см. Input).
+        Результат самого графа не сохраняется в self.result, а записывается
+        в output по мере вычисления. Входы, заданные в run, закрываются
+        и отвязываются от графов и при ошибке, так что граф можно запустить
+        ещё раз.
         Важно: чтобы один и тот же входной файл не читался несколько раз, нужно
         передать результат одного и того же open в несколько подграфов.
         :return: None
@@ -154,18 +634,187 @@ class ComputeGraph(object):
         elif isinstance(input, ComputeGraph):
             raise ValueError('If input is another graph, '
                              'it must be specified before compile')
-        elif self.source is None:
-            self.source = Input(input)
 
         if output is None:
             raise ValueError('Output not specified')
+        if output_codec is None:
+            output_codec = codec
+        if output_codec is None:
+            output_codec = JsonCodec()
+        check_compression(compression)
+
+        output, opened = open_output(output, output_codec.binary,
+                                     output_compression)
+        created = False
+        bound = False
+        try:
+            if incremental is not None and \
+                    (codec is None or isinstance(codec, JsonCodec)):
+                rows = self.compute_incremental(input, incremental, verbose)
+                if rows is not None:
+                    output_codec.write_rows(output, rows, flush_size)
+                    return
+
+            created = self.source is None
+            if created:
+                self.source = Input(input, streaming, codec, compression,
+                                    read_ahead, readers, ordered, processes)
+            self.set_subgraph_inputs(subgraph_inputs, streaming, codec,
+                                     compression, read_ahead, readers, ordered,
+                                     processes)
+            bound = True
+            self.compute_dependencies(verbose=verbose, parallelism=parallelism,
+                                      keep_results=keep_results, cache=cache,
+                                      profile=profile)
+            if verbose:
+                print('computing graph {}'.format(self))
+            self.profile = profile
+            if profile is not None:
+                profile.begin(self)
+            try:
+                self.write_result(output, flush_size, output_codec)
+            finally:
+                if profile is not None:
+                    profile.end(self)
+                    profile.finish()
+        finally:
+            if bound:
+                self.del_subgraph_inputs(subgraph_inputs)
+            if created:
+                self.source.close()
+                self.source = None
+            for f in opened:
+                f.close()
+
+    def compute_incremental(self, input, path, verbose=0):
+        '''
+        Вычисляет результат графа, обрабатывая только строки, дописанные в
+        конец входного файла с прошлого запуска. В файле path хранятся
+        позиция, до которой файл уже прочитан, и состояние первой
+        агрегирующей операции графа: Fold, Aggregate с merger или Reduce
+        с associative=True. Новые строки проходят через операции до неё
+        (допускаются только Map, MapBatches и Sort), их частичный результат
+        объединяется с сохранённым состоянием, а операции после неё
+        выполняются заново над объединённым результатом. Если агрегирующей
+        операции нет, а все операции -- Map, новые выходные строки
+        дописываются к сохранённым.
+        Инкрементальный режим возможен только для графа без подграфов,
+        читающего несжатый JSON из файла на диске. Если это не так, если граф
+        изменился или файл был не дописан, а перезаписан, возвращает None
+        или вычисляет всё заново соответственно.
+        Строка в конце файла без перевода строки читается, только если она
+        декодируется целиком.
+        :param input: открытый на чтение входной файл или путь к нему
+        :param path: string, путь к файлу состояния
+        :param verbose: если 1, то выводить информацию о ходе выполнения
+        :return: list, строки результата, или None
+        '''
+        if not self.compiled:
+            raise AttributeError('Graph should be compiled before compute')
+        name = input if isinstance(input, str) else getattr(input, 'name', None)
+        if len(self.compute_order) > 0 or self.source is not None or \
+                not isinstance(name, str) or not os.path.isfile(name):
+            return None
+        with open(name, 'rb') as f:
+            if detect_compression(f) is not None:
+                return None
+        operations = [op for op in self.operations if not isinstance(op, Input)]
+        split = incremental_split(operations)
+        if split is None:
+            return None
+        prefix, stateful, suffix = split
+        fingerprints = [op.fingerprint() for op in operations]
+        if None in fingerprints:
+            return None
+
+        saved = None
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+        with open(name, 'rb') as f:
+            if saved is not None and saved['operations'] == fingerprints and \
+                    os.fstat(f.fileno()).st_size >= saved['offset'] and \
+                    hashlib.sha256(f.read(min(saved['offset'], 4096)))\
+                    .hexdigest() == saved['head']:
+                offset, state = saved['offset'], saved['state']
+            else:
+                offset, state = 0, None
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        try:
+            JsonCodec().decode(data[end:].strip() or b'{}')
+            end = len(data)
+        except ValueError:
+            pass
+        if verbose:
+            print('graph {}: {} new bytes of {}'.format(self, end, name))
+
+        rows = chain_operations(prefix, JsonCodec().read_rows(
+            iter(data[:end].split(b'\n'))))
+        if isinstance(stateful, Fold):
+            if state is None:
+                state = copy.deepcopy(stateful.state)
+            for item in rows:
+                state = stateful.folder(state, item)
+            result = [state]
+        elif isinstance(stateful, Aggregate):
+            state = stateful.fold_states(rows, state)
+            result = [stateful.make_row(val, partial)
+                      for val, partial in state.items()]
+        elif isinstance(stateful, Reduce):
+            rows = list(stateful.reduce_groups(rows))
+            if state is not None:
+                rows = list(stateful.reduce_groups(
+                    heapq.merge(state, rows, key=stateful.get_key)))
+            state = result = rows
+        else:
+            state = result = (state or []) + list(rows)
+        result = list(chain_operations(suffix, result))
 
-        self.set_subgraph_inputs(subgraph_inputs)
-        self.compute(verbose=verbose)
-        self.del_subgraph_inputs(subgraph_inputs)
+        with open(name, 'rb') as f:
+            head = hashlib.sha256(f.read(min(offset + end, 4096))).hexdigest()
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    prefix='.mrop-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'operations': fingerprints, 'offset': offset + end,
+                             'head': head, 'state': state}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+        except BaseException:
+            discard_spill(temp)
+            raise
+        return result
 
-        buf = '\n'.join([json.dumps(line) for line in self.result])
-        output.write(buf)
+    def fingerprint(self, hash_content=False, memo=None):
+        '''
+        Возвращает отпечаток результата графа: хэш, зависящий от операций
+        графа (классы, ключи, стратегии, код функций), схемы и отпечатка
+        входа (для файла -- путь, размер и время изменения или, при
+        hash_content=True, содержимое; для графа -- его отпечаток). Если
+        какую-то часть отпечатка получить нельзя (например, вход -- io.StringIO),
+        возвращает None.
+        :param hash_content: bool, хэшировать ли содержимое входных файлов
+        :param memo: dict или None, уже посчитанные отпечатки графов
+        :return: string или None
+        '''
+        if memo is None:
+            memo = {}
+        if self in memo:
+            return memo[self]
+        memo[self] = None
+        if isinstance(self.source, Input):
+            parts = [self.source.fingerprint(hash_content, memo)]
+        else:
+            parts = [fingerprint_value(self.source, hash_content, memo)]
+        parts.append(repr(self.schema))
+        for op in self.operations:
+            if not isinstance(op, Input):
+                parts.append(op.fingerprint(hash_content, memo))
+        if None not in parts:
+            memo[self] = hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+        return memo[self]
 
     def add(self, operation):
         '''
@@ -189,31 +838,40 @@ class ComputeGraph(object):
             if isinstance(operation, Join):
                 self.dependencies.append(operation.graph)
 
-    def input(self, input):
+    def input(self, input, streaming=False, codec=None):
         '''
         Задать вход для графа.
         :param input: Input
+        :param streaming: bool, читать ли входной файл потоково (см. Input)
+        :param codec: формат входного файла (см. Input)
         :return: self
         '''
-        self.add(Input(input))
+        self.add(Input(input, streaming, codec))
         return self
 
-    def map(self, mapper):
+    def map(self, mapper, preserves_order=False, workers=None, chunk_size=1024,
+            ordered=True):
         '''
         Добавить операцию Map.
         :param mapper: generator, используемый маппер.
+        :param preserves_order: bool, сохраняет ли маппер порядок строк (см. Map)
+        :param workers: int или None, число процессов для параллельного Map
+        :param chunk_size: int, число строк в пачке, отправляемой процессу
+        :param ordered: bool, сохранять ли порядок пачек при параллельном Map
         :return: self
         '''
-        self.add(Map(mapper))
+        self.add(Map(mapper, preserves_order, workers, chunk_size, ordered))
         return self
 
-    def sort(self, key):
+    def sort(self, key, buffer_size=None, workers=None):
         '''
         Добавить операцию Sort.
         :param key: string или list of strings, набор ключей
+        :param buffer_size: int или None, сколько строк держать в памяти (см. Sort)
+        :param workers: int или None, число процессов (см. Sort)
         :return: self
         '''
-        self.add(Sort(key))
+        self.add(Sort(key, buffer_size, workers=workers))
         return self
 
     def fold(self, folder, start_state):
@@ -226,183 +884,3349 @@ class ComputeGraph(object):
         self.add(Fold(folder, start_state))
         return self
 
-    def reduce(self, reducer, key):
+    def aggregate(self, folder, key, start_state=None, merger=None,
+                  max_keys=None, partitions=16):
+        '''
+        Добавить операцию Aggregate.
+        :param folder: callable, обновляющий состояние группы строкой
+        :param key: string или list of strings, набор ключей
+        :param start_state: начальное состояние группы, функция, создающая
+        его, или None
+        :param merger: callable, объединяющий два состояния одной группы
+        :param max_keys: int или None, сколько групп держать в памяти
+        :param partitions: int, на сколько частей делить сброшенные состояния
+        :return: self
+        '''
+        self.add(Aggregate(folder, key, start_state, merger, max_keys,
+                           partitions))
+        return self
+
+    def reduce(self, reducer, key, preserves_order=False, lazy=False,
+               associative=False, workers=None):
         '''
         Добавить операцию Reduce.
         :param reducer: generator, используемый редьюсер.
         :param key: string или list of strings, набор ключей
+        :param preserves_order: bool, сохраняет ли редьюсер значения ключей (см. Reduce)
+        :param lazy: bool, передавать ли редьюсеру ленивый итератор по группе
+        :param associative: bool, можно ли повторно редуцировать выход
+        редьюсера (см. Reduce)
+        :param workers: int или None, число процессов (см. Reduce)
+        :return: self
+        '''
+        self.add(Reduce(reducer, key, preserves_order, lazy, associative,
+                        workers))
+        return self
+
+    def map_batches(self, mapper, batch_size=65536, preserves_order=False):
+        '''
+        Добавить операцию MapBatches.
+        :param mapper: callable, векторизованный маппер
+        :param batch_size: int, число строк в пачке
+        :param preserves_order: bool, сохраняет ли маппер порядок строк (см. Map)
+        :return: self
+        '''
+        self.add(MapBatches(mapper, batch_size, preserves_order))
+        return self
+
+    def reduce_batches(self, reducer, key, preserves_order=False,
+                       batch_size=65536, buffer_size=None):
+        '''
+        Добавить операцию ReduceBatches.
+        :param reducer: callable, векторизованный редьюсер
+        :param key: string или list of strings, набор ключей
+        :param preserves_order: bool, сохраняет ли редьюсер значения ключей (см. Reduce)
+        :param batch_size: int, число строк в пачке отсортированного входа
+        :param buffer_size: int или None, сколько строк держать в памяти при
+        сортировке входа (см. ReduceBatches)
+        :return: self
+        '''
+        self.add(ReduceBatches(reducer, key, preserves_order, batch_size,
+                               buffer_size))
+        return self
+
+    def top_k(self, key, k, by, largest=True):
+        '''
+        Добавить операцию TopK.
+        :param key: string, list of strings или None, ключи групп
+        :param k: int, сколько строк оставить в группе
+        :param by: string или list of strings, столбцы, по которым
+        выбираются строки
+        :param largest: bool, выбирать наибольшие или наименьшие значения
+        :return: self
+        '''
+        self.add(TopK(key, k, by, largest))
+        return self
+
+    def limit(self, n):
+        '''
+        Добавить операцию Limit.
+        :param n: int, число строк
         :return: self
         '''
-        self.add(Reduce(reducer, key))
+        self.add(Limit(n))
         return self
 
-    def join(self, graph, key=None, strategy='inner'):
+    def join(self, graph, key=None, strategy='inner', buffer_size=None,
+             algorithm='merge', workers=None, views=False, skew=False):
         '''
         Добавить операцию Join
         :param graph: ComputeGraph, граф, с которым выполняется Join
         :param key: string или list of strings, набор ключей
         :param strategy: используемая стратегия: inner, left, right, full, cross
+        :param buffer_size: int или None, сколько строк держать в памяти
+        при сортировке входов (см. Sort)
+        :param algorithm: алгоритм соединения по ключу: merge или hash
+        :param workers: int или None, число процессов (см. Join)
+        :param views: bool, выдавать ли в cross join представления пар строк
+        вместо копий (см. Join)
+        :param skew: bool, учитывать ли перекос ключей при параллельном
+        соединении (см. Join)
         :return: self
         '''
-        self.add(Join(graph, key, strategy))
+        self.add(Join(graph, key, strategy, buffer_size, algorithm, workers,
+                      views, skew))
         return self
 
 
-class Operation(object):
+def incremental_split(operations):
     '''
-    Операция, выполняемая в вычислительном графе. Может быть одной из
-    Input, Map, Reduce, Sort, Join, Fold. Каждая операция имеет входной и
-    выходной генераторы. Когда операция вызывается, она достаёт из
-    входного генератора строку или строки, выполняет некоторое действие.
-    Следующая операция может получить результат из выходного генератора
-    данной.
+    Разбивает операции графа для инкрементального режима (см.
+    ComputeGraph.compute_incremental) на операции до первой агрегирующей,
+    саму агрегирующую операцию и операции после неё.
+    :param operations: list of Operation
+    :return: tuple (list, Operation или None, list) или None, если граф
+    нельзя вычислять инкрементально
     '''
+    for i, op in enumerate(operations):
+        if isinstance(op, (Map, MapBatches, Sort)):
+            continue
+        if isinstance(op, Fold) or \
+                isinstance(op, Aggregate) and op.merger is not None or \
+                isinstance(op, Reduce) and op.associative:
+            return operations[:i], op, operations[i + 1:]
+        return None
+    if any(isinstance(op, Sort) for op in operations):
+        return None
+    return operations, None, []
 
-    def __init__(self):
+
+def chain_operations(operations, rows):
+    '''
+    Последовательно применяет к строкам копии операций, не затрагивая
+    план графа, в который входят сами операции.
+    :param operations: list of Operation
+    :param rows: iterable, строки таблицы
+    :return: iterable, выходные строки
+    '''
+    for op in operations:
+        op = copy.copy(op)
+        op.set_input_gen(rows)
+        rows = op
+    return rows
+
+
+def fingerprint_value(value, hash_content=False, memo=None):
+    '''
+    Возвращает строку, однозначно описывающую значение параметра операции
+    (см. ComputeGraph.fingerprint), или None, если значение описать нельзя.
+    Для функций учитываются имя, байт-код, значения по умолчанию
+    и замыкания, но не глобальные переменные, которые функция использует.
+    :param value: значение
+    :param hash_content: bool, см. ComputeGraph.fingerprint
+    :param memo: dict, см. ComputeGraph.fingerprint
+    :return: string или None
+    '''
+    if isinstance(value, ComputeGraph):
+        return value.fingerprint(hash_content, memo)
+    if isinstance(value, types.FunctionType):
+        parts = [value.__module__, value.__qualname__,
+                 hashlib.sha256(marshal.dumps(value.__code__)).hexdigest(),
+                 fingerprint_value(value.__defaults__, hash_content, memo)]
+        for cell in value.__closure__ or ():
+            try:
+                parts.append(fingerprint_value(cell.cell_contents,
+                                               hash_content, memo))
+            except ValueError:
+                parts.append('empty cell')
+        return None if None in parts else 'function:' + ':'.join(parts)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return repr(value)
+    if isinstance(value, (list, tuple)) and \
+            not any(callable(item) for item in value):
+        try:
+            data = pickle.dumps(value, protocol=5)
+        except Exception:
+            return None
+        return 'pickle:' + hashlib.sha256(data).hexdigest()
+    if isinstance(value, dict) and not any(callable(item)
+                                           for item in value.values()):
+        return repr(value)
+    return None
+
+
+class ResultCache(object):
+    '''
+    Кэш результатов подграфов на диске (см. ComputeGraph.compute_dependencies).
+    Результат хранится в файле формата PickleCodec, имя которого -- отпечаток
+    подграфа (см. ComputeGraph.fingerprint). Если суммарный размер файлов
+    превышает max_bytes, удаляются файлы, которые дольше всего не
+    использовались. Кэш не замечает изменений в глобальных переменных
+    и модулях, которые используют функции операций; в этом случае его нужно
+    очистить (clear).
+    '''
+
+    def __init__(self, directory, max_bytes=2 ** 30, hash_content=False):
         '''
-        Инициализирует операцию.
+        :param directory: string, каталог кэша
+        :param max_bytes: int, максимальный суммарный размер кэша
+        :param hash_content: bool, определять изменение входных файлов по
+        содержимому, а не по размеру и времени изменения
         '''
-        self.input_gen = None
+        if max_bytes < 0:
+            raise ValueError('max_bytes must be non-negative')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.lock = threading.Lock()
 
-    def set_input_gen(self, it):
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def __contains__(self, key):
+        return os.path.isfile(self.path(key))
+
+    def load(self, key):
         '''
-        Задаёт входной генератор.
-        :param it: iterable, генератор
+        Загружает сохранённый результат и отмечает его как использованный.
+        :param key: string, отпечаток подграфа
+        :return: list, строки результата
+        '''
+        path = self.path(key)
+        with open(path, 'rb') as f:
+            rows = list(PickleCodec().read_rows(f))
+        os.utime(path)
+        return rows
+
+    def store(self, key, rows):
+        '''
+        Сохраняет результат подграфа и удаляет старые результаты, если
+        размер кэша превысил max_bytes.
+        :param key: string, отпечаток подграфа
+        :param rows: list, строки результата
         :return: None
         '''
-        self.input_gen = it
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix='.mrop-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                PickleCodec().write_rows(f, rows)
+            os.replace(path, self.path(key))
+        except BaseException:
+            discard_spill(path)
+            raise
+        self.evict()
 
-    def del_input_gen(self):
+    def evict(self):
         '''
-        Удаляет входной генератор. Используется для того, чтобы граф
-        можно было запускать несколько раз.
+        Удаляет давно не использовавшиеся результаты, пока размер кэша
+        превышает max_bytes.
         :return: None
         '''
-        self.input_gen = None
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.pickle'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                discard_spill(os.path.join(self.directory, name))
+                total -= size
+
+    def clear(self):
+        '''
+        Удаляет все сохранённые результаты.
+        :return: None
+        '''
+        with self.lock:
+            for name in os.listdir(self.directory):
+                if name.endswith('.pickle'):
+                    discard_spill(os.path.join(self.directory, name))
 
 
-class Input(Operation):
+class StageProfile(object):
     '''
-    Задаёт вход вычислительного графа. Входом может быть открытый файл или
-    другой вычислительный граф.
+    Профиль одной операции графа (см. Profile). time -- время, потраченное
+    на выдачу строк операцией, без времени получения её входных строк;
+    callback_time -- часть time, проведённая в функциях пользователя
+    (мапперах, редьюсерах, фолдерах), оценённая по выборочным пачкам (см.
+    Profile); peak_memory -- при Profile(memory=True) наибольший прирост
+    памяти, выделенной за время выдачи одной пачки строк операцией, включая
+    работу предыдущих операций; shards -- для входа из шардов число строк
+    каждого прочитанного шарда.
     '''
 
-    def __init__(self, source):
+    def __init__(self, name):
+        self.name = name
+        self.shards = None
+        self.rows_in = 0
+        self.rows_out = 0
+        self.output_time = 0.0
+        self.input_time = 0.0
+        self.peak_memory = None
+        self.chunks = 0
+        self.samples = []
+        self.chunk_callback_time = 0.0
+        self.chunk_callback_calls = 0
+
+    @property
+    def time(self):
+        return max(self.output_time - self.input_time, 0.0)
+
+    def estimate(self, field):
         '''
-        Устанавливает source(ComputeGraph или открытый на чтение файл) -- источник информации.
-        :param source:
+        Оценивает полную величину по замерам выборочных пачек: замер пачки
+        представляет её саму и следующие за ней незамеренные пачки.
+        :param field: int, 1 -- время функций пользователя, 2 -- число
+        вызовов, 3 -- время операции
+        :return: float
         '''
-        super().__init__()
-        self.data_from = source
-        self.data = None
+        total = 0.0
+        for i, sample in enumerate(self.samples):
+            if i + 1 < len(self.samples):
+                weight = self.samples[i + 1][0] - sample[0]
+            else:
+                weight = max(self.chunks - sample[0], 1)
+            total += sample[field] * weight
+        return total
 
-    def __iter__(self):
+    @property
+    def callback_time(self):
         '''
-        Выходной генератор (см. документацию Operation).
-        :return: None
+        Доля функций пользователя во времени выборочных пачек, умноженная на
+        время операции: так оценка не зависит от того, что обёртки замедляют
+        замеренные пачки.
         '''
-        if not isinstance(self.data_from, ComputeGraph) and self.data is None:
-            # print('Reading from file {}'.format(self.data_from.name))
-            buf = self.data_from.read()
-            self.data = [json.loads(line)
-                         for line in buf.split('\n')
-                         if len(line) > 0]
-        elif isinstance(self.data_from, ComputeGraph):
-            self.data = self.data_from.result
+        callback_time = self.estimate(1)
+        own_time = self.estimate(3)
+        if own_time <= 0.0:
+            return min(callback_time, self.time)
+        return self.time * min(callback_time / own_time, 1.0)
 
-        for line in self.data:
-            yield line
+    @property
+    def callback_calls(self):
+        return int(round(self.estimate(2)))
 
+    @property
+    def engine_time(self):
+        return max(self.time - self.callback_time, 0.0)
 
-class Map(Operation):
-    def __init__(self, mapper):
-        super().__init__()
-        self.mapper = mapper
+    def as_dict(self):
+        return {
+            'operation': self.name,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'time': self.time,
+            'callback_time': self.callback_time,
+            'engine_time': self.engine_time,
+            'peak_memory': self.peak_memory,
+            'shards': self.shards
+        }
 
-    def __iter__(self):
-        '''
-        Выходной генератор (см. документацию Operation).
-        :return: None
-        '''
-        for item in self.input_gen:
-            yield from self.mapper(item)
 
+class GraphProfile(object):
+    '''
+    Профиль одного графа (см. Profile): время вычисления, пик памяти
+    и профили операций, начиная со входа.
+    '''
 
-class Sort(Operation):
-    def __init__(self, key):
-        super().__init__()
-        self.key = key
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = None
+        self.peak_memory = None
+        self.stages = []
+        self.started = None
+        self.memory_frame = None
 
-    def __iter__(self):
-        '''
-        Выходной генератор (см. документацию Operation).
-        :return: None
-        '''
-        if not isinstance(self.key, list):
-            self.key = [self.key]
-        comparator = lambda dct: [dct[item] for item in self.key]
-        table = sorted(self.input_gen, key=comparator)
-        for item in table:
-            yield item
-        del table
+    def as_dict(self):
+        return {
+            'graph': self.name,
+            'wall_time': self.wall_time,
+            'peak_memory': self.peak_memory,
+            'stages': [stage.as_dict() for stage in self.stages]
+        }
 
 
-class Fold(Operation):
-    def __init__(self, folder, start_state):
-        super().__init__()
-        self.folder = folder
-        self.state = start_state
+class CallbackTimer(object):
+    '''
+    Обёртка функции пользователя, замеряющая время её работы, включая
+    перебор выдаваемого ею генератора. Устанавливается только на время
+    выдачи выборочных пачек строк (см. Profile), в остальное время
+    функция вызывается напрямую.
+    '''
 
-    def __iter__(self):
-        '''
-        Выходной генератор (см. документацию Operation).
-        :return: None
-        '''
-        for item in self.input_gen:
-            self.state = self.folder(self.state, item)
-        yield self.state
+    def __init__(self, func, stage):
+        self.func = func
+        self.stage = stage
 
+    def __call__(self, *args):
+        self.stage.chunk_callback_calls += 1
+        start = time.perf_counter()
+        result = self.func(*args)
+        self.stage.chunk_callback_time += time.perf_counter() - start
+        if isinstance(result, types.GeneratorType):
+            return self.timed(result)
+        return result
 
-class Reduce(Operation):
-    def __init__(self, reducer, key):
-        super().__init__()
-        self.reducer = reducer
-        if not isinstance(key, list):
-            self.key = [key]
+    def timed(self, rows):
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            finally:
+                self.stage.chunk_callback_time += time.perf_counter() - start
+            yield row
+
+
+def set_timers(timers, timed):
+    '''
+    Устанавливает в операциях обёртки CallbackTimer или исходные функции.
+    Списки функций (FusedMap) заменяются на месте, так как операция может
+    держать ссылку на список.
+    :param timers: list of tuples (owner, field, original, timer)
+    :param timed: bool, устанавливать ли обёртки
+    :return: None
+    '''
+    for owner, field, original, timer in timers:
+        value = timer if timed else original
+        if isinstance(original, list):
+            getattr(owner, field)[:] = value
         else:
-            self.key = key
+            setattr(owner, field, value)
 
-        self.get_key = lambda dct: [dct[item] for item in self.key]
 
-    def __iter__(self):
+def profiled_rows(rows, producer, consumer, profile, timers=()):
+    '''
+    Передаёт строки от операции к следующей пачками по profile.chunk_size
+    строк, подсчитывая их и замеряя время получения каждой пачки. Строки
+    выдаются через itertools.chain, так что на каждую строку не приходится
+    кода на Python. На время получения первой пачки и далее каждой
+    profile.sample-й в операцию producer устанавливаются обёртки timers
+    (см. CallbackTimer). При profile.memory замеряется пик памяти каждой
+    пачки.
+    :param rows: iterable, выход операции producer
+    :param producer: StageProfile операции, выдающей строки
+    :param consumer: StageProfile операции, читающей строки, или None
+    :param profile: Profile
+    :param timers: list, обёртки функций пользователя producer (см.
+    set_timers)
+    :return: iterator строк
+    '''
+    rows = iter(rows)
+    chunk_size = profile.chunk_size
+    sample = profile.sample
+
+    def chunks():
+        while True:
+            index = producer.chunks
+            producer.chunks += 1
+            timed = len(timers) > 0 and (index == 0 or
+                                         (index - 1) % sample == 0)
+            if timed:
+                producer.chunk_callback_time = 0.0
+                producer.chunk_callback_calls = 0
+                set_timers(timers, True)
+            frame = profile.enter_memory()
+            input_time = producer.input_time
+            start = time.perf_counter()
+            try:
+                chunk = list(islice(rows, chunk_size))
+            finally:
+                elapsed = time.perf_counter() - start
+                peak = profile.exit_memory(frame)
+                if timed:
+                    set_timers(timers, False)
+            producer.output_time += elapsed
+            if timed:
+                own_time = elapsed - (producer.input_time - input_time)
+                producer.samples.append([index, producer.chunk_callback_time,
+                                         producer.chunk_callback_calls,
+                                         own_time])
+            if peak is not None:
+                producer.peak_memory = max(producer.peak_memory or 0, peak)
+            if consumer is not None:
+                consumer.input_time += elapsed
+                consumer.rows_in += len(chunk)
+            producer.rows_out += len(chunk)
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    return chain.from_iterable(chunks())
+
+
+class Profile(object):
+    '''
+    Профиль вычисления графа: передаётся в ComputeGraph.run или compute
+    и заполняется во время вычисления. Для каждого графа записываются время
+    вычисления, пик памяти (при memory=True, через tracemalloc) и для каждой
+    операции его плана -- число входных и выходных строк, время работы
+    операции, время, проведённое в функциях пользователя, и пик памяти.
+    Строки передаются между операциями пачками по chunk_size, и время и
+    память замеряются для каждой пачки, а не строки, поэтому число строк и
+    время операций точные, а профилирование почти не замедляет вычисления.
+    Время функций пользователя замеряется только при выдаче первой и далее
+    каждой sample-й пачки операции, остальные пачки вычисляются без обёрток,
+    и оно оценивается по этим замерам; при sample=1 оно точное. tracemalloc
+    замедляет вычисления заметно. Пик памяти операции -- наибольший прирост
+    памяти за время выдачи одной её пачки, включая работу предыдущих
+    операций, так как tracemalloc не разделяет память по операциям. При
+    параллельном вычислении подграфов пики памяти приблизительны, так как
+    tracemalloc считает пик для всего процесса. Мапперы параллельного Map
+    выполняются в других процессах, и их время не разделяется на время
+    функций и движка.
+    Результат -- graphs (list of GraphProfile), as_dict() и table().
+    '''
+
+    def __init__(self, sample=16, memory=False, chunk_size=256):
         '''
-        Выходной генератор (см. документацию Operation).
+        :param sample: int, замерять время функций пользователя в каждой
+        sample-й пачке
+        :param memory: bool, замерять ли пик памяти
+        :param chunk_size: int, число строк в пачке
+        '''
+        if sample < 1:
+            raise ValueError('sample must be positive')
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be positive')
+        self.sample = sample
+        self.memory = memory
+        self.chunk_size = chunk_size
+        self.graphs = []
+        self.records = {}
+        self.names = {}
+        self.tracing = False
+        self.lock = threading.Lock()
+        self.frames = threading.local()
+
+    def start(self, root):
+        '''
+        Начинает профилирование вычисления графа root.
+        :param root: ComputeGraph
         :return: None
         '''
-        self.buf = []
-        for item in self.input_gen:
-            if len(self.buf) == 0:
-                self.buf.append(item)
-            elif self.get_key(item) == self.get_key(self.buf[0]):
-                self.buf.append(item)
-            else:
-                yield from self.reducer(self.buf)
-                self.buf.clear()
-                self.buf.append(item)
+        self.names = root.graph_names()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
 
-        if len(self.buf) == 0:
-            raise ValueError('Reducer buf cannot be empty')
-        yield from self.reducer(self.buf)
+    def finish(self):
+        '''
+        Заканчивает профилирование.
+        :return: None
+        '''
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
 
+    def enter_memory(self):
+        '''
+        Начинает замер пика памяти вложенного участка вычислений (графа или
+        пачки строк операции). Так как пик tracemalloc при этом сбрасывается,
+        пик до сброса сначала учитывается во всех объемлющих участках потока.
+        :return: list [память в начале, пик] или None, если память
+        не замеряется
+        '''
+        if not self.memory or not tracemalloc.is_tracing():
+            return None
+        stack = getattr(self.frames, 'stack', None)
+        if stack is None:
+            stack = self.frames.stack = []
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in stack:
+            frame[1] = max(frame[1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current]
+        stack.append(frame)
+        return frame
 
-class Join(Operation):
-    def __init__(self, graph, key=None, strategy='inner'):
+    def exit_memory(self, frame):
         '''
-        Устанавливает граф, с которым производится Join, набор ключей и
-        стратегию соединения (inner, left, right, full, cross).
-        :param graph: граф, с которым производится Join
-        :param key: набор ключей
-        :param strategy: тип соединения (inner, left, right, full, cross)
+        Заканчивает замер, начатый enter_memory.
+        :param frame: результат enter_memory
+        :return: int, прирост памяти в пике, или None
+        '''
+        if frame is None:
+            return None
+        stack = self.frames.stack
+        peak = tracemalloc.get_traced_memory()[1] if \
+            tracemalloc.is_tracing() else frame[1]
+        for outer in stack:
+            outer[1] = max(outer[1], peak)
+        stack.remove(frame)
+        return frame[1] - frame[0]
+
+    def record(self, graph):
+        '''
+        Возвращает профиль графа, создавая его при первом обращении.
+        :param graph: ComputeGraph
+        :return: GraphProfile
+        '''
+        with self.lock:
+            if graph not in self.records:
+                self.records[graph] = GraphProfile(graph_name(graph,
+                                                              self.names))
+                self.graphs.append(self.records[graph])
+            return self.records[graph]
+
+    def begin(self, graph):
+        record = self.record(graph)
+        record.memory_frame = self.enter_memory()
+        record.started = time.perf_counter()
+
+    def end(self, graph):
+        record = self.record(graph)
+        elapsed = time.perf_counter() - record.started
+        record.wall_time = (record.wall_time or 0.0) + elapsed
+        frame = record.memory_frame
+        if frame is not None:
+            self.exit_memory(frame)
+            record.peak_memory = max(record.peak_memory or 0, frame[1])
+            record.memory_frame = None
+
+    def install_timers(self, plan, stages):
+        '''
+        Создаёт обёртки CallbackTimer функций пользователя операций плана.
+        Сами обёртки устанавливаются только на время выдачи выборочных пачек
+        (см. profiled_rows).
+        :return: list, для каждой операции -- список её обёрток (см.
+        set_timers)
+        '''
+        timers = []
+        for op, stage in zip(plan, stages):
+            op_timers = []
+            timers.append(op_timers)
+            if getattr(op, 'workers', None) is not None:
+                continue
+            for owner in op.callback_owners():
+                for field in owner.callback_fields:
+                    value = getattr(owner, field)
+                    if value is None:
+                        continue
+                    if isinstance(value, list):
+                        op_timers.append((owner, field, list(value),
+                                          [CallbackTimer(func, stage)
+                                           for func in value]))
+                    else:
+                        op_timers.append((owner, field, value,
+                                          CallbackTimer(value, stage)))
+        return timers
+
+    def iter_result(self, graph):
+        '''
+        Выполняет план графа, как ComputeGraph.iter_result, записывая
+        профиль его операций.
+        :param graph: ComputeGraph
+        :return: генератор строк результата
+        '''
+        record = self.record(graph)
+        plan = graph.plan
+        if len(record.stages) != len(plan) + 1:
+            if isinstance(graph.source, Operation):
+                source = graph.source.describe(self.names)
+            else:
+                source = 'source'
+            record.stages = [StageProfile(source)] + \
+                [StageProfile(op.describe(self.names)) for op in plan]
+        stages = record.stages
+
+        inputs = [op.input_gen for op in plan]
+        timers = [[]] + self.install_timers(plan, stages[1:])
+        try:
+            rows = graph.source
+            for op, producer, consumer, op_timers in zip(plan, stages,
+                                                         stages[1:], timers):
+                op.set_input_gen(profiled_rows(rows, producer, consumer, self,
+                                               op_timers))
+                rows = op
+            yield from profiled_rows(rows, stages[-1], None, self, timers[-1])
+        finally:
+            if isinstance(graph.source, Input) and \
+                    graph.source.shards is not None:
+                stages[0].shards = dict(graph.source.shard_rows)
+            for op, input_gen in zip(plan, inputs):
+                op.input_gen = input_gen
+            for op_timers in timers:
+                set_timers(op_timers, False)
+
+    def as_dict(self):
+        '''
+        :return: list of dicts, профили графов в порядке вычисления
+        '''
+        return [record.as_dict() for record in self.graphs]
+
+    def table(self):
+        '''
+        Возвращает профиль в виде текстовой таблицы.
+        :return: string
+        '''
+        header = '{:<48} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+            'operation', 'rows in', 'rows out', 'time, s', 'user, s',
+            'engine, s')
+        if self.memory:
+            header += ' {:>10}'.format('peak, MB')
+        lines = []
+        for record in self.graphs:
+            title = record.name
+            if record.wall_time is not None:
+                title += ': {:.3f} s'.format(record.wall_time)
+            else:
+                title += ': inlined'
+            if record.peak_memory is not None:
+                title += ', peak memory {:.1f} MB'.format(
+                    record.peak_memory / 2 ** 20)
+            lines.extend([title, header])
+            for stage in record.stages:
+                line = '{:<48} {:>10} {:>10} {:>10.3f} {:>10.3f} ' \
+                       '{:>10.3f}'.format(stage.name[:48], stage.rows_in,
+                                          stage.rows_out, stage.time,
+                                          stage.callback_time,
+                                          stage.engine_time)
+                if self.memory:
+                    line += ' {:>10.1f}'.format((stage.peak_memory or 0) /
+                                                2 ** 20)
+                lines.append(line)
+            lines.append('')
+        return '\n'.join(lines)
+
+
+class Record(Mapping):
+    '''
+    Базовый класс компактных записей. Запись хранит значения столбцов в
+    __slots__ с внутренними именами _0, _1, ... по порядку столбцов и ведёт
+    себя как словарь только для чтения: row['word'], 'word' in row, row.get,
+    row.keys, row.items; row.copy() возвращает обычный словарь. Так как имена
+    слотов не совпадают с именами столбцов, столбцы могут называться как
+    угодно, в том числе keys, items, get, copy или fields. Классы записей
+    создаются функцией record_type.
+    '''
+    __slots__ = ()
+    fields = ()
+    slots = {}
+
+    def __init__(self, *values):
+        for slot, value in zip(self.__slots__, values):
+            setattr(self, slot, value)
+
+    def __getitem__(self, field):
+        try:
+            slot = self.slots[field]
+        except (KeyError, TypeError):
+            raise KeyError(field)
+        return getattr(self, slot)
+
+    def __contains__(self, field):
+        try:
+            return field in self.slots
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return make_record, (self.fields, tuple(getattr(self, slot)
+                                                for slot in self.__slots__))
+
+    def copy(self):
+        return dict(self)
+
+
+class MergedRow(MutableMapping):
+    '''
+    Строка cross join с views=True (см. Join): представление пары строк left
+    и right как одной строки без копирования; значения right заменяют
+    значения left с теми же ключами. Ведёт себя как словарь: при первом
+    изменении строка копируется в собственный словарь, а исходные строки
+    не меняются. copy() возвращает обычный словарь, pickle сохраняет строку
+    как словарь.
+    '''
+    __slots__ = ('left', 'right', 'data')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.data = None
+
+    def materialize(self):
+        '''
+        Копирует строку в собственный словарь.
+        :return: dict
+        '''
+        if self.data is None:
+            self.data = dict(self.left)
+            self.data.update(self.right)
+            self.left = self.right = None
+        return self.data
+
+    def __getitem__(self, field):
+        if self.data is not None:
+            return self.data[field]
+        if field in self.right:
+            return self.right[field]
+        return self.left[field]
+
+    def __contains__(self, field):
+        if self.data is not None:
+            return field in self.data
+        return field in self.right or field in self.left
+
+    def __iter__(self):
+        if self.data is not None:
+            return iter(self.data)
+        return chain(self.left,
+                     (field for field in self.right if field not in self.left))
+
+    def __len__(self):
+        if self.data is not None:
+            return len(self.data)
+        return len(self.left) + sum(1 for field in self.right
+                                    if field not in self.left)
+
+    def __setitem__(self, field, value):
+        self.materialize()[field] = value
+
+    def __delitem__(self, field):
+        del self.materialize()[field]
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def copy(self):
+        return dict(self)
+
+
+record_types = {}
+
+
+def record_type(fields):
+    '''
+    Возвращает класс записей (см. Record) с данными столбцами. Для одного
+    и того же набора столбцов возвращается один и тот же класс.
+    :param fields: string или list of strings, столбцы
+    :return: подкласс Record
+    '''
+    if isinstance(fields, str):
+        fields = [fields]
+    fields = tuple(fields)
+    if len(fields) == 0 or len(set(fields)) != len(fields):
+        raise ValueError('Schema must be a non-empty list of distinct fields')
+    if fields not in record_types:
+        slots = tuple('_{}'.format(i) for i in range(len(fields)))
+        record_types[fields] = type('Record', (Record,), {
+            '__slots__': slots,
+            'fields': fields,
+            'slots': dict(zip(fields, slots))
+        })
+    return record_types[fields]
+
+
+def make_record(fields, values):
+    '''
+    Создаёт запись с данными столбцами и значениями.
+    :param fields: tuple of strings, столбцы
+    :param values: tuple, значения столбцов
+    :return: Record
+    '''
+    return record_type(fields)(*values)
+
+
+def record_maker(fields):
+    '''
+    Возвращает функцию, переводящую строку-словарь в запись с данными
+    столбцами. Значения извлекаются заранее построенным operator.itemgetter.
+    :param fields: tuple of strings, столбцы
+    :return: callable
+    '''
+    cls = record_type(fields)
+    getter = operator.itemgetter(*fields)
+    if len(fields) == 1:
+        def extract(row):
+            return (getter(row),)
+    else:
+        extract = getter
+
+    def make(row):
+        if type(row) is cls:
+            return row
+        if len(row) != len(fields):
+            raise ValueError('Row {!r} does not match schema {!r}'
+                             .format(row, list(fields)))
+        try:
+            return cls(*extract(row))
+        except KeyError as e:
+            raise ValueError('Row {!r} does not match schema {!r}'
+                             .format(row, list(fields))) from e
+    return make
+
+
+def key_getter(key):
+    '''
+    Строит функцию, извлекающую из строки значения ключей в виде кортежа.
+    :param key: list of strings, набор ключей
+    :return: callable
+    '''
+    if len(key) == 1:
+        name = key[0]
+        return lambda dct: (dct[name],)
+    return operator.itemgetter(*key)
+
+
+def graph_name(graph, names=None):
+    '''
+    Возвращает имя графа для описания плана (см. ComputeGraph.graph_names).
+    :param graph: ComputeGraph
+    :param names: dict или None
+    :return: string
+    '''
+    if names is not None and graph in names:
+        return names[graph]
+    return 'graph {}'.format(graph)
+
+
+def callable_name(func):
+    '''
+    Возвращает имя функции для описания плана.
+    :param func: callable
+    :return: string
+    '''
+    return getattr(func, '__qualname__', repr(func))
+
+
+def fuse_operations(operations):
+    '''
+    Сливает подряд идущие последовательные Map в FusedMap и подряд идущие Sort
+    в один Sort. Исходные операции не изменяются.
+    :param operations: list of Operation
+    :return: list of Operation
+    '''
+    fused = []
+    for op in operations:
+        prev = fused[-1] if len(fused) > 0 else None
+        if isinstance(op, Map) and op.workers is None and \
+                isinstance(prev, Map) and prev.workers is None:
+            fused[-1] = FusedMap(prev.mappers() + op.mappers(),
+                                 prev.preserves_order and op.preserves_order)
+        elif type(op) is Sort and type(prev) is Sort:
+            key = op.key + [item for item in prev.key if item not in op.key]
+            fused[-1] = Sort(key, op.buffer_size, op.merge_width, op.workers)
+        else:
+            fused.append(op)
+    return fused
+
+
+def is_sorted_by(order, key):
+    '''
+    Проверяет, что таблица, отсортированная по набору ключей order,
+    отсортирована и по набору ключей key.
+    :param order: tuple of strings или None (порядок неизвестен)
+    :param key: list of strings
+    :return: bool
+    '''
+    return order is not None and tuple(order[:len(key)]) == tuple(key)
+
+
+def spill_rows(rows, frame_size=1024):
+    '''
+    Сбрасывает строки во временный файл в формате PickleCodec кадрами по
+    frame_size строк. Файл закрывается сразу после записи, чтобы число
+    открытых файлов не росло с числом сброшенных кусков.
+    :param rows: iterable, строки таблицы
+    :param frame_size: int, число строк в одном кадре
+    :return: string, путь к временному файлу
+    '''
+    fd, path = tempfile.mkstemp(prefix='mrop-')
+    try:
+        with os.fdopen(fd, 'wb') as spill:
+            PickleCodec().write_rows(spill, rows, frame_size)
+    except BaseException:
+        discard_spill(path)
+        raise
+    return path
+
+
+def read_spilled_rows(path):
+    '''
+    Читает строки, записанные spill_rows, и удаляет файл.
+    :param path: string, путь, возвращённый spill_rows
+    :return: генератор строк
+    '''
+    try:
+        with open(path, 'rb') as spill:
+            yield from PickleCodec().read_rows(spill)
+    finally:
+        discard_spill(path)
+
+
+def discard_spill(path):
+    '''
+    Удаляет временный файл, если он ещё существует.
+    :param path: string, путь, возвращённый spill_rows
+    :return: None
+    '''
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def merge_spills(spills, key, merge_width=64):
+    '''
+    Сливает отсортированные куски в несколько проходов так, чтобы
+    одновременно было открыто не больше merge_width файлов. Соседние куски
+    сливаются по порядку, поэтому устойчивость сортировки сохраняется.
+    :param spills: list of strings, пути к отсортированным кускам
+    :param key: callable, ключ сортировки
+    :param merge_width: int, максимальное число одновременно сливаемых кусков
+    :return: list of strings, не больше merge_width - 1 кусков; куски,
+    которые ещё не прочитаны, остаются в spills
+    '''
+    if merge_width < 2:
+        raise ValueError('merge_width must be at least 2')
+    while len(spills) >= merge_width:
+        merged = []
+        try:
+            while len(spills) > 0:
+                runs = [read_spilled_rows(path)
+                        for path in spills[:merge_width]]
+                merged.append(spill_rows(heapq.merge(*runs, key=key)))
+                del spills[:merge_width]
+        except BaseException:
+            for path in merged:
+                discard_spill(path)
+            raise
+        spills.extend(merged)
+    return spills
+
+
+def check_picklable(func, kind):
+    '''
+    Проверяет, что функцию пользователя можно отправить в другой процесс.
+    :param func: callable
+    :param kind: string, название функции для сообщения об ошибке
+    :return: None
+    '''
+    try:
+        pickle.dumps(func)
+    except Exception as e:
+        raise ValueError('{} {!r} cannot be sent to worker processes ({}). '
+                         'Use a module-level function or workers=None'
+                         .format(kind, func, e)) from e
+
+
+def partition_rows(rows, partition, partitions, frame_size=1024):
+    '''
+    Раскладывает строки по partitions временным файлам в формате PickleCodec.
+    Порядок строк внутри каждой части сохраняется.
+    :param rows: iterable, строки таблицы
+    :param partition: callable, номер части для строки или список номеров,
+    если строку нужно записать в несколько частей
+    :param partitions: int, число частей
+    :param frame_size: int, число строк в одном кадре
+    :return: list of strings, пути к частям
+    '''
+    paths = []
+    files = []
+    try:
+        for _ in range(partitions):
+            fd, path = tempfile.mkstemp(prefix='mrop-')
+            paths.append(path)
+            files.append(os.fdopen(fd, 'wb'))
+        buffers = [[] for _ in range(partitions)]
+        codec = PickleCodec()
+
+        def put(index, row):
+            buffers[index].append(row)
+            if len(buffers[index]) >= frame_size:
+                codec.write_rows(files[index], buffers[index], frame_size)
+                buffers[index] = []
+
+        for row in rows:
+            index = partition(row)
+            if type(index) is int:
+                put(index, row)
+            else:
+                for item in index:
+                    put(item, row)
+        for f, buffer in zip(files, buffers):
+            codec.write_rows(f, buffer, frame_size)
+    except BaseException:
+        for path in paths:
+            discard_spill(path)
+        raise
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def hash_partitioner(get_key, partitions):
+    '''
+    Возвращает функцию, определяющую часть строки по хэшу её ключа.
+    Строки с равными ключами попадают в одну часть.
+    :param get_key: callable, ключ строки
+    :param partitions: int, число частей
+    :return: callable
+    '''
+    return lambda row: hash(get_key(row)) % partitions
+
+
+def sampled_keys(rows, get_key, size, sample, seed=0):
+    '''
+    Передаёт строки дальше, собирая в sample равномерную выборку из size
+    их ключей (reservoir sampling).
+    :param rows: iterable, строки таблицы
+    :param get_key: callable, ключ строки
+    :param size: int, размер выборки
+    :param sample: list, куда записывается выборка
+    :param seed: int, зерно генератора случайных чисел
+    :return: генератор строк
+    '''
+    rng = random.Random(seed)
+    for seen, row in enumerate(rows):
+        if len(sample) < size:
+            sample.append(get_key(row))
+        else:
+            index = rng.randrange(seen + 1)
+            if index < size:
+                sample[index] = get_key(row)
+        yield row
+
+
+def heavy_keys(keys, partitions):
+    '''
+    Находит по выборке ключей тяжёлые ключи: ключи, строк с которыми больше,
+    чем половина средней части при делении таблицы на partitions частей.
+    :param keys: list, выборка ключей
+    :param partitions: int, число частей
+    :return: set, тяжёлые ключи
+    '''
+    counts = {}
+    for key in keys:
+        counts[key] = counts.get(key, 0) + 1
+    limit = len(keys) / (2 * partitions)
+    return {key for key, count in counts.items() if count > limit}
+
+
+def split_points(keys, partitions):
+    '''
+    Выбирает по выборке ключей границы диапазонов, делящие таблицу
+    на partitions примерно равных частей.
+    :param keys: list, выборка ключей
+    :param partitions: int, число частей
+    :return: list, partitions - 1 границ по возрастанию
+    '''
+    keys = sorted(keys)
+    if len(keys) == 0:
+        return []
+    return [keys[len(keys) * i // partitions] for i in range(1, partitions)]
+
+
+def run_partitioned(function, tasks, workers, merge_key=None, spills=()):
+    '''
+    Выполняет function(*task) для каждой части в пуле из workers процессов.
+    function возвращает путь к временному файлу (см. spill_rows) с выходом
+    части. Выходы частей выдаются по порядку частей или, если задан merge_key,
+    сливаются по нему.
+    :param function: callable уровня модуля
+    :param tasks: list of tuples, аргументы function для каждой части
+    :param workers: int, число процессов
+    :param merge_key: callable или None, ключ слияния отсортированных выходов
+    :param spills: list of strings, входные временные файлы, которые нужно
+    удалить после вычисления
+    :return: генератор строк
+    '''
+    pool = concurrent.futures.ProcessPoolExecutor(workers)
+    futures = []
+    try:
+        futures = [pool.submit(function, *task) for task in tasks]
+        if merge_key is None:
+            for future in futures:
+                yield from read_spilled_rows(future.result())
+        else:
+            runs = [read_spilled_rows(future.result()) for future in futures]
+            yield from heapq.merge(*runs, key=merge_key)
+    finally:
+        pool.shutdown(cancel_futures=True)
+        for future in futures:
+            if future.done() and not future.cancelled() and \
+                    future.exception() is None:
+                discard_spill(future.result())
+        for path in spills:
+            discard_spill(path)
+
+
+def sort_partition(path, key, buffer_size, merge_width):
+    '''
+    Сортирует часть таблицы. Выполняется в процессе-исполнителе (см. Sort).
+    :return: string, путь к отсортированной части
+    '''
+    sort = Sort(key, buffer_size, merge_width)
+    sort.set_input_gen(read_spilled_rows(path))
+    return spill_rows(sort)
+
+
+def reduce_partition(path, reducer, key, lazy, sort_key=None,
+                     buffer_size=None, merge_width=64):
+    '''
+    Вызывает редьюсер от групп части таблицы, предварительно отсортировав её
+    по sort_key, если он задан. Выполняется в процессе-исполнителе (см. Reduce
+    и SortReduce).
+    :return: string, путь к выходу части
+    '''
+    rows = read_spilled_rows(path)
+    if sort_key is not None:
+        sort = Sort(sort_key, buffer_size, merge_width)
+        sort.set_input_gen(rows)
+        rows = sort
+    return spill_rows(Reduce(reducer, key, lazy=lazy).reduce_groups(rows))
+
+
+def join_partition(self_path, new_path, key, strategy, algorithm, buffer_size,
+                   presorted, empty_rows):
+    '''
+    Соединяет части двух таблиц с одними и теми же значениями ключей.
+    Выполняется в процессе-исполнителе (см. Join).
+    :return: string, путь к выходу части
+    '''
+    graph = ComputeGraph()
+    graph.result = list(read_spilled_rows(new_path))
+    join = Join(graph, key, strategy, buffer_size, algorithm)
+    join.self_sorted, join.new_sorted = presorted
+    join.empty_rows = empty_rows
+    join.set_input_gen(read_spilled_rows(self_path))
+    return spill_rows(join)
+
+
+compression_modules = {'gzip': gzip, 'bz2': bz2, 'xz': lzma}
+compression_extensions = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2',
+                          '.xz': 'xz', '.lzma': 'xz'}
+compression_magic = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'),
+                     (b'\xfd7zXZ\x00', 'xz')]
+compressed_files = (gzip.GzipFile, bz2.BZ2File, lzma.LZMAFile)
+
+
+def check_compression(compression):
+    '''
+    Проверяет значение параметра compression (см. Input).
+    :param compression: string или None
+    :return: None
+    '''
+    if compression is not None and compression != 'auto' and \
+            compression not in compression_modules:
+        raise ValueError('Unknown compression: {}.\nPlease specify one of {}'
+                         .format(compression,
+                                 ['auto', None] + list(compression_modules)))
+
+
+def compression_by_name(name):
+    '''
+    Определяет формат сжатия по расширению имени файла.
+    :param name: string или None
+    :return: 'gzip', 'bz2', 'xz' или None
+    '''
+    if not isinstance(name, str):
+        return None
+    return compression_extensions.get(os.path.splitext(name)[1].lower())
+
+
+def detect_compression(source, sniff=True):
+    '''
+    Определяет формат сжатия открытого на чтение файла по расширению его
+    имени, а если sniff=True -- и по первым байтам, если их можно прочитать,
+    не сдвигая позицию файла.
+    :param source: открытый на чтение файл
+    :param sniff: bool, проверять ли первые байты
+    :return: 'gzip', 'bz2', 'xz' или None
+    '''
+    compression = compression_by_name(getattr(source, 'name', None))
+    if compression is not None or not sniff:
+        return compression
+    raw = getattr(source, 'buffer', source)
+    head = b''
+    try:
+        if hasattr(raw, 'peek'):
+            head = raw.peek(8)
+        elif raw.seekable():
+            position = raw.tell()
+            head = raw.read(8)
+            raw.seek(position)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(head, bytes):
+        return None
+    for magic, compression in compression_magic:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+class ReadAhead(io.RawIOBase):
+    '''
+    Поток, который читает другой поток в фоновом потоке кусками по chunk_size
+    байт и держит наготове не больше depth кусков. Используется, чтобы
+    распаковка входного файла шла одновременно с обработкой его строк:
+    gzip, bz2 и lzma отпускают GIL во время распаковки.
+    '''
+
+    def __init__(self, stream, chunk_size=2 ** 20, depth=4):
+        '''
+        :param stream: открытый на чтение бинарный поток; закрывается, когда
+        чтение закончено
+        :param chunk_size: int, размер куска
+        :param depth: int, число кусков в очереди
+        '''
+        super().__init__()
+        self.chunks = queue.Queue(depth)
+        self.chunk = b''
+        self.offset = 0
+        self.eof = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.fill,
+                                       args=(stream, chunk_size), daemon=True)
+        self.thread.start()
+
+    def fill(self, stream, chunk_size):
+        try:
+            while not self.stopped.is_set():
+                chunk = stream.read(chunk_size)
+                self.put(chunk)
+                if len(chunk) == 0:
+                    return
+        except BaseException as e:
+            self.put(e)
+        finally:
+            stream.close()
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.offset >= len(self.chunk):
+            if self.eof:
+                return 0
+            item = self.chunks.get()
+            if isinstance(item, BaseException):
+                raise item
+            self.chunk = item
+            self.offset = 0
+            self.eof = len(item) == 0
+        size = min(len(buffer), len(self.chunk) - self.offset)
+        buffer[:size] = self.chunk[self.offset:self.offset + size]
+        self.offset += size
+        return size
+
+    def close(self):
+        self.stopped.set()
+        super().close()
+
+
+def decompressed(source, compression, read_ahead=False):
+    '''
+    Открывает поток распаковки файла.
+    :param source: открытый на чтение файл, текстовый или бинарный
+    :param compression: 'gzip', 'bz2' или 'xz'
+    :param read_ahead: bool, распаковывать ли в фоновом потоке (см. ReadAhead)
+    :return: бинарный поток
+    '''
+    stream = compression_modules[compression].open(
+        getattr(source, 'buffer', source), 'rb')
+    if read_ahead:
+        stream = io.BufferedReader(ReadAhead(stream))
+    return stream
+
+
+def open_output(output, binary, compression='auto'):
+    '''
+    Готовит выходной файл для записи: открывает его, если задан путь,
+    и оборачивает в поток сжатия, если задан формат сжатия или, при
+    compression='auto', его расширение -- .gz, .bz2 или .xz.
+    :param output: string (путь) или открытый на запись файл
+    :param binary: bool, пишет ли формат байты, а не текст
+    :param compression: 'auto', 'gzip', 'bz2', 'xz' или None
+    :return: tuple (файл для записи, list файлов, которые нужно закрыть
+    после записи, по порядку)
+    '''
+    check_compression(compression)
+    name = output if isinstance(output, str) else getattr(output, 'name', None)
+    if compression == 'auto':
+        compression = compression_by_name(name)
+    opened = []
+    if isinstance(output, str):
+        mode = 'wb' if binary or compression is not None else 'w'
+        output = open(output, mode)
+        opened.append(output)
+    if compression is None:
+        return output, opened
+    stream = compression_modules[compression].open(
+        getattr(output, 'buffer', output), 'wb')
+    if not binary:
+        stream = io.TextIOWrapper(stream, encoding='utf-8')
+    return stream, [stream] + opened
+
+
+def shard_paths(source):
+    '''
+    Возвращает пути к шардам входа: source -- список путей или шаблон glob
+    (строка с *, ? или [, не являющаяся путём к существующему файлу).
+    Для остальных входов возвращает None.
+    :param source: вход (см. Input)
+    :return: list of strings или None
+    '''
+    if isinstance(source, (list, tuple)):
+        paths = [os.fspath(path) for path in source]
+    elif isinstance(source, str) and not os.path.exists(source) and \
+            glob.has_magic(source):
+        paths = sorted(glob.glob(source))
+        if len(paths) == 0:
+            raise ValueError('No files match {!r}'.format(source))
+    else:
+        return None
+    if len(paths) == 0:
+        raise ValueError('Shard list is empty')
+    return paths
+
+
+def read_shard(path, codec, compression):
+    '''
+    Читает, распаковывает и декодирует один шард входа (см. Input).
+    :param path: string, путь к шарду
+    :param codec: формат шарда
+    :param compression: сжатие шарда; 'auto' -- определить (см.
+    detect_compression)
+    :return: генератор строк шарда
+    '''
+    with open(path, 'rb') as f:
+        if compression == 'auto':
+            compression = detect_compression(
+                f, sniff=not isinstance(codec, PickleCodec))
+        if compression is None:
+            yield from codec.read_rows(f)
+            return
+        stream = decompressed(f, compression)
+        try:
+            yield from codec.read_rows(stream)
+        finally:
+            stream.close()
+
+
+def decode_shard(path, codec, compression):
+    '''
+    Декодирует шард во временный файл. Выполняется в процессе-читателе
+    (см. Input.read_shards).
+    :return: string, путь к временному файлу (см. spill_rows)
+    '''
+    return spill_rows(read_shard(path, codec, compression))
+
+
+def sharded_rows(shards, read, readers=4, ordered=True, counts=None,
+                 batch_size=1024, depth=4):
+    '''
+    Читает шарды в пуле из readers потоков и выдаёт их строки одним потоком.
+    Каждый поток читает и декодирует свой шард пачками по batch_size строк;
+    для каждого шарда в очереди ждёт не больше depth пачек. При ordered=True
+    шарды выдаются по порядку, и одновременно читается не больше readers
+    шардов; иначе пачки выдаются по мере готовности.
+    :param shards: list, шарды
+    :param read: callable, генератор строк шарда
+    :param readers: int, число потоков
+    :param ordered: bool, сохранять ли порядок шардов
+    :param counts: dict или None, куда записать число строк каждого
+    прочитанного до конца шарда
+    :param batch_size: int, число строк в пачке
+    :param depth: int, число пачек в очереди на шард
+    :return: генератор строк
+    '''
+    stop = threading.Event()
+    end = object()
+
+    def put(chunks, item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fill(index, chunks):
+        try:
+            rows = read(shards[index])
+            total = 0
+            try:
+                while not stop.is_set():
+                    batch = list(islice(rows, batch_size))
+                    if len(batch) == 0:
+                        break
+                    total += len(batch)
+                    if not put(chunks, batch):
+                        return
+            finally:
+                rows.close()
+            if counts is not None and not stop.is_set():
+                counts[shards[index]] = total
+            put(chunks, end)
+        except BaseException as e:
+            put(chunks, e)
+
+    def drain(chunks):
+        item = chunks.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    pool = concurrent.futures.ThreadPoolExecutor(readers)
+    try:
+        if ordered:
+            pending = deque()
+            submitted = 0
+            while submitted < len(shards) or len(pending) > 0:
+                while submitted < len(shards) and len(pending) < readers:
+                    pending.append(queue.Queue(depth))
+                    pool.submit(fill, submitted, pending[-1])
+                    submitted += 1
+                chunks = pending.popleft()
+                while True:
+                    batch = drain(chunks)
+                    if batch is end:
+                        break
+                    yield from batch
+        else:
+            chunks = queue.Queue(depth * readers)
+            for index in range(len(shards)):
+                pool.submit(fill, index, chunks)
+            done = 0
+            while done < len(shards):
+                batch = drain(chunks)
+                if batch is end:
+                    done += 1
+                    continue
+                yield from batch
+    finally:
+        stop.set()
+        pool.shutdown(cancel_futures=True)
+
+
+def has_large_float(value):
+    '''
+    Проверяет, есть ли в декодированном значении float, по модулю не меньший
+    2 ** 63. orjson читает целые числа, не помещающиеся в 64 бита, как float,
+    поэтому такие строки перечитываются модулем json.
+    :param value: декодированное значение
+    :return: bool
+    '''
+    if type(value) is float:
+        return abs(value) >= 2.0 ** 63
+    if type(value) is dict:
+        value = value.values()
+    elif type(value) is not list:
+        return False
+    for item in value:
+        if has_large_float(item):
+            return True
+    return False
+
+
+class JsonCodec(object):
+    '''
+    Формат файлов по умолчанию: каждая строка таблицы -- JSON-объект на
+    отдельной строке файла. Если установлен orjson, строки декодируются
+    через него, иначе через модуль json. При записи строки по умолчанию
+    кодируются модулем json, как и раньше; при compact=True пишется JSON без
+    пробелов, и кодирование тоже выполняется через orjson, если он установлен.
+    '''
+    binary = False
+
+    def __init__(self, compact=False):
+        '''
+        :param compact: bool, писать ли JSON без пробелов (быстрее с orjson)
+        '''
+        self.compact = compact
+
+    def decode(self, line):
+        '''
+        Декодирует одну строку файла.
+        :param line: string или bytes
+        :return: dict
+        '''
+        if orjson is not None:
+            try:
+                row = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # например, NaN и Infinity, которые понимает json
+                row = None
+            if row is not None and not has_large_float(row):
+                return row
+        return json.loads(line)
+
+    def encode(self, row):
+        '''
+        Кодирует одну строку таблицы.
+        :param row: dict
+        :return: string
+        '''
+        if not self.compact:
+            return json.dumps(row, default=dict)
+        if orjson is not None:
+            try:
+                return orjson.dumps(row, default=dict,
+                                    option=orjson.OPT_NON_STR_KEYS).decode()
+            except TypeError:
+                pass
+        return json.dumps(row, default=dict, separators=(',', ':'))
+
+    def read_rows(self, source):
+        '''
+        Построчно читает и декодирует файл. Пустые строки пропускаются.
+        :param source: открытый на чтение файл (текстовый или бинарный)
+        :return: генератор строк таблицы
+        '''
+        for line in source:
+            line = line.strip()
+            if len(line) > 0:
+                yield self.decode(line)
+
+    def write_rows(self, output, rows, flush_size=1024):
+        '''
+        Записывает строки в текстовый файл пачками по flush_size строк.
+        После последней строки перевод строки не пишется.
+        :param output: открытый на запись текстовый файл
+        :param rows: iterable, строки таблицы
+        :param flush_size: int, число строк в пачке
+        :return: None
+        '''
+        separator = ''
+        buf = []
+        for row in rows:
+            buf.append(self.encode(row))
+            if len(buf) >= flush_size:
+                output.write(separator + '\n'.join(buf))
+                separator = '\n'
+                buf.clear()
+        if len(buf) > 0:
+            output.write(separator + '\n'.join(buf))
+
+
+class PickleCodec(object):
+    '''
+    Бинарный формат для передачи таблиц между графами и для временных
+    файлов: последовательность кадров, каждый из которых -- длина (4 байта)
+    и список строк, сериализованный pickle (протокол 5). Файлы в этом формате
+    нужно открывать в бинарном режиме ('rb', 'wb'). Как и любой pickle, его
+    можно читать только из доверенных источников.
+    '''
+    binary = True
+    header = struct.Struct('<I')
+
+    def read_rows(self, source):
+        '''
+        Читает строки, записанные write_rows.
+        :param source: открытый на чтение бинарный файл
+        :return: генератор строк таблицы
+        '''
+        while True:
+            header = source.read(self.header.size)
+            if len(header) == 0:
+                break
+            if len(header) < self.header.size:
+                raise ValueError('Truncated frame header')
+            size, = self.header.unpack(header)
+            frame = source.read(size)
+            if len(frame) < size:
+                raise ValueError('Truncated frame')
+            yield from pickle.loads(frame)
+
+    def write_rows(self, output, rows, flush_size=1024):
+        '''
+        Записывает строки кадрами по flush_size строк.
+        :param output: открытый на запись бинарный файл
+        :param rows: iterable, строки таблицы
+        :param flush_size: int, число строк в кадре
+        :return: None
+        '''
+        rows = iter(rows)
+        while True:
+            frame = list(islice(rows, flush_size))
+            if len(frame) == 0:
+                break
+            data = pickle.dumps(frame, protocol=5)
+            output.write(self.header.pack(len(data)))
+            output.write(data)
+
+
+def column_kind(values):
+    '''
+    Определяет, как хранить столбец в ColumnarCodec: 'i' -- int64, 'f' --
+    float64, 's' -- строки со словарём, 'o' -- pickle. Для 'i' и 'f'
+    значениями могут быть и списки одинаковой длины width.
+    :param values: list, значения столбца
+    :return: tuple (kind, width)
+    '''
+    first = values[0]
+    width = 0
+    if type(first) is list and len(first) > 0:
+        width = len(first)
+        if any(type(value) is not list or len(value) != width
+               for value in values):
+            return 'o', 0
+        items = [item for value in values for item in value]
+    else:
+        items = values
+    if all(type(item) is float for item in items):
+        return 'f', width
+    if all(type(item) is int and -2 ** 63 <= item < 2 ** 63 for item in items):
+        return 'i', width
+    if width == 0 and all(type(item) is str for item in items):
+        return 's', 0
+    return 'o', 0
+
+
+class ColumnarCodec(object):
+    '''
+    Колоночный бинарный формат таблиц. Строки записываются группами по
+    group_size строк; внутри группы каждый столбец хранится отдельно:
+    целые и вещественные числа (и списки чисел одинаковой длины) -- массивами
+    фиксированной ширины, строки -- кодами в словаре уникальных значений,
+    остальные значения -- через pickle. Группа, строки которой имеют разные
+    наборы столбцов, целиком хранится через pickle. В конце файла записан
+    JSON-footer с числом строк и смещениями столбцов.
+    Файл читается через mmap: числовые столбцы не копируются при чтении
+    пачками (read_batches), а строки таблицы создаются прямо из
+    отображённой памяти. Файл нужно открывать в бинарном режиме, запись --
+    в новый файл. Как и PickleCodec, читать его можно только из доверенных
+    источников.
+    '''
+    binary = True
+    magic = b'MROPCOL1'
+    footer_header = struct.Struct('<q')
+    typecodes = {'i': 'q', 'f': 'd'}
+
+    def __init__(self, group_size=65536):
+        '''
+        :param group_size: int, число строк в группе
+        '''
+        if group_size < 1:
+            raise ValueError('group_size must be positive')
+        self.group_size = group_size
+
+    def write_rows(self, output, rows, flush_size=1024):
+        '''
+        Записывает строки в файл группами по group_size строк.
+        :param output: открытый на запись новый бинарный файл
+        :param rows: iterable, строки таблицы
+        :param flush_size: не используется, группы задаются group_size
+        :return: None
+        '''
+        position = [0]
+
+        def write(data):
+            output.write(data)
+            padding = -len(data) % 8
+            output.write(b'\0' * padding)
+            start = position[0]
+            position[0] += len(data) + padding
+            return [start, len(data)]
+
+        write(self.magic)
+        groups = []
+        total = 0
+        rows = iter(rows)
+        while True:
+            group = list(islice(rows, self.group_size))
+            if len(group) == 0:
+                break
+            total += len(group)
+            groups.append(self.write_group(group, write))
+
+        footer = json.dumps({'rows': total, 'groups': groups}).encode()
+        output.write(footer)
+        output.write(self.footer_header.pack(len(footer)))
+        output.write(self.magic)
+
+    def write_group(self, group, write):
+        '''
+        Записывает одну группу строк.
+        :param group: list, строки группы
+        :param write: callable, записывающий данные и возвращающий их
+        [смещение, размер]
+        :return: dict, описание группы для footer
+        '''
+        names = list(group[0])
+        keys = group[0].keys()
+        if any(row.keys() != keys for row in group):
+            return {'rows': len(group),
+                    'pickled': write(pickle.dumps(group, protocol=5))}
+
+        columns = []
+        for name in names:
+            values = [row[name] for row in group]
+            kind, width = column_kind(values)
+            if kind in self.typecodes:
+                if width > 0:
+                    values = [item for value in values for item in value]
+                parts = [write(array.array(self.typecodes[kind],
+                                           values).tobytes())]
+            elif kind == 's':
+                dictionary = {}
+                codes = [dictionary.setdefault(value, len(dictionary))
+                         for value in values]
+                encoded = [value.encode() for value in dictionary]
+                offsets = [0]
+                for value in encoded:
+                    offsets.append(offsets[-1] + len(value))
+                parts = [write(array.array('i', codes).tobytes()),
+                         write(array.array('q', offsets).tobytes()),
+                         write(b''.join(encoded))]
+            else:
+                parts = [write(pickle.dumps(values, protocol=5))]
+            columns.append([name, kind, width, parts])
+        return {'rows': len(group), 'columns': columns}
+
+    def open_table(self, source):
+        '''
+        Отображает файл в память и читает footer.
+        :param source: открытый на чтение бинарный файл
+        :return: tuple (buffer, footer)
+        '''
+        try:
+            if isinstance(source, compressed_files):
+                # fileno сжатого файла -- дескриптор сжатых данных
+                raise ValueError('Compressed file cannot be mapped')
+            buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # io.BytesIO, сжатые и другие файлы без дескриптора
+            if source.seekable():
+                source.seek(0)
+            buffer = source.read()
+        if len(buffer) == 0:
+            return buffer, {'rows': 0, 'groups': []}
+        size = len(buffer)
+        tail = size - len(self.magic) - self.footer_header.size
+        if buffer[:len(self.magic)] != self.magic or \
+                buffer[size - len(self.magic):] != self.magic:
+            raise ValueError('Not a columnar table')
+        footer_size, = self.footer_header.unpack_from(buffer, tail)
+        footer = json.loads(bytes(buffer[tail - footer_size:tail]))
+        return buffer, footer
+
+    def read_column(self, buffer, kind, width, parts):
+        '''
+        Читает значения одного столбца группы как список объектов Python.
+        :param buffer: mmap или bytes, содержимое файла
+        :param kind: string, способ хранения столбца (см. column_kind)
+        :param width: int, длина списков для 'i' и 'f', 0 -- скаляры
+        :param parts: list, [смещение, размер] частей столбца в файле
+        :return: list
+        '''
+        view = memoryview(buffer)
+        try:
+            if kind in self.typecodes:
+                (start, size), = parts
+                with view[start:start + size].cast(self.typecodes[kind]) as data:
+                    values = data.tolist()
+                if width > 0:
+                    values = [values[i:i + width]
+                              for i in range(0, len(values), width)]
+                return values
+            if kind == 's':
+                (codes_start, codes_size), (offsets_start, offsets_size), \
+                    (blob_start, _) = parts
+                with view[offsets_start:offsets_start + offsets_size] \
+                        .cast('q') as offsets:
+                    dictionary = [
+                        str(view[blob_start + offsets[i]:
+                                 blob_start + offsets[i + 1]], 'utf-8')
+                        for i in range(len(offsets) - 1)]
+                with view[codes_start:codes_start + codes_size] \
+                        .cast('i') as codes:
+                    return [dictionary[code] for code in codes]
+            (start, size), = parts
+            return pickle.loads(view[start:start + size])
+        finally:
+            view.release()
+
+    def read_rows(self, source):
+        '''
+        Читает строки таблицы.
+        :param source: открытый на чтение бинарный файл
+        :return: генератор строк таблицы
+        '''
+        buffer, footer = self.open_table(source)
+        try:
+            for group in footer['groups']:
+                if 'pickled' in group:
+                    start, size = group['pickled']
+                    yield from pickle.loads(buffer[start:start + size])
+                    continue
+                names = [column[0] for column in group['columns']]
+                columns = [self.read_column(buffer, *column[1:])
+                           for column in group['columns']]
+                for values in zip(*columns):
+                    yield dict(zip(names, values))
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+    def read_batches(self, source):
+        '''
+        Читает таблицу пачками (см. MapBatches), по одной на группу. Числовые
+        столбцы -- numpy-массивы только для чтения, указывающие прямо
+        в отображённый файл, без копирования; файл остаётся отображённым, пока
+        на него ссылаются массивы. Требует numpy.
+        :param source: открытый на чтение бинарный файл
+        :return: генератор пачек
+        '''
+        if numpy is None:
+            raise ImportError('read_batches requires numpy')
+        buffer, footer = self.open_table(source)
+        for group in footer['groups']:
+            if 'pickled' in group:
+                start, size = group['pickled']
+                yield rows_to_batch(pickle.loads(buffer[start:start + size]))
+                continue
+            batch = {}
+            for name, kind, width, parts in group['columns']:
+                if kind in self.typecodes:
+                    (start, size), = parts
+                    values = numpy.frombuffer(
+                        buffer, dtype=self.typecodes[kind],
+                        count=size // 8, offset=start)
+                    if width > 0:
+                        values = values.reshape(-1, width)
+                else:
+                    values = column_array(self.read_column(
+                        buffer, kind, width, parts))
+                batch[name] = values
+            yield batch
+
+
+class Operation(object):
+    '''
+    Операция, выполняемая в вычислительном графе. Может быть одной из
+    Input, Map, Reduce, Sort, Join, Fold, Aggregate. Каждая операция имеет входной и
+    выходной генераторы. Когда операция вызывается, она достаёт из
+    входного генератора строку или строки, выполняет некоторое действие.
+    Следующая операция может получить результат из выходного генератора
+    данной.
+    '''
+    fingerprint_fields = ()
+    callback_fields = ()
+
+    def __init__(self):
+        '''
+        Инициализирует операцию.
+        '''
+        self.input_gen = None
+
+    def propagate_order(self, input_order):
+        '''
+        Сообщает операции порядок строк на её входе и возвращает порядок строк
+        на выходе. Вызывается при компиляции графа. Порядок задаётся кортежем
+        ключей, по которым отсортирована таблица, или None, если он неизвестен.
+        :param input_order: tuple of strings или None
+        :return: tuple of strings или None
+        '''
+        return None
+
+    def fingerprint(self, hash_content=False, memo=None):
+        '''
+        Возвращает строку, описывающую операцию и параметры, от которых
+        зависит её результат (перечислены в fingerprint_fields), или None
+        (см. ComputeGraph.fingerprint).
+        :return: string или None
+        '''
+        parts = [type(self).__name__]
+        for field in self.fingerprint_fields:
+            parts.append(fingerprint_value(getattr(self, field),
+                                           hash_content, memo))
+        return None if None in parts else ' '.join(parts)
+
+    def callback_owners(self):
+        '''
+        Возвращает операции, чьи поля callback_fields содержат функции
+        пользователя, вызываемые этой операцией (см. Profile).
+        :return: list of Operation
+        '''
+        return [self]
+
+    def describe(self, names=None):
+        '''
+        Возвращает короткое описание операции для dump_plan.
+        :param names: dict или None, имена графов (см. ComputeGraph.graph_names)
+        :return: string
+        '''
+        return '{}({})'.format(type(self).__name__, self.describe_args(names))
+
+    def describe_args(self, names=None):
+        '''
+        Возвращает описание параметров операции для describe.
+        :return: string
+        '''
+        return ''
+
+    def set_input_gen(self, it):
+        '''
+        Задаёт входной генератор.
+        :param it: iterable, генератор
+        :return: None
+        '''
+        self.input_gen = it
+
+    def del_input_gen(self):
+        '''
+        Удаляет входной генератор. Используется для того, чтобы граф
+        можно было запускать несколько раз.
+        :return: None
+        '''
+        self.input_gen = None
+
+
+class Input(Operation):
+    '''
+    Задаёт вход вычислительного графа. Входом может быть открытый файл или
+    другой вычислительный граф.
+    В обычном режиме строки файла декодируются один раз и сохраняются в
+    self.data. В потоковом режиме (streaming=True) строки декодируются по одной
+    по мере чтения. Если файл читают несколько подграфов и он поддерживает
+    seek, каждый из них перечитывает файл с начала, и память не зависит от
+    размера файла. Иначе файл читается один раз, а строки, прочитанные одним
+    подграфом, хранятся до тех пор, пока их не прочитают остальные; так как
+    подграфы вычисляются по очереди, в худшем случае это вся таблица.
+    Файл может быть сжат gzip, bz2 или xz: сжатие определяется по расширению
+    имени файла (.gz, .bz2, .xz) или по первым байтам, и файл распаковывается
+    потоково при чтении.
+    Вход может состоять из нескольких файлов-шардов: source -- список путей
+    или шаблон glob. Шарды читаются и декодируются одновременно пулом из
+    readers потоков (см. sharded_rows) или процессов (processes=True), сжатие
+    определяется для каждого шарда отдельно. Число строк каждого прочитанного
+    шарда записывается в self.shard_rows. В потоковом режиме каждый
+    подграф-читатель заново читает все шарды.
+    '''
+
+    def __init__(self, source, streaming=False, codec=None, compression='auto',
+                 read_ahead=False, readers=4, ordered=True, processes=False):
+        '''
+        Устанавливает source(ComputeGraph или открытый на чтение файл) -- источник информации.
+        :param source: ComputeGraph, открытый на чтение файл или путь к файлу
+        (такой файл открывается в бинарном режиме и закрывается методом close)
+        :param streaming: bool, читать ли файл потоково
+        :param codec: JsonCodec, PickleCodec, ColumnarCodec или None
+        (JsonCodec), формат файла
+        :param compression: 'auto', 'gzip', 'bz2', 'xz' или None, сжатие файла.
+        'auto' определяет его по расширению имени и, кроме PickleCodec (кадр
+        которого может начинаться с тех же байтов), по первым байтам файла
+        :param read_ahead: bool, распаковывать ли сжатый файл в фоновом потоке
+        одновременно с обработкой строк (см. ReadAhead)
+        :param readers: int, число потоков, читающих шарды
+        :param ordered: bool, выдавать ли строки шардов в порядке шардов; иначе
+        -- в порядке готовности
+        :param processes: bool, декодировать ли шарды в процессах, а не в
+        потоках; потоки одновременно только распаковывают и читают файлы,
+        декодирование в них последовательно из-за GIL
+        '''
+        super().__init__()
+        if codec is None:
+            codec = JsonCodec()
+        check_compression(compression)
+        if readers < 1:
+            raise ValueError('readers must be positive')
+        self.shards = shard_paths(source)
+        self.shard_rows = {}
+        self.readers = readers
+        self.ordered = ordered
+        self.processes = processes
+        self.opened = self.shards is None and isinstance(source, str)
+        if self.opened:
+            source = open(source, 'rb')
+        if self.shards is not None:
+            source = self.shards
+        elif compression == 'auto':
+            compression = None
+            if not isinstance(source, ComputeGraph):
+                compression = detect_compression(
+                    source, sniff=not isinstance(codec, PickleCodec))
+        self.data_from = source
+        self.codec = codec
+        self.compression = compression
+        self.read_ahead = read_ahead
+        self.data = None
+        self.streaming = streaming
+        self.consumers = 1
+        self.start = None
+        self.rows = None
+        self.buffers = None
+        self.free_buffers = [0]
+        self.lock = threading.Lock()
+
+    def describe_args(self, names=None):
+        if isinstance(self.data_from, ComputeGraph):
+            return graph_name(self.data_from, names)
+        if self.shards is not None:
+            return '{} shards, {}'.format(len(self.shards), self.compression)
+        args = repr(getattr(self.data_from, 'name', self.data_from))
+        if self.compression is not None:
+            args += ', {}'.format(self.compression)
+        return args
+
+    def fingerprint(self, hash_content=False, memo=None):
+        '''
+        Возвращает отпечаток входа (см. ComputeGraph.fingerprint): для графа
+        -- его отпечаток, для файла на диске -- путь, позиция, формат и размер
+        со временем изменения или хэш содержимого, для шардов -- то же для
+        каждого шарда и порядок чтения. Для остальных файлов возвращает None.
+        :return: string или None
+        '''
+        if isinstance(self.data_from, ComputeGraph):
+            return self.data_from.fingerprint(hash_content, memo)
+        if self.shards is not None:
+            names = self.shards
+        else:
+            names = [getattr(self.data_from, 'name', None)]
+        if not all(isinstance(name, str) and os.path.isfile(name)
+                   for name in names):
+            return None
+        codec = fingerprint_value(vars(self.codec))
+        if codec is None:
+            return None
+        parts = [type(self.codec).__name__, codec, str(self.compression)]
+        if self.shards is not None:
+            parts = ['shards'] + parts + [str(self.ordered)]
+        else:
+            parts = ['file', os.path.abspath(names[0])] + parts + \
+                [str(self.data_from.tell())]
+        for name in names:
+            if self.shards is not None:
+                parts.append(os.path.abspath(name))
+            if hash_content:
+                digest = hashlib.sha256()
+                with open(name, 'rb') as f:
+                    for block in iter(lambda: f.read(2 ** 20), b''):
+                        digest.update(block)
+                parts.append(digest.hexdigest())
+            else:
+                stat = os.stat(name)
+                parts.extend([str(stat.st_size), str(stat.st_mtime_ns)])
+        return ':'.join(parts)
+
+    def set_consumers(self, consumers):
+        '''
+        Задаёт число подграфов, которые прочитают этот вход в потоковом режиме
+        (см. документацию Input).
+        :param consumers: int, число подграфов
+        :return: None
+        '''
+        if self.start is None and self.shards is None and \
+                self.data_from.seekable():
+            self.start = self.data_from.tell()
+        self.consumers = consumers
+        self.rows = None
+        self.buffers = None
+        self.free_buffers = list(range(consumers))
+
+    def read_rows(self, source=None):
+        '''
+        Построчно читает, распаковывает (если файл сжат) и декодирует входной
+        файл или шарды входа.
+        :param source: открытый файл; по умолчанию self.data_from
+        :return: генератор строк таблицы
+        '''
+        if source is None and self.shards is not None:
+            return self.read_shards()
+        if source is None:
+            source = self.data_from
+        if self.compression is None:
+            return self.codec.read_rows(source)
+        return self.read_decompressed(source)
+
+    def read_decompressed(self, source):
+        '''
+        Читает сжатый файл через поток распаковки и закрывает поток, когда
+        чтение закончено или прервано.
+        :param source: открытый файл
+        :return: генератор строк таблицы
+        '''
+        stream = decompressed(source, self.compression, self.read_ahead)
+        try:
+            yield from self.codec.read_rows(stream)
+        finally:
+            stream.close()
+
+    def read_shards(self):
+        '''
+        Читает шарды входа (см. sharded_rows). При processes=True шарды
+        декодируются в пуле из readers процессов во временные файлы (см.
+        decode_shard), а потоки-читатели только читают эти файлы.
+        :return: генератор строк таблицы
+        '''
+        if not self.processes:
+            yield from sharded_rows(
+                self.shards,
+                lambda path: read_shard(path, self.codec, self.compression),
+                self.readers, self.ordered, self.shard_rows)
+            return
+
+        pool = concurrent.futures.ProcessPoolExecutor(self.readers)
+
+        def read(path):
+            future = pool.submit(decode_shard, path, self.codec,
+                                 self.compression)
+            yield from read_spilled_rows(future.result())
+
+        try:
+            yield from sharded_rows(self.shards, read, self.readers,
+                                    self.ordered, self.shard_rows)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def close(self):
+        '''
+        Закрывает входной файл, если Input открыл его сам (source -- путь).
+        :return: None
+        '''
+        if self.opened:
+            self.data_from.close()
+
+    def stream(self):
+        '''
+        Потоковый выходной генератор. Каждый вызов соответствует одному
+        подграфу-читателю.
+        :return: None
+        '''
+        if len(self.free_buffers) == 0:
+            raise ValueError('Input already read by all {} consumers'
+                             .format(self.consumers))
+        with self.lock:
+            slot = self.free_buffers.pop(0)
+            if self.start is None and self.buffers is None:
+                self.rows = self.read_rows()
+                self.buffers = [deque() for _ in range(self.consumers)]
+        if self.start is not None:
+            yield from self.reread()
+            return
+
+        own = self.buffers[slot]
+        try:
+            while True:
+                if len(own) > 0:
+                    yield own.popleft()
+                    continue
+                with self.lock:
+                    if len(own) > 0:
+                        continue
+                    try:
+                        row = next(self.rows)
+                    except StopIteration:
+                        break
+                    for buf in self.buffers:
+                        if buf is not None and buf is not own:
+                            buf.append(row)
+                yield row
+        finally:
+            self.buffers[slot] = None
+
+    def reread(self):
+        '''
+        Перечитывает файл с начальной позиции для одного подграфа. Если файл
+        можно открыть заново по имени, подграф читает его через собственный
+        дескриптор, и подграфы могут читать файл одновременно; иначе
+        подграфы читают файл по очереди.
+        :return: None
+        '''
+        name = getattr(self.data_from, 'name', None)
+        if isinstance(name, str) and os.path.isfile(name):
+            with open(name, self.data_from.mode,
+                      encoding=getattr(self.data_from, 'encoding', None)) as f:
+                f.seek(self.start)
+                yield from self.read_rows(f)
+            return
+        with self.lock:
+            self.data_from.seek(self.start)
+            yield from self.read_rows()
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        if isinstance(self.data_from, ComputeGraph) and self.data_from.streamed:
+            yield from self.data_from.iter_result()
+            return
+        if isinstance(self.data_from, ComputeGraph):
+            self.data = self.data_from.result
+            try:
+                yield from self.data
+            finally:
+                self.data = None
+                self.data_from.release_result()
+            return
+        elif self.streaming and self.shards is not None:
+            yield from self.read_rows()
+            return
+        elif self.streaming:
+            if self.start is None and self.data_from.seekable():
+                self.start = self.data_from.tell()
+            yield from self.stream()
+            return
+        elif self.data is None:
+            # print('Reading from file {}'.format(self.data_from.name))
+            with self.lock:
+                if self.data is None:
+                    self.data = list(self.read_rows())
+
+        for line in self.data:
+            yield line
+
+
+def map_chunk(mapper, rows):
+    '''
+    Применяет маппер к пачке строк. Выполняется в процессе-исполнителе
+    параллельного Map.
+    :param mapper: generator, используемый маппер
+    :param rows: list, строки таблицы
+    :return: list, выходные строки
+    '''
+    return [line for row in rows for line in mapper(row)]
+
+
+def column_array(values):
+    '''
+    Переводит значения столбца в numpy-массив. Списки одинаковой длины дают
+    двумерный массив; если значения не складываются в прямоугольный массив
+    (списки разной длины, вложенные списки разной формы), возвращается
+    одномерный массив с dtype=object, элементы которого -- сами значения.
+    :param values: list, значения столбца
+    :return: numpy.ndarray
+    '''
+    try:
+        result = numpy.array(values)
+    except ValueError:
+        result = None
+    if result is not None and result.dtype != object:
+        return result
+    result = numpy.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        result[i] = value
+    return result
+
+
+def rows_to_batch(rows):
+    '''
+    Переводит строки в пачку -- словарь, в котором каждому столбцу
+    соответствует numpy-массив его значений (см. column_array). Столбцы
+    берутся из первой строки, все строки должны их содержать.
+    :param rows: list, строки таблицы
+    :return: dict, пачка
+    '''
+    if len(rows) == 0:
+        return {}
+    return {column: column_array([row[column] for row in rows])
+            for column in rows[0]}
+
+
+def batch_length(batch):
+    '''
+    :param batch: dict, пачка
+    :return: int, число строк в пачке
+    '''
+    for values in batch.values():
+        return len(values)
+    return 0
+
+
+def input_batches(rows, batch_size):
+    '''
+    Выдаёт вход векторизованной операции пачками. Если вход -- другая
+    векторизованная операция (MapBatches, ReduceBatches), её пачки
+    передаются напрямую, без перевода в строки и обратно; иначе строки
+    собираются в пачки по batch_size.
+    :param rows: iterable, вход операции
+    :param batch_size: int, число строк в пачке
+    :return: генератор пачек
+    '''
+    if isinstance(rows, (MapBatches, ReduceBatches)):
+        for batch in rows.iter_batches():
+            if batch_length(batch) > 0:
+                yield batch
+        return
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if len(chunk) == 0:
+            break
+        yield rows_to_batch(chunk)
+
+
+def concat_batches(first, second):
+    '''
+    Склеивает две пачки с одинаковыми столбцами.
+    :return: dict, пачка
+    '''
+    return {column: numpy.concatenate([first[column], second[column]])
+            for column in first}
+
+
+def batch_to_rows(batch):
+    '''
+    Переводит пачку обратно в строки. Значения переводятся в объекты Python.
+    :param batch: dict, пачка
+    :return: генератор строк
+    '''
+    columns = list(batch)
+    values = [numpy.asarray(batch[column]).tolist() for column in columns]
+    for row in zip(*values):
+        yield dict(zip(columns, row))
+
+
+class Map(Operation):
+    '''
+    Вызывает маппер от каждой строки таблицы. Если задан workers, строки
+    отправляются пачками по chunk_size в пул из workers процессов. При
+    ordered=True выходные строки идут в порядке входных, иначе -- в порядке
+    готовности пачек. Маппер параллельного Map должен сериализоваться pickle
+    (например, быть функцией уровня модуля, а не lambda).
+    '''
+    fingerprint_fields = ('mapper', 'preserves_order', 'workers', 'ordered')
+    callback_fields = ('mapper',)
+
+    def __init__(self, mapper, preserves_order=False, workers=None,
+                 chunk_size=1024, ordered=True):
+        '''
+        :param mapper: generator, используемый маппер
+        :param preserves_order: bool, если True, то маппер не меняет значения
+        ключей, по которым отсортирован вход, и порядок строк сохраняется
+        :param workers: int или None, число процессов; None -- без параллельности
+        :param chunk_size: int, число строк в пачке, отправляемой процессу
+        :param ordered: bool, сохранять ли порядок строк при параллельном Map
+        '''
+        super().__init__()
+        if workers is not None and workers < 1:
+            raise ValueError('workers must be positive')
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be positive')
+        self.mapper = mapper
+        self.preserves_order = preserves_order
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.ordered = ordered
+
+    def propagate_order(self, input_order):
+        if not self.preserves_order:
+            return None
+        if self.workers is not None and not self.ordered:
+            return None
+        return input_order
+
+    def describe_args(self, names=None):
+        args = callable_name(self.mapper)
+        if self.workers is not None:
+            args += ', workers={}'.format(self.workers)
+        return args
+
+    def mappers(self):
+        '''
+        Возвращает список мапперов, последовательно применяемых операцией.
+        :return: list of generators
+        '''
+        return [self.mapper]
+
+    def parallel(self):
+        '''
+        Выходной генератор параллельного Map. Одновременно в обработке
+        находится не больше 2 * workers пачек.
+        :return: None
+        '''
+        check_picklable(self.mapper, 'Mapper')
+
+        rows = iter(self.input_gen)
+        pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        pending = deque() if self.ordered else set()
+        try:
+            while True:
+                while len(pending) < 2 * self.workers:
+                    chunk = list(islice(rows, self.chunk_size))
+                    if len(chunk) == 0:
+                        break
+                    future = pool.submit(map_chunk, self.mapper, chunk)
+                    if self.ordered:
+                        pending.append(future)
+                    else:
+                        pending.add(future)
+                if len(pending) == 0:
+                    break
+                if self.ordered:
+                    yield from pending.popleft().result()
+                    continue
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        if self.workers is not None:
+            yield from self.parallel()
+            return
+        for item in self.input_gen:
+            yield from self.mapper(item)
+
+
+class Sort(Operation):
+    '''
+    Сортирует таблицу по ключу или набору ключей. Если задан buffer_size, то
+    используется внешняя сортировка: таблица разбивается на отсортированные
+    куски по buffer_size строк, которые сбрасываются во временные файлы, а затем
+    сливаются с помощью кучи. Одновременно сливается не больше merge_width
+    кусков; если их больше, слияние идёт в несколько проходов.
+    Если задан workers, таблица делится на workers диапазонов ключей по
+    выборке из sample_size строк на диапазон (см. split_points), диапазоны
+    сортируются параллельно в workers процессах, а результаты выдаются друг
+    за другом. Таблица при этом один раз целиком записывается во временный
+    файл, пока делается выборка.
+    Сортировка устойчива во всех режимах.
+    '''
+    fingerprint_fields = ('key',)
+    sample_size = 256
+
+    def __init__(self, key, buffer_size=None, merge_width=64, workers=None):
+        super().__init__()
+        if not isinstance(key, list):
+            key = [key]
+        if buffer_size is not None and buffer_size < 1:
+            raise ValueError('buffer_size must be positive')
+        if workers is not None and workers < 1:
+            raise ValueError('workers must be positive')
+        self.key = key
+        self.buffer_size = buffer_size
+        self.merge_width = merge_width
+        self.workers = workers
+
+    def propagate_order(self, input_order):
+        return tuple(self.key)
+
+    def describe_args(self, names=None):
+        args = repr(self.key)
+        if self.workers is not None:
+            args += ', workers={}'.format(self.workers)
+        return args
+
+    def partitioned(self):
+        '''
+        Выходной генератор параллельной сортировки диапазонами ключей.
+        :return: None
+        '''
+        comparator = key_getter(self.key)
+        sample = []
+        spills = [spill_rows(sampled_keys(self.input_gen, comparator,
+                                          self.sample_size * self.workers,
+                                          sample))]
+        try:
+            splits = split_points(sample, self.workers)
+            spills.extend(partition_rows(
+                read_spilled_rows(spills[0]),
+                lambda row: bisect.bisect_right(splits, comparator(row)),
+                self.workers))
+        except BaseException:
+            for path in spills:
+                discard_spill(path)
+            raise
+        tasks = [(path, self.key, self.buffer_size, self.merge_width)
+                 for path in spills[1:]]
+        yield from run_partitioned(sort_partition, tasks, self.workers,
+                                   spills=spills[1:])
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        if self.workers is not None:
+            yield from self.partitioned()
+            return
+        comparator = key_getter(self.key)
+        if self.buffer_size is None:
+            yield from sorted(self.input_gen, key=comparator)
+            return
+
+        spills = []
+        table = []
+        try:
+            for item in self.input_gen:
+                table.append(item)
+                if len(table) >= self.buffer_size:
+                    table.sort(key=comparator)
+                    spills.append(spill_rows(table))
+                    table = []
+            table.sort(key=comparator)
+            merge_spills(spills, comparator, self.merge_width)
+            runs = [read_spilled_rows(spill) for spill in spills]
+            yield from heapq.merge(*runs, table, key=comparator)
+        finally:
+            for spill in spills:
+                discard_spill(spill)
+
+
+class Fold(Operation):
+    fingerprint_fields = ('folder', 'state')
+    callback_fields = ('folder',)
+
+    def __init__(self, folder, start_state):
+        super().__init__()
+        self.folder = folder
+        self.state = start_state
+
+    def describe_args(self, names=None):
+        return callable_name(self.folder)
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation). Сворачивает строки
+        в копию начального состояния, чтобы граф можно было запустить ещё раз.
+        :return: None
+        '''
+        state = copy.deepcopy(self.state)
+        for item in self.input_gen:
+            state = self.folder(state, item)
+        yield state
+
+
+class Reduce(Operation):
+    fingerprint_fields = ('reducer', 'key', 'lazy', 'workers')
+    callback_fields = ('reducer',)
+
+    def __init__(self, reducer, key, preserves_order=False, lazy=False,
+                 associative=False, workers=None):
+        '''
+        :param reducer: generator, используемый редьюсер
+        :param key: string или list of strings, набор ключей
+        :param preserves_order: bool, если True, то редьюсер выдаёт строки
+        с теми же значениями ключей, что и у группы, и выход Reduce
+        отсортирован так же, как группы на входе
+        :param lazy: bool, если True, то редьюсер получает не список строк
+        группы, а ленивый итератор по ним (как в itertools.groupby), и группа
+        не хранится в памяти целиком
+        :param associative: bool, если True, то выходные строки редьюсера
+        содержат ключи и могут снова быть поданы ему на вход вместе с новыми
+        строками той же группы (как сумма частичных сумм). Используется
+        инкрементальным режимом (см. ComputeGraph.compute_incremental)
+        :param workers: int или None, число процессов. Если задано, строки
+        делятся на workers частей по хэшу ключа, и части редуцируются
+        параллельно; редьюсер должен сериализоваться pickle. Если выход
+        отсортирован (см. preserves_order), выходы частей сливаются по ключу,
+        иначе выдаются друг за другом, и порядок групп может отличаться от
+        последовательного режима
+        '''
+        super().__init__()
+        if workers is not None and workers < 1:
+            raise ValueError('workers must be positive')
+        self.reducer = reducer
+        if not isinstance(key, list):
+            self.key = [key]
+        else:
+            self.key = key
+        self.preserves_order = preserves_order
+        self.lazy = lazy
+        self.associative = associative
+        self.workers = workers
+        self.output_order = None
+
+        self.get_key = key_getter(self.key)
+
+    def propagate_order(self, input_order):
+        self.output_order = None
+        if input_order is None:
+            return None
+        group_order = tuple(input_order[:len(self.key)])
+        if set(group_order) != set(self.key):
+            raise ValueError('Reduce by {} gets input sorted by {}'
+                             .format(self.key, list(input_order)))
+        if self.preserves_order:
+            self.output_order = group_order
+        return self.output_order
+
+    def describe_args(self, names=None):
+        args = '{}, {!r}'.format(callable_name(self.reducer), self.key)
+        if self.workers is not None:
+            args += ', workers={}'.format(self.workers)
+        return args
+
+    def reduce_groups(self, rows):
+        '''
+        Группирует подряд идущие строки с одинаковым ключом и вызывает
+        редьюсер от каждой группы.
+        :param rows: iterable, строки таблицы
+        :return: генератор выходных строк
+        '''
+        for _, group in groupby(rows, key=self.get_key):
+            if self.lazy:
+                yield from self.reducer(group)
+            else:
+                yield from self.reducer(list(group))
+
+    def partitioned(self, rows, sort=None):
+        '''
+        Делит строки на части по хэшу ключа и редуцирует части параллельно,
+        предварительно сортируя каждую, если задан sort.
+        :param rows: iterable, строки таблицы
+        :param sort: Sort или None
+        :return: генератор выходных строк
+        '''
+        check_picklable(self.reducer, 'Reducer')
+        spills = partition_rows(rows, hash_partitioner(self.get_key,
+                                                       self.workers),
+                                self.workers)
+        if sort is None:
+            tasks = [(path, self.reducer, self.key, self.lazy)
+                     for path in spills]
+        else:
+            tasks = [(path, self.reducer, self.key, self.lazy, sort.key,
+                      sort.buffer_size, sort.merge_width) for path in spills]
+        merge_key = None
+        if self.output_order is not None:
+            merge_key = key_getter(list(self.output_order))
+        yield from run_partitioned(reduce_partition, tasks, self.workers,
+                                   merge_key, spills)
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        if self.workers is not None:
+            return self.partitioned(self.input_gen)
+        return self.reduce_groups(self.input_gen)
+
+
+def mapped_rows(rows, mappers, index, pair):
+    '''
+    Применяет маппер mappers[index] к каждой строке. Если pair, к каждой
+    выходной строке сразу применяется mappers[index + 1] внутри того же
+    генератора. Мапперы берутся из списка при каждом вызове, так что их
+    можно заменить на месте во время вычисления (см. Profile).
+    :param rows: iterable, строки таблицы
+    :param mappers: list of generators, мапперы
+    :param index: int, номер первого маппера
+    :param pair: bool, применять ли и следующий маппер
+    :return: генератор строк
+    '''
+    if not pair:
+        for row in rows:
+            yield from mappers[index](row)
+        return
+    inner = index + 1
+    for row in rows:
+        for line in mappers[index](row):
+            yield from mappers[inner](line)
+
+
+class FusedMap(Map):
+    '''
+    Несколько подряд идущих Map, слитых при оптимизации плана в одну
+    операцию. Строки проходят через цепочку генераторов, в каждом из которых
+    применяются два соседних маппера (см. mapped_rows), без промежуточных
+    списков, поэтому слияние не медленнее цепочки Map.
+    '''
+    callback_fields = ('fused_mappers',)
+
+    def __init__(self, mappers, preserves_order=False):
+        '''
+        :param mappers: list of generators, мапперы в порядке применения
+        :param preserves_order: bool, сохраняют ли все мапперы порядок строк
+        '''
+        super().__init__(mappers[0], preserves_order)
+        self.fused_mappers = mappers
+
+    def describe_args(self, names=None):
+        return ', '.join(callable_name(mapper) for mapper in self.fused_mappers)
+
+    def mappers(self):
+        return list(self.fused_mappers)
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        mappers = self.fused_mappers
+        rows = self.input_gen
+        for i in range(0, len(mappers), 2):
+            rows = mapped_rows(rows, mappers, i, i + 1 < len(mappers))
+        yield from rows
+
+
+class SortReduce(Operation):
+    '''
+    Sort и следующий за ним Reduce, слитые при оптимизации плана в один
+    проход: строки сортируются и сразу группируются для редьюсера.
+    '''
+
+    def __init__(self, sort, reduce):
+        '''
+        :param sort: Sort
+        :param reduce: Reduce
+        '''
+        super().__init__()
+        self.sort = sort
+        self.reduce = reduce
+
+    @property
+    def workers(self):
+        if self.reduce.workers is not None:
+            return self.reduce.workers
+        return self.sort.workers
+
+    def propagate_order(self, input_order):
+        return self.reduce.propagate_order(self.sort.propagate_order(input_order))
+
+    def callback_owners(self):
+        return [self.reduce]
+
+    def describe_args(self, names=None):
+        return '{}, {}'.format(self.sort.describe(names),
+                               self.reduce.describe(names))
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation). Если у Sort или
+        Reduce задан workers, строки делятся на части по хэшу ключа Reduce,
+        и каждая часть сортируется и редуцируется в своём процессе.
+        :return: None
+        '''
+        if self.workers is not None:
+            reduce = self.reduce
+            if reduce.workers is None:
+                reduce = copy.copy(reduce)
+                reduce.workers = self.workers
+            yield from reduce.partitioned(self.input_gen, self.sort)
+            return
+        if self.sort.buffer_size is None:
+            table = sorted(self.input_gen, key=key_getter(self.sort.key))
+        else:
+            self.sort.set_input_gen(self.input_gen)
+            table = self.sort
+        try:
+            yield from self.reduce.reduce_groups(table)
+        finally:
+            self.sort.del_input_gen()
+
+
+class MapBatches(Operation):
+    '''
+    Векторизованный Map: строки собираются в пачки по batch_size (см.
+    rows_to_batch), и маппер вызывается от каждой пачки. Маппер принимает
+    словарь столбец -> numpy-массив и возвращает пачку в том же формате,
+    число строк в ней может отличаться от входного. Следующей векторизованной
+    операции (MapBatches, ReduceBatches) пачки передаются напрямую (см.
+    input_batches), остальным -- переводятся в строки.
+    Требует numpy.
+    '''
+    fingerprint_fields = ('mapper', 'batch_size')
+    callback_fields = ('mapper',)
+
+    def __init__(self, mapper, batch_size=65536, preserves_order=False):
+        '''
+        :param mapper: callable, векторизованный маппер
+        :param batch_size: int, число строк в пачке
+        :param preserves_order: bool, сохраняет ли маппер порядок строк (см. Map)
+        '''
+        super().__init__()
+        if numpy is None:
+            raise ImportError('MapBatches requires numpy')
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        self.mapper = mapper
+        self.batch_size = batch_size
+        self.preserves_order = preserves_order
+
+    def propagate_order(self, input_order):
+        return input_order if self.preserves_order else None
+
+    def describe_args(self, names=None):
+        return callable_name(self.mapper)
+
+    def iter_batches(self):
+        '''
+        Выходной генератор пачек.
+        :return: None
+        '''
+        for batch in input_batches(self.input_gen, self.batch_size):
+            yield self.mapper(batch)
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        for batch in self.iter_batches():
+            yield from batch_to_rows(batch)
+
+
+class ReduceBatches(Operation):
+    '''
+    Векторизованный Reduce. Редьюсер вызывается от пачки, отсортированной по
+    ключу, и массива starts -- индексов начала групп в ней -- и возвращает
+    пачку с результатами (например, numpy.add.reduceat(column, starts)).
+    Если вход уже отсортирован по ключу (например, после Sort), он читается
+    пачками по batch_size строк, и редьюсер вызывается от каждой пачки,
+    содержащей только целые группы: последняя группа пачки откладывается до
+    следующей, поэтому в памяти находится не больше пачки и одной группы.
+    Иначе, если задан buffer_size, вход сначала сортируется внешней
+    сортировкой (см. Sort), а если не задан -- собирается в одну пачку и
+    сортируется через numpy.lexsort, и редьюсер вызывается один раз.
+    Столбцы ключа должны быть одномерными. Требует numpy.
+    '''
+    fingerprint_fields = ('reducer', 'key')
+    callback_fields = ('reducer',)
+
+    def __init__(self, reducer, key, preserves_order=False, batch_size=65536,
+                 buffer_size=None):
+        '''
+        :param reducer: callable, векторизованный редьюсер
+        :param key: string или list of strings, набор ключей
+        :param preserves_order: bool, если True, то редьюсер выдаёт группы
+        в порядке ключей, и выход считается отсортированным по key
+        :param batch_size: int, число строк в пачке отсортированного входа
+        :param buffer_size: int или None, сколько строк держать в памяти при
+        сортировке неотсортированного входа (см. Sort)
+        '''
+        super().__init__()
+        if numpy is None:
+            raise ImportError('ReduceBatches requires numpy')
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        if isinstance(key, str):
+            key = [key]
+        self.reducer = reducer
+        self.key = key
+        self.preserves_order = preserves_order
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.presorted = False
+
+    def propagate_order(self, input_order):
+        self.presorted = is_sorted_by(input_order, self.key)
+        return tuple(self.key) if self.preserves_order else None
+
+    def describe_args(self, names=None):
+        return '{}, {!r}'.format(callable_name(self.reducer), self.key)
+
+    def group_starts(self, batch):
+        '''
+        :param batch: dict, пачка, отсортированная по ключу
+        :return: numpy.ndarray, индексы начала групп
+        '''
+        boundary = numpy.zeros(batch_length(batch), dtype=bool)
+        boundary[0] = True
+        for item in self.key:
+            values = batch[item]
+            boundary[1:] |= values[1:] != values[:-1]
+        return numpy.flatnonzero(boundary)
+
+    def iter_batches(self):
+        '''
+        Выходной генератор пачек.
+        :return: None
+        '''
+        if not self.presorted and self.buffer_size is None:
+            batches = list(input_batches(self.input_gen, self.batch_size))
+            if len(batches) == 0:
+                return
+            batch = {column: numpy.concatenate([part[column]
+                                                for part in batches])
+                     for column in batches[0]}
+            del batches
+            order = numpy.lexsort([batch[item] for item in reversed(self.key)])
+            batch = {column: values[order] for column, values in batch.items()}
+            yield self.reducer(batch, self.group_starts(batch))
+            return
+
+        rows = self.input_gen
+        if not self.presorted:
+            rows = Sort(self.key, self.buffer_size)
+            rows.set_input_gen(self.input_gen)
+        carry = None
+        for batch in input_batches(rows, self.batch_size):
+            if carry is not None:
+                batch = concat_batches(carry, batch)
+            starts = self.group_starts(batch)
+            last = starts[-1]
+            carry = {column: values[last:] for column, values in batch.items()}
+            if last > 0:
+                yield self.reducer(
+                    {column: values[:last] for column, values in batch.items()},
+                    starts[:-1])
+        if carry is not None:
+            yield self.reducer(carry, numpy.zeros(1, dtype=numpy.intp))
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        for batch in self.iter_batches():
+            yield from batch_to_rows(batch)
+
+
+class Aggregate(Operation):
+    '''
+    Агрегирует строки по ключу в хеш-таблице, не требуя сортировки входа.
+    Для каждого значения ключа хранится состояние, которое обновляется
+    вызовом folder(state, row), как в Fold. Начальное состояние группы --
+    результат вызова start_state(), если это функция, или копия start_state.
+    Если start_state не задано, то состоянием группы становится копия её
+    первой строки, а folder должен объединять две строки (ассоциативная
+    функция свёртки).
+    Если задан max_keys и число групп в памяти его превышает, частичные
+    состояния раскладываются по хешу ключа в partitions временных файлов,
+    а в конце состояния каждой части объединяются с помощью merger. Значения
+    ключей при этом не обязаны быть сравнимыми между собой.
+    Для каждой группы выдаётся строка из значений ключей и полей состояния.
+    '''
+    fingerprint_fields = ('folder', 'key', 'start_state', 'merger')
+    callback_fields = ('folder', 'merger')
+
+    def __init__(self, folder, key, start_state=None, merger=None,
+                 max_keys=None, partitions=16):
+        '''
+        :param folder: callable, обновляющий состояние группы строкой
+        :param key: string или list of strings, набор ключей
+        :param start_state: начальное состояние группы, функция без аргументов,
+        создающая его, или None
+        :param merger: callable, объединяющий два состояния одной группы;
+        если не задан и не задано start_state, то используется folder
+        :param max_keys: int или None, сколько групп держать в памяти
+        :param partitions: int, на сколько частей делить сброшенные состояния
+        '''
+        super().__init__()
+        if not isinstance(key, list):
+            key = [key]
+        if merger is None and start_state is None:
+            merger = folder
+        if max_keys is not None and merger is None:
+            raise ValueError('merger must be specified to flush partial states')
+        if max_keys is not None and max_keys < 1:
+            raise ValueError('max_keys must be positive')
+        if partitions < 1:
+            raise ValueError('partitions must be positive')
+        self.folder = folder
+        self.key = key
+        self.start_state = start_state
+        self.merger = merger
+        self.max_keys = max_keys
+        self.partitions = partitions
+        self.get_key = key_getter(key)
+
+    def describe_args(self, names=None):
+        return '{}, {!r}'.format(callable_name(self.folder), self.key)
+
+    def new_state(self, item):
+        '''
+        Создаёт состояние новой группы по её первой строке.
+        :param item: первая строка группы
+        :return: состояние группы
+        '''
+        if self.start_state is None:
+            return item.copy()
+        if callable(self.start_state):
+            state = self.start_state()
+        else:
+            state = copy.deepcopy(self.start_state)
+        return self.folder(state, item)
+
+    def make_row(self, val, state):
+        '''
+        Строит выходную строку группы.
+        :param val: tuple, значения ключей
+        :param state: состояние группы
+        :return: dict
+        '''
+        line = dict(zip(self.key, val))
+        line.update(state)
+        return line
+
+    def fold_states(self, rows, states=None):
+        '''
+        Агрегирует строки в памяти, без сброса на диск, и объединяет
+        результат с уже имеющимися состояниями с помощью merger.
+        :param rows: iterable, строки таблицы
+        :param states: dict вида {val: state} или None
+        :return: dict вида {val: state}
+        '''
+        new_states = {}
+        for item in rows:
+            val = self.get_key(item)
+            if val in new_states:
+                new_states[val] = self.folder(new_states[val], item)
+            else:
+                new_states[val] = self.new_state(item)
+        if states is None:
+            return new_states
+        for val, state in new_states.items():
+            if val in states:
+                states[val] = self.merger(states[val], state)
+            else:
+                states[val] = state
+        return states
+
+    def flush(self, states, spills):
+        '''
+        Сбрасывает частичные состояния на диск, раскладывая их по хешу ключа.
+        :param states: dict вида {val: state}
+        :param spills: list of lists, пути к сброшенным кускам каждой части
+        :return: None
+        '''
+        parts = [[] for _ in range(self.partitions)]
+        for val, state in states.items():
+            parts[hash(val) % self.partitions].append((val, state))
+        for part, part_spills in zip(parts, spills):
+            if len(part) > 0:
+                part_spills.append(spill_rows(part))
+
+    def merged_part(self, part_spills):
+        '''
+        Объединяет частичные состояния одной части.
+        :param part_spills: list of strings, пути к сброшенным кускам части
+        :return: dict вида {val: state}
+        '''
+        states = {}
+        while len(part_spills) > 0:
+            for val, partial in read_spilled_rows(part_spills.pop(0)):
+                if val in states:
+                    states[val] = self.merger(states[val], partial)
+                else:
+                    states[val] = partial
+        return states
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        states = {}
+        spills = [[] for _ in range(self.partitions)]
+        flushed = False
+        try:
+            for item in self.input_gen:
+                val = self.get_key(item)
+                if val in states:
+                    states[val] = self.folder(states[val], item)
+                else:
+                    states[val] = self.new_state(item)
+                if self.max_keys is not None and len(states) > self.max_keys:
+                    self.flush(states, spills)
+                    flushed = True
+                    states = {}
+
+            if not flushed:
+                for val, state in states.items():
+                    yield self.make_row(val, state)
+                return
+            self.flush(states, spills)
+            states = None
+            for part_spills in spills:
+                for val, state in self.merged_part(part_spills).items():
+                    yield self.make_row(val, state)
+        finally:
+            for part_spills in spills:
+                for spill in part_spills:
+                    discard_spill(spill)
+
+
+class TopK(Operation):
+    '''
+    Оставляет в каждой группе строк с одинаковыми значениями key k строк
+    с наибольшими (при largest=False -- наименьшими) значениями by, в порядке
+    убывания (возрастания) by; строки с равными by идут в порядке входа,
+    как при устойчивой сортировке. Если key не задан, k строк выбираются из
+    всей таблицы. Для каждой группы хранится не больше 2 * k строк, поэтому
+    полная сортировка не нужна. Если вход отсортирован по key, группы
+    обрабатываются по одной и выдаются в порядке входа; иначе -- в порядке
+    первого появления, после чтения всего входа.
+    '''
+    fingerprint_fields = ('key', 'k', 'by', 'largest')
+
+    def __init__(self, key, k, by, largest=True):
+        '''
+        :param key: string, list of strings или None, ключи групп
+        :param k: int, сколько строк оставить в группе
+        :param by: string или list of strings, столбцы, по которым
+        выбираются строки
+        :param largest: bool, выбирать наибольшие или наименьшие значения
+        '''
+        super().__init__()
+        if key is not None and not isinstance(key, list):
+            key = [key]
+        if not isinstance(by, list):
+            by = [by]
+        if k < 0:
+            raise ValueError('k must be non-negative')
+        self.key = key
+        self.k = k
+        self.by = by
+        self.largest = largest
+        self.grouped = False
+
+    def propagate_order(self, input_order):
+        order = () if self.largest else tuple(self.by)
+        if self.key is None:
+            return order or None
+        self.grouped = input_order is not None and \
+            set(input_order[:len(self.key)]) == set(self.key)
+        if not self.grouped:
+            return None
+        return tuple(input_order[:len(self.key)]) + order
+
+    def describe_args(self, names=None):
+        return '{!r}, {}, by={!r}{}'.format(
+            self.key, self.k, self.by, '' if self.largest else ', smallest')
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        get_by = key_getter(self.by)
+        select = heapq.nlargest if self.largest else heapq.nsmallest
+        if self.key is None:
+            yield from select(self.k, self.input_gen, key=get_by)
+            return
+
+        get_key = key_getter(self.key)
+        if self.grouped:
+            for _, group in groupby(self.input_gen, key=get_key):
+                yield from select(self.k, group, key=get_by)
+            return
+
+        groups = {}
+        for row in self.input_gen:
+            val = get_key(row)
+            rows = groups.get(val)
+            if rows is None:
+                rows = groups[val] = []
+            rows.append(row)
+            if len(rows) >= 2 * self.k:
+                rows[:] = select(self.k, rows, key=get_by)
+        for rows in groups.values():
+            yield from select(self.k, rows, key=get_by)
+
+
+class Limit(Operation):
+    '''
+    Выдаёт первые n строк таблицы. Строк сверх n из входного генератора
+    не запрашивается, и предыдущие операции не доходят до конца входа;
+    после n-й строки входной генератор закрывается. Sort, за которым
+    следует Limit, при оптимизации плана заменяется на TopK.
+    '''
+    fingerprint_fields = ('n',)
+
+    def __init__(self, n):
+        '''
+        :param n: int, число строк
+        '''
+        super().__init__()
+        if n < 0:
+            raise ValueError('n must be non-negative')
+        self.n = n
+
+    def propagate_order(self, input_order):
+        return input_order
+
+    def describe_args(self, names=None):
+        return str(self.n)
+
+    def __iter__(self):
+        '''
+        Выходной генератор (см. документацию Operation).
+        :return: None
+        '''
+        rows = iter(self.input_gen)
+        try:
+            yield from islice(rows, self.n)
+        finally:
+            close = getattr(rows, 'close', None)
+            if close is not None:
+                close()
+
+
+class Join(Operation):
+    fingerprint_fields = ('graph', 'key', 'strategy', 'workers')
+    sample_size = 256
+
+    def __init__(self, graph, key=None, strategy='inner', buffer_size=None,
+                 algorithm='merge', workers=None, views=False, skew=False):
+        '''
+        Устанавливает граф, с которым производится Join, набор ключей и
+        стратегию соединения (inner, left, right, full, cross).
+        :param graph: граф, с которым производится Join
+        :param key: набор ключей
+        :param strategy: тип соединения (inner, left, right, full, cross)
+        :param buffer_size: int или None, сколько строк держать в памяти
+        при сортировке входов (см. Sort); для cross -- сколько строк правой
+        таблицы держать в памяти: если их больше, правая таблица сбрасывается
+        во временный файл, её результат освобождается, и для каждой строки
+        левой таблицы файл перечитывается кадрами. Так же при слиянии
+        обрабатывается группа правой таблицы с одним значением ключа, если
+        она длиннее buffer_size (см. group_product)
+        :param algorithm: алгоритм соединения по ключу: merge (сортировка обеих
+        таблиц и слияние) или hash (хеш-таблица по меньшей из таблиц)
+        :param workers: int или None, число процессов. Если задано (и стратегия
+        не cross), обе таблицы делятся на workers частей по хэшу ключа, и части
+        соединяются параллельно. Выходы частей при algorithm='merge' сливаются
+        по ключу, так что результат совпадает с последовательным, а при
+        algorithm='hash' выдаются друг за другом
+        :param views: bool, выдавать ли в cross join вместо копий пар строк
+        их представления MergedRow, которые копируются только при изменении.
+        Экономит память, но чтение полей представления медленнее, чем
+        словаря
+        :param skew: bool, учитывать ли перекос ключей при параллельном
+        соединении (workers): по выборке из sample_size строк левой таблицы
+        на процесс находятся тяжёлые ключи (см. heavy_keys), строки левой
+        таблицы с такими ключами раздаются процессам по кругу, а строки
+        правой таблицы с ними копируются в каждый процесс, получивший хотя
+        бы одну такую строку. Левая таблица при этом один раз целиком
+        записывается во временный файл. Порядок строк с тяжёлым ключом
+        может отличаться от последовательного режима
         '''
         self.strategies = {
             'inner': self.join,
@@ -414,38 +4238,55 @@ class Join(Operation):
         if strategy not in self.strategies.keys():
             raise ValueError('Unknown strategy: {}.\nPlease specify one of {}'
                              .format(strategy, self.strategies))
+        self.algorithms = {
+            'merge': self.join,
+            'hash': self.hash_join
+        }
+        if algorithm not in self.algorithms.keys():
+            raise ValueError('Unknown algorithm: {}.\nPlease specify one of {}'
+                             .format(algorithm, self.algorithms))
+        if strategy != 'cross':
+            self.strategies[strategy] = self.algorithms[algorithm]
+        if workers is not None and workers < 1:
+            raise ValueError('workers must be positive')
         super().__init__()
         self.graph = graph
         self.key = key
         self.strategy = strategy
+        self.buffer_size = buffer_size
+        self.algorithm = algorithm
+        self.workers = workers
+        self.views = views
+        self.skew = skew
+        self.released = False
+        self.self_sorted = False
+        self.new_sorted = False
+        self.empty_rows = (None, None)
 
-    def dict_slice(self, dct, keys):
-        '''
-        Выбирает ключи и соответствующие им значения из словаря.
-        :param dct: словарь
-        :param keys: ключи
-        :return: dict
-        '''
-        # print('dict_slice, keys = {}'.format(keys))
-        return {key: dct[key] for key in keys}
+    def describe_args(self, names=None):
+        args = '{}, {}'.format(graph_name(self.graph, names), self.strategy)
+        if self.strategy == 'cross' and self.views:
+            args += ', views'
+        if self.strategy != 'cross':
+            args += ', {!r}, {}'.format(self.key, self.algorithm)
+            if self.self_sorted or self.new_sorted:
+                args += ', presorted={}/{}'.format(self.self_sorted,
+                                                   self.new_sorted)
+            if self.workers is not None:
+                args += ', workers={}'.format(self.workers)
+                if self.skew:
+                    args += ', skew'
+        return args
 
-    def get_monokey_piece(self, table, key, start):
-        '''
-        Выбирает из таблицы кусок максимальной длины, начинающийся со start
-        и состоящий из строк с одинаковым значением ключа key.
-        :param table: таблица
-        :param key: string или list of strings
-        :param start: индекс начала
-        :return: stop -- конец куска
-        val -- значение ключа, одинаковое для всего куска
-        '''
-        if start >= len(table):
-            raise IndexError('Start index out of table range')
-        val = self.dict_slice(table[start], key)
-        stop = start
-        while stop < len(table) and self.dict_slice(table[stop], key) == val:
-            stop += 1
-        return stop, val
+    def propagate_order(self, input_order):
+        if self.strategy == 'cross':
+            return input_order
+        key = self.key if isinstance(self.key, list) else [self.key]
+        self.self_sorted = is_sorted_by(input_order, key)
+        self.new_sorted = is_sorted_by(self.graph.output_order, key)
+        if self.algorithm == 'merge':
+            return tuple(key)
+        return None
 
     def cross(self):
         '''
@@ -454,16 +4295,90 @@ class Join(Operation):
         '''
         if self.key is not None:
             raise ValueError('Cross join does not require a key')
-        for self_item in self.input_gen:
-            for new_item in self.graph.result:
-                line = self_item.copy()
-                line.update(new_item)
-                yield line
+        new_table = self.graph.result
+        if self.buffer_size is None or len(new_table) <= self.buffer_size:
+            for self_item in self.input_gen:
+                yield from self.cross_rows(self_item, new_table)
+            return
+
+        path = spill_rows(new_table)
+        try:
+            new_table = None
+            self.release_graph()
+            codec = PickleCodec()
+            for self_item in self.input_gen:
+                with open(path, 'rb') as spill:
+                    yield from self.cross_rows(self_item,
+                                               codec.read_rows(spill))
+        finally:
+            discard_spill(path)
+
+    def cross_rows(self, self_item, new_rows):
+        '''
+        Соединяет строку левой таблицы со всеми строками правой.
+        :param self_item: dict, строка левой таблицы
+        :param new_rows: iterable, строки правой таблицы
+        :return: генератор строк
+        '''
+        if self.views:
+            for new_item in new_rows:
+                yield MergedRow(self_item, new_item)
+            return
+        for new_item in new_rows:
+            line = self_item.copy()
+            line.update(new_item)
+            yield line
+
+    def release_graph(self):
+        '''
+        Сообщает графу, с которым производится Join, что его результат
+        прочитан (см. ComputeGraph.release_result), если это ещё не сделано.
+        :return: None
+        '''
+        if not self.released:
+            self.released = True
+            self.graph.release_result()
+
+    def empty_columns(self, first, is_self):
+        '''
+        Возвращает строку, столбцы которой заполняются None в строках внешнего
+        соединения без пары: первую строку другой таблицы, а если та пуста --
+        строку из empty_rows (при параллельном соединении -- первую строку
+        всей таблицы, а не её части).
+        :param first: dict или None, первая строка таблицы
+        :param is_self: bool, является ли таблица левой
+        :return: dict или tuple
+        '''
+        if first is not None:
+            return first
+        return self.empty_rows[0 if is_self else 1] or ()
+
+    def sorted_rows(self, rows, presorted=False):
+        '''
+        Сортирует строки по ключу соединения и возвращает их вместе с первой
+        строкой (или None, если строк нет).
+        :param rows: iterable, строки таблицы
+        :param presorted: bool, отсортированы ли строки заранее
+        :return: (first, rows)
+        '''
+        if presorted:
+            rows = iter(rows)
+        else:
+            sorter = Sort(self.key, self.buffer_size)
+            sorter.set_input_gen(rows)
+            rows = iter(sorter)
+        first = next(rows, None)
+        if first is None:
+            return None, iter(())
+        return first, chain([first], rows)
 
     def join(self):
         '''
         Производит inner, left outer, right outer или full outer join в
-        зависимости от выбранной стратегии.
+        зависимости от выбранной стратегии. Обе таблицы сортируются по ключу
+        (если при компиляции не выяснилось, что они уже отсортированы)
+        и сливаются; в памяти одновременно держится только группа строк
+        правой таблицы с одним значением ключа.
         :return: None
         '''
         if self.key is None:
@@ -471,61 +4386,230 @@ class Join(Operation):
         if not isinstance(self.key, list):
             self.key = [self.key]
 
-        sorter = Sort(self.key)
-        sorter.set_input_gen(self.input_gen)
-        self_table = list(sorter)
-
-        # print('self_table:')
-        # for line in self_table:
-        #     print(line)
-
-        sorter.set_input_gen(self.graph.result)
-        new_table = list(sorter)
-
-        # print('new_table:')
-        # for line in new_table:
-        #     print(line)
-
-        # with open('./tests/self_table_dump.txt', 'w') as f:
-        #     buf = '\n'.join([json.dumps(line) for line in self_table])
-        #     f.write(buf)
-        # with open('./tests/new_table_dump.txt', 'w') as f:
-        #     buf = '\n'.join([json.dumps(line) for line in new_table])
-        #     f.write(buf)
-
-        self_start, self_stop = 0, 0
-        new_start, new_stop = 0, 0
-        while self_start < len(self_table):
-            self_start = self_stop
-            if self_start == len(self_table):
-                break
-            self_stop, self_val = self.get_monokey_piece(self_table, self.key, self_start)
-            new_val = {}
-            while new_start < len(new_table) and new_val != self_val:
-                new_start = new_stop
-                if new_start == len(new_table):
-                    # print('new_start = len(new_table)')
+        get_key = key_getter(self.key)
+        self_first, self_table = self.sorted_rows(self.input_gen,
+                                                  self.self_sorted)
+        new_first, new_table = self.sorted_rows(self.graph.result,
+                                                self.new_sorted)
+        self_groups = groupby(self_table, key=get_key)
+        new_groups = groupby(new_table, key=get_key)
+        keep_self = self.strategy in ['left', 'full']
+        keep_new = self.strategy in ['right', 'full']
+
+        self_val, self_rows = next(self_groups, (None, None))
+        new_val, new_rows = next(new_groups, (None, None))
+        while self_rows is not None or new_rows is not None:
+            if new_rows is None or \
+                    (self_rows is not None and self_val < new_val):
+                if new_rows is None and not keep_self:
+                    break
+                if keep_self:
+                    for self_row in self_rows:
+                        line = dict.fromkeys(self.empty_columns(new_first,
+                                                                False))
+                        line.update(self_row)
+                        yield line
+                self_val, self_rows = next(self_groups, (None, None))
+            elif self_rows is None or new_val < self_val:
+                if self_rows is None and not keep_new:
                     break
-                new_stop, new_val = self.get_monokey_piece(new_table, self.key, new_start)
-                if new_val != self_val and self.strategy in ['right', 'full']:
-                    for new_row in new_table[new_start:new_stop]:
-                        line = {key: None for key in self_table[0]}
+                if keep_new:
+                    for new_row in new_rows:
+                        line = dict.fromkeys(self.empty_columns(self_first,
+                                                                True))
                         line.update(new_row)
                         yield line
+                new_val, new_rows = next(new_groups, (None, None))
+            else:
+                yield from self.group_product(self_rows, new_rows)
+                self_val, self_rows = next(self_groups, (None, None))
+                new_val, new_rows = next(new_groups, (None, None))
 
-            if new_start == len(new_table) and self.strategy in ['left', 'full']:
-                for self_row in self_table[self_start:self_stop]:
-                    line = {key: None for key in new_table[0]}
-                    line.update(self_row)
+    def group_product(self, self_rows, new_rows):
+        '''
+        Соединяет группы строк обеих таблиц с одним значением ключа. Строки
+        левой группы читаются потоково, правая группа хранится в памяти,
+        а если в ней больше buffer_size строк -- во временном файле, который
+        перечитывается кадрами для каждой строки левой группы. Так тяжёлый
+        ключ не требует памяти, пропорциональной размеру его группы.
+        :param self_rows: iterable, группа левой таблицы
+        :param new_rows: iterable, группа правой таблицы
+        :return: генератор строк
+        '''
+        if self.buffer_size is None:
+            new_piece = list(new_rows)
+        else:
+            new_piece = list(islice(new_rows, self.buffer_size + 1))
+        if self.buffer_size is None or len(new_piece) <= self.buffer_size:
+            for self_row in self_rows:
+                for new_row in new_piece:
+                    line = self_row.copy()
+                    line.update(new_row)
                     yield line
-                continue
+            return
 
-            if new_start < len(new_table):
-                for self_row in self_table[self_start:self_stop]:
-                    for new_row in new_table[new_start:new_stop]:
+        path = spill_rows(chain(new_piece, new_rows))
+        try:
+            new_piece = None
+            codec = PickleCodec()
+            for self_row in self_rows:
+                with open(path, 'rb') as spill:
+                    for new_row in codec.read_rows(spill):
                         line = self_row.copy()
                         line.update(new_row)
                         yield line
+        finally:
+            discard_spill(path)
+
+    def hash_join(self):
+        '''
+        Производит inner, left outer, right outer или full outer join с помощью
+        хеш-таблицы. Таблица строится по меньшей из двух таблиц, а строки другой
+        проходят через неё потоково. Из входного генератора заранее читается
+        не больше len(self.graph.result) + 1 строк, чтобы выяснить, какая
+        таблица меньше. Порядок выходных строк -- порядок строк потоковой таблицы,
+        после которых идут строки хеш-таблицы без пары (для внешних соединений).
+        :return: None
+        '''
+        if self.key is None:
+            raise ValueError('Key for join must not be None')
+        if not isinstance(self.key, list):
+            self.key = [self.key]
+
+        new_table = self.graph.result
+        self_table = iter(self.input_gen)
+        head = list(islice(self_table, len(new_table) + 1))
+        if len(head) <= len(new_table):
+            yield from self.hash_join_rows(head, new_table, build_is_self=True)
+        else:
+            yield from self.hash_join_rows(new_table, chain(head, self_table),
+                                           build_is_self=False)
+
+    def hash_join_rows(self, build, probe, build_is_self):
+        '''
+        Строит хеш-таблицу по строкам build и соединяет с ней строки probe.
+        :param build: list, строки, по которым строится хеш-таблица
+        :param probe: iterable, строки, которые проходят через хеш-таблицу
+        :param build_is_self: bool, являются ли строки build строками
+        входного генератора (левой таблицы)
+        :return: None
+        '''
+        get_key = key_getter(self.key)
+        keep_build = self.strategy in (['left', 'full'] if build_is_self
+                                       else ['right', 'full'])
+        keep_probe = self.strategy in (['right', 'full'] if build_is_self
+                                       else ['left', 'full'])
+
+        table = {}
+        for row in build:
+            table.setdefault(get_key(row), []).append(row)
+        build_first = build[0] if len(build) > 0 else None
+        probe_first = None
+        matched = set()
+
+        for probe_row in probe:
+            if probe_first is None:
+                probe_first = probe_row
+            val = get_key(probe_row)
+            build_rows = table.get(val)
+            if build_rows is None:
+                if keep_probe:
+                    line = dict.fromkeys(self.empty_columns(build_first,
+                                                            build_is_self))
+                    line.update(probe_row)
+                    yield line
+                continue
+            if keep_build:
+                matched.add(val)
+            for build_row in build_rows:
+                if build_is_self:
+                    line = build_row.copy()
+                    line.update(probe_row)
+                else:
+                    line = probe_row.copy()
+                    line.update(build_row)
+                yield line
+
+        if keep_build:
+            for val, build_rows in table.items():
+                if val in matched:
+                    continue
+                for build_row in build_rows:
+                    line = dict.fromkeys(self.empty_columns(
+                        probe_first, not build_is_self))
+                    line.update(build_row)
+                    yield line
+
+    def partitioned(self):
+        '''
+        Делит обе таблицы на части по хэшу ключа и соединяет части
+        параллельно (см. join_partition).
+        :return: None
+        '''
+        if self.key is None:
+            raise ValueError('Key for join must not be None')
+        if not isinstance(self.key, list):
+            self.key = [self.key]
+
+        firsts = []
+
+        def remember_first(rows):
+            first = True
+            for row in rows:
+                if first:
+                    firsts.append(row)
+                    first = False
+                yield row
+            if first:
+                firsts.append(None)
+
+        get_key = key_getter(self.key)
+        partition = hash_partitioner(get_key, self.workers)
+        rows = remember_first(self.input_gen)
+        spills = []
+        heavy = set()
+        if self.skew:
+            sample = []
+            spills.append(spill_rows(sampled_keys(
+                rows, get_key, self.sample_size * self.workers, sample)))
+            heavy = heavy_keys(sample, self.workers)
+            rows = read_spilled_rows(spills[0])
+        cursors = {val: 0 for val in heavy}
+        spread = {val: set() for val in heavy}
+
+        def self_partition(row):
+            val = get_key(row)
+            if val not in cursors:
+                return partition(row)
+            index = cursors[val]
+            cursors[val] = (index + 1) % self.workers
+            spread[val].add(index)
+            return index
+
+        def new_partition(row):
+            indices = spread.get(get_key(row))
+            if not indices:
+                return partition(row)
+            return sorted(indices)
+
+        try:
+            self_spills = partition_rows(rows, self_partition, self.workers)
+            spills.extend(self_spills)
+            new_spills = partition_rows(remember_first(self.graph.result),
+                                        new_partition, self.workers)
+        except BaseException:
+            for path in spills:
+                discard_spill(path)
+            raise
+        tasks = [(self_path, new_path, self.key, self.strategy, self.algorithm,
+                  self.buffer_size, (self.self_sorted, self.new_sorted),
+                  tuple(firsts))
+                 for self_path, new_path in zip(self_spills, new_spills)]
+        merge_key = None
+        if self.algorithm == 'merge':
+            merge_key = key_getter(self.key)
+        yield from run_partitioned(join_partition, tasks, self.workers,
+                                   merge_key, self_spills + new_spills)
 
     def __iter__(self):
         '''
@@ -533,4 +4617,11 @@ class Join(Operation):
         :return: None
         '''
         # print('Join with {}'.format(self.graph.result))
-        return self.strategies[self.strategy]()
+        self.released = False
+        try:
+            if self.workers is not None and self.strategy != 'cross':
+                yield from self.partitioned()
+                return
+            yield from self.strategies[self.strategy]()
+        finally:
+            self.release_graph()
@@ -0,0 +1,77 @@
+import sys
+
+sys.path.append('../')
+import mrop
+
+
+def count_words(state, row):
+    state['word_count'] += 1
+    return state
+
+
+def merge_counts(state, other):
+    state['word_count'] += other['word_count']
+    return state
+
+
+def sum_counts(row, other):
+    row['count'] += other['count']
+    return row
+
+
+data = [
+    {'doc_id': 'onegin', 'word': 'Tatyana'},
+    {'doc_id': 'algebra', 'word': 'prostranstvo'},
+    {'doc_id': 'onegin', 'word': 'verila'},
+    {'doc_id': 'linal', 'word': 'matrix'},
+    {'doc_id': 'algebra', 'word': 'Teita'},
+    {'doc_id': 'onegin', 'word': 'stariny'}
+]
+
+true_res = [
+    {'doc_id': 'algebra', 'word_count': 2},
+    {'doc_id': 'linal', 'word_count': 1},
+    {'doc_id': 'onegin', 'word_count': 3}
+]
+
+aggregate = mrop.Aggregate(count_words, 'doc_id', {'word_count': 0})
+aggregate.set_input_gen(data)
+res = list(aggregate)
+
+flushing = mrop.Aggregate(count_words, 'doc_id', lambda: {'word_count': 0},
+                          merger=merge_counts, max_keys=1)
+flushing.set_input_gen(data)
+flushing_res = list(flushing)
+
+unordered = mrop.Aggregate(count_words, 'doc_id', {'word_count': 0},
+                           merger=merge_counts, max_keys=1)
+unordered.set_input_gen([{'doc_id': 'x'}, {'doc_id': None}, {'doc_id': 'y'},
+                         {'doc_id': None}])
+unordered_res = list(unordered)
+
+combining = mrop.Aggregate(sum_counts, 'doc_id', max_keys=2)
+combining.set_input_gen([{'doc_id': row['doc_id'], 'count': 1}
+                         for row in data])
+combining_res = sorted(combining, key=lambda row: row['doc_id'])
+
+
+def test_aggregate():
+    assert sorted(res, key=lambda row: row['doc_id']) == true_res
+
+
+def test_aggregate_flush():
+    assert sorted(flushing_res, key=lambda row: row['doc_id']) == true_res
+
+
+def test_aggregate_flush_unorderable_keys():
+    assert sorted(unordered_res, key=lambda row: str(row['doc_id'])) == [
+        {'doc_id': None, 'word_count': 2},
+        {'doc_id': 'x', 'word_count': 1},
+        {'doc_id': 'y', 'word_count': 1}
+    ]
+
+
+def test_aggregate_combiner():
+    assert combining_res == [{'doc_id': row['doc_id'],
+                              'count': row['word_count']}
+                             for row in true_res]
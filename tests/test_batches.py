@@ -0,0 +1,181 @@
+import io
+import sys
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+sys.path.append('../')
+import mrop
+
+
+def mapper_length(batch):
+    delta = batch['end'] - batch['start']
+    return {
+        'edge_id': batch['edge_id'],
+        'length': numpy.sqrt((delta ** 2).sum(axis=1))
+    }
+
+
+def reducer_sum(batch, starts):
+    return {
+        'word': batch['word'][starts],
+        'count': numpy.add.reduceat(batch['count'], starts)
+    }
+
+
+edges = [
+    {'start': [0.0, 0.0], 'end': [3.0, 4.0], 'edge_id': 1},
+    {'start': [1.0, 1.0], 'end': [1.0, 2.0], 'edge_id': 2},
+    {'start': [2.0, 0.0], 'end': [0.0, 0.0], 'edge_id': 3}
+]
+
+counts = [
+    {'word': 'world', 'count': 1},
+    {'word': 'hello', 'count': 2},
+    {'word': 'world', 'count': 3},
+    {'word': 'hello', 'count': 4},
+    {'word': 'little', 'count': 5}
+]
+
+lengths = mrop.ComputeGraph() \
+    .map_batches(mapper_length, batch_size=2)
+lengths.source = edges
+lengths.compile()
+lengths.compute()
+
+totals = mrop.ComputeGraph() \
+    .reduce_batches(reducer_sum, 'word')
+totals.source = counts
+totals.compile()
+totals.compute()
+
+table = io.BytesIO()
+mrop.ColumnarCodec(group_size=2).write_rows(table, edges)
+batches = list(mrop.ColumnarCodec().read_batches(table))
+
+
+def test_map_batches():
+    assert lengths.result == [
+        {'edge_id': 1, 'length': 5.0},
+        {'edge_id': 2, 'length': 1.0},
+        {'edge_id': 3, 'length': 2.0}
+    ]
+
+
+def test_reduce_batches():
+    assert totals.result == [
+        {'word': 'hello', 'count': 6},
+        {'word': 'little', 'count': 5},
+        {'word': 'world', 'count': 4}
+    ]
+
+
+def test_columnar_batches():
+    assert [len(batch['edge_id']) for batch in batches] == [2, 1]
+    assert batches[0]['start'].shape == (2, 2)
+    assert batches[1]['edge_id'].tolist() == [3]
+    assert mapper_length(batches[0])['length'].tolist() == [5.0, 1.0]
+
+
+def mapper_token_count(batch):
+    return {
+        'doc_id': batch['doc_id'],
+        'tokens': numpy.array([len(tokens) for tokens in batch['tokens']])
+    }
+
+
+ragged = [
+    {'doc_id': 1, 'tokens': ['a', 'b', 'c']},
+    {'doc_id': 2, 'tokens': []},
+    {'doc_id': 3, 'tokens': ['d', ['e', 'f']]}
+]
+
+
+def test_ragged_columns():
+    batch = mrop.mrop.rows_to_batch(ragged)
+    assert batch['tokens'].dtype == object
+    assert batch['tokens'].shape == (3,)
+    assert list(mrop.mrop.batch_to_rows(batch)) == ragged
+
+    graph = mrop.ComputeGraph() \
+        .map_batches(mapper_token_count)
+    graph.source = ragged
+    graph.compile()
+    graph.compute()
+    assert graph.result == [{'doc_id': 1, 'tokens': 3},
+                            {'doc_id': 2, 'tokens': 0},
+                            {'doc_id': 3, 'tokens': 2}]
+
+    ragged_table = io.BytesIO()
+    mrop.ColumnarCodec().write_rows(ragged_table, ragged)
+    ragged_batch, = mrop.ColumnarCodec().read_batches(ragged_table)
+    assert ragged_batch['tokens'].dtype == object
+    assert ragged_batch['tokens'][2] == ['d', ['e', 'f']]
+
+
+reducer_sizes = []
+
+
+def reducer_sum_checked(batch, starts):
+    reducer_sizes.append(len(batch['word']))
+    return reducer_sum(batch, starts)
+
+
+many_counts = [{'word': 'w{}'.format(i % 7), 'count': i} for i in range(200)]
+many_totals = [{'word': 'w{}'.format(i),
+                'count': sum(range(i, 200, 7))} for i in range(7)]
+
+
+def build_reduce(sort, **kwargs):
+    graph = mrop.ComputeGraph()
+    graph.source = many_counts
+    if sort:
+        graph.sort('word')
+    graph.reduce_batches(reducer_sum_checked, 'word', **kwargs)
+    graph.compile()
+    graph.compute()
+    return graph.result
+
+
+def test_streamed_reduce_batches():
+    del reducer_sizes[:]
+    assert build_reduce(True, batch_size=16) == many_totals
+    assert len(reducer_sizes) > 1
+    assert max(reducer_sizes) <= 16 + 29
+
+
+def test_external_reduce_batches():
+    del reducer_sizes[:]
+    assert build_reduce(False, batch_size=16, buffer_size=20) == many_totals
+    assert len(reducer_sizes) > 1
+    del reducer_sizes[:]
+    assert build_reduce(False) == many_totals
+    assert reducer_sizes == [200]
+
+
+def mapper_double(batch):
+    return {'word': batch['word'], 'count': batch['count'] * 2}
+
+
+def test_batches_between_operations(monkeypatch):
+    converted = []
+    rows_to_batch = mrop.mrop.rows_to_batch
+
+    def counted(rows):
+        converted.append(len(rows))
+        return rows_to_batch(rows)
+
+    monkeypatch.setattr(mrop.mrop, 'rows_to_batch', counted)
+    graph = mrop.ComputeGraph() \
+        .map_batches(mapper_double, batch_size=2) \
+        .reduce_batches(reducer_sum, 'word')
+    graph.source = counts
+    graph.compile()
+    graph.compute()
+    assert graph.result == [
+        {'word': 'hello', 'count': 12},
+        {'word': 'little', 'count': 10},
+        {'word': 'world', 'count': 8}
+    ]
+    assert converted == [2, 2, 1]
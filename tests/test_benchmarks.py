@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+
+sys.path.append('../')
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+import benchmark
+
+
+results = benchmark.run_suite(sorted(benchmark.BENCHMARKS), [200],
+                              bundled=False)
+documents = list(benchmark.generate_documents(50, seed=1))
+edges = list(benchmark.generate_edges(50, seed=1))
+
+
+def test_generators():
+    assert documents == list(benchmark.generate_documents(50, seed=1))
+    assert len(set(row['doc_id'] for row in documents)) == 50
+    assert all(len(row['text'].split()) == 10 for row in documents)
+    assert len(edges) == 50
+    assert all(len(row['start']) == 2 for row in edges)
+
+
+def test_results():
+    assert [result['benchmark'] for result in results] == \
+        sorted(benchmark.BENCHMARKS)
+    for result in results:
+        assert result['rows'] == 200
+        assert result['seconds'] > 0
+        assert len(result['graphs']) > 0
+    json.dumps(results)
+
+
+def test_compare():
+    slower = [dict(result, seconds=result['seconds'] * 2)
+              for result in results]
+    assert benchmark.compare(results, slower) == []
+    assert benchmark.compare(slower, results) == slower
+
+
+def test_unprofiled_timing():
+    runs = []
+    run_graph = benchmark.run_graph
+
+    def recording_run(name, path, profile=None):
+        runs.append(profile)
+        return run_graph(name, path, profile)
+
+    benchmark.run_graph = recording_run
+    try:
+        path = os.path.join(os.path.dirname(__file__), '..', 'data',
+                            'input.txt')
+        result = benchmark.run_benchmark('word_count', path, 1, memory=True,
+                                         repeat=2)
+    finally:
+        benchmark.run_graph = run_graph
+    assert runs[:2] == [None, None]
+    assert len(runs) == 3 and runs[2] is not None
+    assert runs[2].graphs[0].peak_memory is not None
+    assert result['peak_memory'] is not None
@@ -0,0 +1,78 @@
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append('../')
+import mrop
+
+calls = []
+
+
+def mapper_split(row):
+    calls.append(row['doc_id'])
+    for word in row['text'].split():
+        yield {'doc_id': row['doc_id'], 'word': word}
+
+
+def reducer_count(rows):
+    yield {'word': rows[0]['word'], 'count': len(rows)}
+
+
+def write_input(path, data):
+    with open(path, 'w') as f:
+        f.write('\n'.join(json.dumps(row) for row in data))
+
+
+def run(path, cache):
+    words = mrop.ComputeGraph() \
+        .map(mapper_split)
+
+    counts = mrop.ComputeGraph() \
+        .input(words) \
+        .sort('word') \
+        .reduce(reducer_count, 'word')
+
+    graph = mrop.ComputeGraph() \
+        .input(words) \
+        .join(counts, key='word')
+    graph.compile()
+
+    del calls[:]
+    output = io.StringIO()
+    with open(path) as in_file:
+        graph.run(subgraph_inputs={words: in_file}, output=output, cache=cache)
+    return [json.loads(line) for line in output.getvalue().split('\n')], \
+        len(calls)
+
+
+directory = tempfile.mkdtemp()
+path = os.path.join(directory, 'input.txt')
+cache = mrop.ResultCache(os.path.join(directory, 'cache'))
+
+write_input(path, [{'doc_id': 1, 'text': 'hello world'}])
+first, first_calls = run(path, cache)
+second, second_calls = run(path, cache)
+
+write_input(path, [{'doc_id': 1, 'text': 'hello world'},
+                   {'doc_id': 2, 'text': 'hello'}])
+changed, changed_calls = run(path, cache)
+
+small_cache = mrop.ResultCache(os.path.join(directory, 'small'), max_bytes=0)
+run(path, small_cache)
+
+
+def test_cache_hit():
+    assert second == first
+    assert first_calls == 1
+    assert second_calls == 0
+
+
+def test_cache_invalidated():
+    assert changed_calls == 2
+    assert {'doc_id': 2, 'word': 'hello', 'count': 2} in changed
+
+
+def test_cache_eviction():
+    assert os.listdir(small_cache.directory) == []
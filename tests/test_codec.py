@@ -0,0 +1,67 @@
+import io
+import json
+import sys
+
+sys.path.append('../')
+import mrop
+
+
+def mapper_identity(row):
+    yield row
+
+
+data = [
+    {'doc_id': 1, 'word': 'hello', 'weight': 0.5},
+    {'doc_id': 2, 'word': 'world', 'weight': 1e-05},
+    {'doc_id': 3, 'word': 'big', 'weight': 2 ** 70}
+]
+text = '\n'.join(json.dumps(row) for row in data) + '\n\n'
+
+
+def run(in_file, codec, out_file, output_codec=None):
+    graph = mrop.ComputeGraph() \
+        .map(mapper_identity)
+    graph.compile()
+    graph.run(input=in_file, output=out_file, codec=codec,
+              output_codec=output_codec)
+    return out_file
+
+
+json_out = run(io.StringIO(text), None, io.StringIO()).getvalue()
+compact_out = run(io.StringIO(text), mrop.JsonCodec(compact=True),
+                  io.StringIO()).getvalue()
+
+pickled = io.BytesIO()
+mrop.PickleCodec().write_rows(pickled, data, flush_size=2)
+pickled.seek(0)
+pickle_out = run(pickled, mrop.PickleCodec(), io.BytesIO())
+pickle_out.seek(0)
+
+
+def test_json_codec():
+    assert json_out == '\n'.join(json.dumps(row) for row in data)
+
+
+def test_compact_json_codec():
+    assert ' ' not in compact_out
+    assert [json.loads(line) for line in compact_out.split('\n')] == data
+
+
+def test_pickle_codec():
+    assert list(mrop.PickleCodec().read_rows(pickle_out)) == data
+
+
+columnar_data = data[:2] + [
+    {'doc_id': 3, 'word': 'hello', 'weight': 0.25},
+    {'doc_id': 4, 'word': 'list', 'weight': [1.0, 2.0]},
+    {'doc_id': 5, 'extra': None}
+]
+columnar = run(io.StringIO('\n'.join(json.dumps(row) for row in columnar_data)),
+               None, io.BytesIO(), mrop.ColumnarCodec(group_size=3))
+columnar_out = run(columnar, mrop.ColumnarCodec(), io.StringIO(),
+                   mrop.JsonCodec()).getvalue()
+
+
+def test_columnar_codec():
+    assert [json.loads(line) for line in columnar_out.split('\n')] == \
+        columnar_data
@@ -0,0 +1,119 @@
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+import tempfile
+
+sys.path.append('../')
+import mrop
+
+
+def mapper_split(row):
+    for word in row['text'].split():
+        yield {'word': word}
+
+
+def reducer_count(rows):
+    yield {'word': rows[0]['word'], 'count': len(rows)}
+
+
+data = [{'doc_id': i, 'text': 'a b c d'[:1 + 2 * (i % 4)]} for i in range(300)]
+text = '\n'.join(json.dumps(row) for row in data) + '\n'
+directory = tempfile.mkdtemp()
+
+
+def write(name, module=None, content=text.encode()):
+    path = os.path.join(directory, name)
+    with (open if module is None else module.open)(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def build():
+    graph = mrop.ComputeGraph() \
+        .map(mapper_split) \
+        .sort('word') \
+        .reduce(reducer_count, 'word')
+    graph.compile()
+    return graph
+
+
+def run(input, output=None, **kwargs):
+    out = io.StringIO() if output is None else output
+    build().run(input=input, output=out, **kwargs)
+    if output is None:
+        return [json.loads(line) for line in out.getvalue().split('\n')]
+
+
+expected = run(io.StringIO(text))
+plain = write('input.json')
+compressed = {
+    'gzip': write('input.json.gz', gzip),
+    'bz2': write('input.json.bz2', bz2),
+    'xz': write('input.json.xz', lzma),
+    'gzip magic': write('input.data', gzip)
+}
+
+
+def test_compressed_paths():
+    for path in compressed.values():
+        assert run(path) == expected
+    assert run(plain) == expected
+
+
+def test_compressed_file_objects():
+    with open(compressed['gzip magic'], 'rb') as f:
+        assert run(f) == expected
+    with open(compressed['xz'], 'r') as f:
+        assert run(f) == expected
+
+
+def test_read_ahead():
+    for path in compressed.values():
+        assert run(path, read_ahead=True) == expected
+
+
+def test_read_ahead_stops():
+    graph = mrop.ComputeGraph().map(mapper_split).limit(3)
+    graph.compile()
+    out = io.StringIO()
+    graph.run(input=compressed['bz2'], output=out, read_ahead=True)
+    assert len(out.getvalue().split('\n')) == 3
+
+
+def test_compressed_output():
+    for extension, module in [('gz', gzip), ('bz2', bz2), ('xz', lzma)]:
+        path = os.path.join(directory, 'output.json.' + extension)
+        run(plain, path)
+        with module.open(path, 'rt') as f:
+            assert [json.loads(line) for line in f] == expected
+
+
+def test_compressed_binary_codecs():
+    for codec in [mrop.PickleCodec(), mrop.ColumnarCodec(group_size=2)]:
+        path = os.path.join(directory, 'output.bin.xz')
+        run(plain, path, output_codec=codec)
+        out = io.StringIO()
+        graph = mrop.ComputeGraph().sort('word')
+        graph.compile()
+        graph.run(input=path, output=out, codec=codec,
+                  output_codec=mrop.JsonCodec())
+        assert [json.loads(line) for line in out.getvalue().split('\n')] == \
+            expected
+
+
+def test_compressed_incremental():
+    state = os.path.join(directory, 'counts.state')
+    assert build().compute_incremental(compressed['gzip'], state) is None
+    assert run(compressed['gzip'], incremental=state) == expected
+
+
+def test_unknown_compression():
+    try:
+        mrop.Input(io.StringIO(text), compression='zip')
+    except ValueError:
+        return
+    assert False
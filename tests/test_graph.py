@@ -0,0 +1,72 @@
+import sys
+
+sys.path.append('../')
+import mrop
+
+
+def row_counter(state, row):
+    state['row_count'] += 1
+    return state
+
+
+def reducer_count_words(rows):
+    yield {
+        'doc_id': rows[0]['doc_id'],
+        'word_count': len(rows)
+    }
+
+
+data = [
+    {'doc_id': 'onegin', 'word': 'Tatyana'},
+    {'doc_id': 'onegin', 'word': 'verila'},
+    {'doc_id': 'algebra', 'word': 'prostranstvo'},
+    {'doc_id': 'algebra', 'word': 'Teita'},
+    {'doc_id': 'algebra', 'word': 'gomeomorphno'}
+]
+
+
+def build_graph():
+    words = mrop.ComputeGraph()
+    words.source = data
+
+    counts = mrop.ComputeGraph() \
+        .input(words) \
+        .sort('doc_id') \
+        .reduce(reducer_count_words, 'doc_id')
+
+    total = mrop.ComputeGraph() \
+        .input(words) \
+        .fold(row_counter, {'row_count': 0})
+
+    graph = mrop.ComputeGraph() \
+        .input(counts) \
+        .join(total, strategy='cross')
+    graph.compile()
+    return graph
+
+
+sequential = build_graph()
+sequential.compute()
+
+parallel = build_graph()
+parallel.compute(parallelism=4)
+
+
+kept = build_graph()
+kept.compute(keep_results=True)
+
+
+def test_parallel_compute():
+    assert parallel.result == sequential.result
+    assert parallel.result == [
+        {'doc_id': 'algebra', 'word_count': 3, 'row_count': 5},
+        {'doc_id': 'onegin', 'word_count': 2, 'row_count': 5}
+    ]
+
+
+def test_results_released():
+    assert all(graph.result is None for graph in sequential.compute_order)
+
+
+def test_results_kept():
+    assert all(graph.result is not None for graph in kept.compute_order)
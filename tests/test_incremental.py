@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append('../')
+import mrop
+
+calls = []
+
+
+def mapper_split(row):
+    calls.append(row['doc_id'])
+    for word in row['text'].split():
+        yield {'word': word, 'count': 1}
+
+
+def reducer_sum(rows):
+    yield {'word': rows[0]['word'], 'count': sum(row['count'] for row in rows)}
+
+
+def folder_sum(state, row):
+    state['count'] += row['count']
+    return state
+
+
+def build_counts():
+    graph = mrop.ComputeGraph() \
+        .map(mapper_split) \
+        .sort('word') \
+        .reduce(reducer_sum, 'word', associative=True)
+    graph.compile()
+    return graph
+
+
+def build_total():
+    graph = mrop.ComputeGraph() \
+        .map(mapper_split) \
+        .fold(folder_sum, {'count': 0})
+    graph.compile()
+    return graph
+
+
+def build_aggregate():
+    graph = mrop.ComputeGraph() \
+        .map(mapper_split) \
+        .aggregate(folder_sum, 'word')
+    graph.compile()
+    return graph
+
+
+def run(graph, path, state):
+    del calls[:]
+    output = io.StringIO()
+    with open(path) as in_file:
+        graph.run(input=in_file, output=output, incremental=state)
+    return [json.loads(line) for line in output.getvalue().split('\n')], \
+        sorted(calls)
+
+
+directory = tempfile.mkdtemp()
+path = os.path.join(directory, 'input.txt')
+counts_state = os.path.join(directory, 'counts.state')
+total_state = os.path.join(directory, 'total.state')
+aggregate_state = os.path.join(directory, 'aggregate.state')
+
+with open(path, 'w') as f:
+    f.write(json.dumps({'doc_id': 1, 'text': 'hello world'}) + '\n' +
+            json.dumps({'doc_id': 2, 'text': 'hello'}))
+first = run(build_counts(), path, counts_state)
+first_total = run(build_total(), path, total_state)
+first_aggregate = run(build_aggregate(), path, aggregate_state)
+
+with open(path, 'a') as f:
+    f.write('\n' + json.dumps({'doc_id': 3, 'text': 'world little'}) + '\n' +
+            '{"doc_id": 4, "te')
+second = run(build_counts(), path, counts_state)
+second_total = run(build_total(), path, total_state)
+second_aggregate = run(build_aggregate(), path, aggregate_state)
+
+with open(path, 'w') as f:
+    f.write(json.dumps({'doc_id': 5, 'text': 'rewritten'}) + '\n')
+rewritten = run(build_counts(), path, counts_state)
+
+
+def test_incremental_reduce():
+    assert first == ([{'word': 'hello', 'count': 2},
+                      {'word': 'world', 'count': 1}], [1, 2])
+    assert second == ([{'word': 'hello', 'count': 2},
+                       {'word': 'little', 'count': 1},
+                       {'word': 'world', 'count': 2}], [3])
+
+
+def test_incremental_fold():
+    assert first_total == ([{'count': 3}], [1, 2])
+    assert second_total == ([{'count': 5}], [3])
+
+
+def test_incremental_aggregate():
+    rows, new_calls = second_aggregate
+    assert sorted(rows, key=lambda row: row['word']) == second[0]
+    assert new_calls == [3]
+
+
+def test_incremental_rewritten_input():
+    assert rewritten == ([{'word': 'rewritten', 'count': 1}], [5])
@@ -0,0 +1,124 @@
+import io
+import json
+import sys
+
+sys.path.append('../')
+import mrop
+
+
+class UnseekableInput(io.StringIO):
+    def seekable(self):
+        return False
+
+
+def row_counter(state, row):
+    state['row_count'] += 1
+    return state
+
+
+def mapper_identity(row):
+    yield row
+
+
+data = [
+    {'doc_id': 'onegin', 'word': 'Tatyana'},
+    {'doc_id': 'onegin', 'word': 'verila'},
+    {'doc_id': 'algebra', 'word': 'prostranstvo'},
+    {'doc_id': 'algebra', 'word': 'Teita'}
+]
+text = '\n'.join(json.dumps(row) for row in data) + '\n'
+
+stream_input = mrop.Input(io.StringIO(text), streaming=True)
+stream_res = list(stream_input)
+
+
+def run_shared(in_file):
+    rows = mrop.ComputeGraph() \
+        .map(mapper_identity)
+
+    counter = mrop.ComputeGraph() \
+        .fold(row_counter, {'row_count': 0})
+
+    graph = mrop.ComputeGraph() \
+        .input(rows) \
+        .join(counter, strategy='cross')
+    graph.compile()
+
+    out_file = io.StringIO()
+    graph.run(subgraph_inputs={rows: in_file, counter: in_file},
+              output=out_file, streaming=True)
+    return [json.loads(line) for line in out_file.getvalue().split('\n')]
+
+
+shared_res = run_shared(io.StringIO(text))
+unseekable_res = run_shared(UnseekableInput(text))
+
+
+def test_streaming_input():
+    assert stream_res == data
+
+
+def test_shared_streaming_input():
+    assert shared_res == [dict(row, row_count=len(data)) for row in data]
+
+
+def test_shared_unseekable_input():
+    assert unseekable_res == shared_res
+
+
+def mapper_checked(row):
+    if 'word' not in row:
+        raise ValueError('Bad row {}'.format(row))
+    yield row
+
+
+def build_checked():
+    rows = mrop.ComputeGraph() \
+        .map(mapper_checked)
+
+    counter = mrop.ComputeGraph() \
+        .fold(row_counter, {'row_count': 0})
+
+    graph = mrop.ComputeGraph() \
+        .input(rows) \
+        .join(counter, strategy='cross')
+    graph.compile()
+    return rows, counter, graph
+
+
+def run_checked(rows, counter, graph, content):
+    in_file = io.StringIO(content)
+    out_file = io.StringIO()
+    graph.run(subgraph_inputs={rows: in_file, counter: in_file},
+              output=out_file)
+    return [json.loads(line) for line in out_file.getvalue().split('\n')]
+
+
+def test_rerun_after_error():
+    rows, counter, graph = build_checked()
+    try:
+        run_checked(rows, counter, graph, text + '{"doc_id": "bad"}\n')
+    except ValueError:
+        pass
+    else:
+        assert False
+    assert rows.source is None and counter.source is None
+    assert run_checked(rows, counter, graph, text) == \
+        [dict(row, row_count=len(data)) for row in data]
+
+
+def test_rerun_root_after_error():
+    graph = mrop.ComputeGraph() \
+        .map(mapper_checked)
+    graph.compile()
+    try:
+        graph.run(input=io.StringIO('{"doc_id": "bad"}\n'),
+                  output=io.StringIO())
+    except ValueError:
+        pass
+    else:
+        assert False
+    out_file = io.StringIO()
+    graph.run(input=io.StringIO(text), output=out_file)
+    assert [json.loads(line) for line in out_file.getvalue().split('\n')] == \
+        data
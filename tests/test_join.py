@@ -1,3 +1,4 @@
+import json
 import sys
 
 sys.path.append('../')
@@ -46,6 +47,8 @@ right_res = [
     {'col_A': None, 'col_B': 'f', 'col_C': 'F'}
 ]
 
+full_res = left_res + right_res[-2:]
+
 second = mrop.ComputeGraph()
 second.source = second_data
 
@@ -67,6 +70,43 @@ first_right.add(mrop.Join(second, strategy='right', key='col_B'))
 first_right.compile()
 first_right.compute()
 
+first_full = mrop.ComputeGraph(sort_buffer_size=2)
+first_full.source = first_data
+first_full.add(mrop.Join(second, strategy='full', key='col_B'))
+first_full.compile()
+first_full.compute()
+
+hash_results = {}
+for strategy in ['inner', 'left', 'right', 'full']:
+    for source in [first_data * 2, first_data[:3]]:
+        hash_graph = mrop.ComputeGraph()
+        hash_graph.source = source
+        hash_graph.add(mrop.Join(second, strategy=strategy, key='col_B',
+                                 algorithm='hash'))
+        merge_graph = mrop.ComputeGraph()
+        merge_graph.source = source
+        merge_graph.add(mrop.Join(second, strategy=strategy, key='col_B'))
+        hash_graph.compile()
+        hash_graph.compute()
+        merge_graph.compile()
+        merge_graph.compute()
+        hash_results[(strategy, len(source))] = (hash_graph.result,
+                                                 merge_graph.result)
+
+cross_results = {}
+for views in [False, True]:
+    for buffer_size in [None, 2]:
+        cross_graph = mrop.ComputeGraph()
+        cross_graph.source = first_data
+        cross_graph.add(mrop.Join(second, strategy='cross',
+                                  buffer_size=buffer_size, views=views))
+        cross_graph.compile()
+        cross_graph.compute()
+        cross_results[(views, buffer_size)] = cross_graph.result
+
+cross_res = [dict(first_row, **second_row)
+             for first_row in first_data for second_row in second_data]
+
 
 def test_inner():
     assert first_inner.result == inner_res
@@ -78,3 +118,50 @@ def test_left():
 
 def test_right():
     assert first_right.result == right_res
+
+
+def test_full():
+    assert sorted(first_full.result, key=lambda row: row['col_B']) == \
+           sorted(full_res, key=lambda row: row['col_B'])
+
+
+def test_hash_join():
+    for hash_res, merge_res in hash_results.values():
+        assert sorted(hash_res, key=lambda row: row['col_B']) == \
+               sorted(merge_res, key=lambda row: row['col_B'])
+
+
+def test_cross():
+    for res in cross_results.values():
+        assert res == cross_res
+
+
+def test_cross_views():
+    row = cross_results[(True, None)][0]
+    assert isinstance(row, mrop.mrop.MergedRow)
+    assert list(row) == ['col_A', 'col_B', 'col_C']
+    assert row['col_B'] == 'a' and len(row) == 3
+    assert json.loads(json.dumps(row, default=dict)) == cross_res[0]
+    row['col_B'] = 'z'
+    del row['col_A']
+    assert row == {'col_B': 'z', 'col_C': 'A'}
+    assert first_data[0] == {'col_A': '1', 'col_B': 'a'}
+    assert second_data[0] == {'col_B': 'a', 'col_C': 'A'}
+
+
+def test_spilled_group():
+    hot_first = [{'col_A': str(i), 'col_B': 'a'} for i in range(5)]
+    hot_second = [{'col_B': 'a', 'col_C': str(i)} for i in range(4)]
+    other = mrop.ComputeGraph()
+    other.source = hot_second
+    results = []
+    for buffer_size in [None, 2]:
+        graph = mrop.ComputeGraph()
+        graph.source = hot_first
+        graph.add(mrop.Join(other, strategy='inner', key='col_B',
+                            buffer_size=buffer_size))
+        graph.compile()
+        graph.compute()
+        results.append(graph.result)
+    assert len(results[0]) == 20
+    assert results[0] == results[1]
@@ -1,6 +1,8 @@
 import re
 import sys
 
+import pytest
+
 sys.path.append('../')
 import mrop
 
@@ -30,3 +32,24 @@ true_res = [{'doc_id': 'my_text', 'word': 'tatyana'},
 
 def test_map():
     assert res == true_res
+
+
+def test_parallel_map():
+    parallel_map = mrop.Map(split_input, workers=2, chunk_size=1)
+    parallel_map.set_input_gen(data * 3)
+    assert list(parallel_map) == true_res * 3
+
+
+def test_parallel_map_unordered():
+    unordered_map = mrop.Map(split_input, workers=2, chunk_size=1,
+                             ordered=False)
+    unordered_map.set_input_gen(data * 3)
+    assert sorted(unordered_map, key=lambda row: row['word']) == \
+           sorted(true_res * 3, key=lambda row: row['word'])
+
+
+def test_parallel_map_lambda():
+    lambda_map = mrop.Map(lambda row: [row], workers=2)
+    lambda_map.set_input_gen(data)
+    with pytest.raises(ValueError):
+        list(lambda_map)
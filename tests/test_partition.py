@@ -0,0 +1,148 @@
+import sys
+
+sys.path.append('../')
+import mrop
+
+
+def reducer_count(rows):
+    yield {'word': rows[0]['word'], 'count': len(rows)}
+
+
+def reducer_words(rows):
+    yield {'count': rows[0]['count'], 'words': len(rows)}
+
+
+words = ['w{}'.format(i % 37) for i in range(500)]
+data = [{'doc_id': i % 7, 'word': word, 'n': i} for i, word in enumerate(words)]
+other_data = [{'word': 'w{}'.format(i), 'rank': i} for i in range(20, 60)]
+
+
+def compute(workers, build):
+    other = mrop.ComputeGraph()
+    other.source = other_data
+    graph = build(mrop.ComputeGraph(workers=workers), other)
+    graph.source = data
+    graph.compile()
+    graph.compute()
+    return graph.result
+
+
+def build_sort(graph, other):
+    return graph.sort(['word', 'doc_id'])
+
+
+def build_sort_reduce(graph, other):
+    return graph.sort('word').reduce(reducer_count, 'word',
+                                     preserves_order=True)
+
+
+def mapper_identity(row):
+    yield row
+
+
+def build_reduce(graph, other):
+    return graph.sort(['word', 'doc_id'], workers=1) \
+        .map(mapper_identity, preserves_order=True) \
+        .reduce(reducer_count, 'word', preserves_order=True)
+
+
+def build_unordered_reduce(graph, other):
+    return build_reduce(graph, other) \
+        .sort('count') \
+        .map(mapper_identity) \
+        .reduce(reducer_words, 'count')
+
+
+def build_join(strategy, algorithm):
+    def build(graph, other):
+        return graph.join(other, key='word', strategy=strategy,
+                          algorithm=algorithm)
+    return build
+
+
+def test_partitioned_sort():
+    assert compute(3, build_sort) == compute(None, build_sort)
+
+
+def test_partitioned_sort_reduce():
+    assert compute(3, build_sort_reduce) == compute(None, build_sort_reduce)
+
+
+def test_partitioned_reduce():
+    assert compute(3, build_reduce) == compute(None, build_reduce)
+
+
+def test_partitioned_unordered_reduce():
+    def key(row):
+        return sorted(row.items())
+    assert sorted(compute(3, build_unordered_reduce), key=key) == \
+        sorted(compute(None, build_unordered_reduce), key=key)
+
+
+def test_partitioned_merge_join():
+    for strategy in ['inner', 'left', 'right', 'full']:
+        build = build_join(strategy, 'merge')
+        assert compute(4, build) == compute(None, build)
+
+
+def test_partitioned_hash_join():
+    def key(row):
+        return repr(sorted(row.items()))
+    for strategy in ['inner', 'left', 'right', 'full']:
+        build = build_join(strategy, 'hash')
+        assert sorted(compute(4, build), key=key) == \
+            sorted(compute(None, build), key=key)
+
+
+def test_partitioned_plan():
+    graph = mrop.ComputeGraph(workers=2).sort('word') \
+        .reduce(reducer_count, 'word')
+    graph.compile()
+    assert 'workers=2' in graph.dump_plan()
+
+
+def test_unpicklable_reducer():
+    graph = mrop.ComputeGraph().reduce(lambda rows: rows, 'word', workers=2)
+    graph.source = data
+    graph.compile()
+    try:
+        graph.compute()
+    except ValueError:
+        return
+    assert False
+
+
+skewed_data = [{'word': 'the' if i % 3 else 'w{}'.format(i % 17), 'n': i}
+               for i in range(600)]
+skewed_other = [{'word': 'the', 'rank': i} for i in range(3)] + \
+    [{'word': 'w{}'.format(i), 'rank': i} for i in range(10, 30)]
+
+
+def compute_skewed(workers, strategy, algorithm):
+    other = mrop.ComputeGraph()
+    other.source = skewed_other
+    graph = mrop.ComputeGraph().join(other, key='word', strategy=strategy,
+                                     algorithm=algorithm, workers=workers,
+                                     skew=True)
+    graph.source = skewed_data
+    graph.compile()
+    graph.compute()
+    return graph.result
+
+
+def test_heavy_keys():
+    keys = [('the',)] * 50 + [('w{}'.format(i),) for i in range(50)]
+    assert mrop.mrop.heavy_keys(keys, 4) == {('the',)}
+
+
+def test_skewed_join():
+    def key(row):
+        return repr(sorted(row.items()))
+    for strategy in ['inner', 'left', 'right', 'full']:
+        for algorithm in ['merge', 'hash']:
+            res = compute_skewed(4, strategy, algorithm)
+            assert sorted(res, key=key) == \
+                sorted(compute_skewed(None, strategy, algorithm), key=key)
+            if algorithm == 'merge':
+                assert [row['word'] for row in res] == \
+                    sorted(row['word'] for row in res)
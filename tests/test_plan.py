@@ -0,0 +1,106 @@
+import sys
+import time
+
+sys.path.append('../')
+import mrop
+
+
+def mapper_split(row):
+    for word in row['text'].split():
+        yield {'doc_id': row['doc_id'], 'word': word}
+
+
+def mapper_lower(row):
+    yield dict(row, word=row['word'].lower())
+
+
+def reducer_count(rows):
+    yield {'word': rows[0]['word'], 'count': len(rows)}
+
+
+data = [
+    {'doc_id': 1, 'text': 'Hello little world'},
+    {'doc_id': 2, 'text': 'hello World'},
+    {'doc_id': 3, 'text': 'little little'}
+]
+
+
+def build_graph(optimize):
+    words = mrop.ComputeGraph()
+    words.source = data
+    words.map(mapper_split) \
+        .map(mapper_lower)
+
+    graph = mrop.ComputeGraph() \
+        .input(words) \
+        .sort('doc_id') \
+        .sort('word') \
+        .reduce(reducer_count, 'word')
+    graph.compile(optimize=optimize)
+    return graph
+
+
+plain = build_graph(optimize=False)
+plain.compute()
+
+optimized = build_graph(optimize=True)
+optimized.compute()
+
+
+def test_optimized_result():
+    assert optimized.result == plain.result
+    assert optimized.result == [
+        {'word': 'hello', 'count': 2},
+        {'word': 'little', 'count': 3},
+        {'word': 'world', 'count': 2}
+    ]
+
+
+def test_optimized_plan():
+    words = optimized.compute_order[0]
+    assert [type(op).__name__ for op in words.plan] == ['FusedMap']
+    assert [type(op).__name__ for op in optimized.plan] == ['SortReduce']
+    assert optimized.plan[0].sort.key == ['word', 'doc_id']
+    assert optimized.inlined == {words}
+    assert words.result is None
+
+
+def test_dump_plan():
+    dump = optimized.dump_plan()
+    assert 'FusedMap(mapper_split, mapper_lower)' in dump
+    assert '(inlined)' in dump
+    assert 'Sort([\'doc_id\'])' in plain.dump_plan()
+
+
+def mapper_shift(row):
+    yield {'doc_id': row['doc_id'] + 1, 'word': row['word']}
+
+
+def mapper_odd(row):
+    if row['doc_id'] % 2 == 1:
+        yield row
+
+
+def map_time(optimize, rows):
+    best = None
+    for _ in range(3):
+        graph = mrop.ComputeGraph() \
+            .map(mapper_shift) \
+            .map(mapper_lower) \
+            .map(mapper_odd)
+        graph.source = rows
+        graph.compile(optimize=optimize)
+        start = time.perf_counter()
+        graph.compute()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, graph
+
+
+def test_fused_map_throughput():
+    rows = [{'doc_id': i, 'word': 'Word'} for i in range(100000)]
+    fused_time, fused = map_time(True, rows)
+    chain_time, chain = map_time(False, rows)
+    assert [type(op).__name__ for op in fused.plan] == ['FusedMap']
+    assert fused.result == chain.result
+    assert fused_time < chain_time * 1.5
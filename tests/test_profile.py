@@ -0,0 +1,106 @@
+import sys
+
+sys.path.append('../')
+import mrop
+
+
+def mapper_split(row):
+    for word in row['text'].split():
+        yield {'doc_id': row['doc_id'], 'word': word}
+
+
+def reducer_count(rows):
+    yield {'word': rows[0]['word'], 'count': len(rows)}
+
+
+data = [
+    {'doc_id': 1, 'text': 'hello little world'},
+    {'doc_id': 2, 'text': 'hello world'}
+]
+
+words = mrop.ComputeGraph() \
+    .map(mapper_split)
+words.source = data
+
+graph = mrop.ComputeGraph() \
+    .input(words) \
+    .sort('word') \
+    .reduce(reducer_count, 'word')
+graph.compile()
+
+profile = mrop.Profile(memory=True)
+graph.compute(profile=profile)
+report = profile.as_dict()
+
+
+def test_profile_rows():
+    assert [record['graph'] for record in report] == ['graph', 'subgraph 0']
+    assert report[1]['wall_time'] is None
+    assert report[1]['stages'][1]['rows_out'] == 5
+    stages = report[0]['stages']
+    assert [stage['operation'] for stage in stages] == [
+        'Input(subgraph 0)',
+        "SortReduce(Sort(['word']), Reduce(reducer_count, ['word']))"
+    ]
+    assert [(stage['rows_in'], stage['rows_out']) for stage in stages] == \
+        [(0, 5), (5, 3)]
+
+
+def test_profile_times():
+    record = profile.graphs[0]
+    assert record.wall_time > 0
+    assert record.peak_memory > 0
+    assert record.stages[1].callback_calls == 3
+    assert 'SortReduce' in profile.table()
+
+
+def test_profile_restores_callbacks():
+    assert graph.plan[0].reduce.reducer is reducer_count
+    graph.compute()
+    assert graph.result == [
+        {'word': 'hello', 'count': 2},
+        {'word': 'little', 'count': 1},
+        {'word': 'world', 'count': 2}
+    ]
+
+
+def mapper_lower(row):
+    yield {'doc_id': row['doc_id'], 'word': row['word'].lower()}
+
+
+many = [{'doc_id': i, 'text': 'Hello little World'} for i in range(2000)]
+
+fused = mrop.ComputeGraph() \
+    .map(mapper_split) \
+    .map(mapper_lower) \
+    .sort('word') \
+    .reduce(reducer_count, 'word')
+fused.source = many
+fused.compile()
+
+sampled = mrop.Profile(sample=4, memory=True, chunk_size=64)
+fused.compute(profile=sampled)
+sampled_result = fused.result
+
+
+def test_sampled_profile():
+    stages = sampled.graphs[0].stages
+    assert [(stage.rows_in, stage.rows_out) for stage in stages] == \
+        [(0, 2000), (2000, 6000), (6000, 3)]
+    assert stages[1].name == 'FusedMap(mapper_split, mapper_lower)'
+    assert 0 < stages[1].callback_time <= stages[1].time
+    assert abs(stages[1].callback_calls - 8000) <= 400
+    assert stages[2].peak_memory > 0
+    assert 'peak, MB' in sampled.table()
+    assert sampled.as_dict()[0]['stages'][2]['peak_memory'] == \
+        stages[2].peak_memory
+
+
+def test_sampled_profile_restores_callbacks():
+    assert fused.plan[0].fused_mappers == [mapper_split, mapper_lower]
+    fused.compute()
+    assert fused.result == sampled_result == [
+        {'word': 'hello', 'count': 2000},
+        {'word': 'little', 'count': 2000},
+        {'word': 'world', 'count': 2000}
+    ]
@@ -29,6 +29,24 @@ reduce = mrop.Reduce(reducer=reducer_count_words, key='doc_id')
 reduce.set_input_gen(data)
 res = list(reduce)
 
+
+def reducer_count_words_lazy(rows):
+    first = next(rows)
+    yield {
+        'doc_id': first['doc_id'],
+        'word_count': 1 + sum(1 for _ in rows)
+    }
+
+
+lazy_reduce = mrop.Reduce(reducer=reducer_count_words_lazy, key='doc_id',
+                          lazy=True)
+lazy_reduce.set_input_gen(data)
+lazy_res = list(lazy_reduce)
+
+empty_reduce = mrop.Reduce(reducer=reducer_count_words, key='doc_id')
+empty_reduce.set_input_gen([])
+empty_res = list(empty_reduce)
+
 true_res = [
     {'doc_id': 'onegin', 'word_count': 5},
     {'doc_id': 'algebra', 'word_count': 4}
@@ -37,3 +55,33 @@ true_res = [
 
 def test_reduce():
     assert res == true_res
+
+
+def test_lazy_reduce():
+    assert lazy_res == true_res
+
+
+def test_empty_reduce():
+    assert empty_res == []
+
+
+def test_reduce_unsorted_input():
+    graph = mrop.ComputeGraph() \
+        .sort('word') \
+        .reduce(reducer_count_words, 'doc_id')
+    graph.source = data
+    try:
+        graph.compile()
+    except ValueError:
+        return
+    assert False, 'Reduce over a table sorted by another key must not compile'
+
+
+def test_reduce_permuted_key():
+    graph = mrop.ComputeGraph() \
+        .sort(['word', 'doc_id']) \
+        .reduce(reducer_count_words, ['doc_id', 'word'])
+    graph.source = data
+    graph.compile()
+    graph.compute()
+    assert len(graph.result) == len(data)
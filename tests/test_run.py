@@ -0,0 +1,39 @@
+import io
+import json
+import sys
+
+sys.path.append('../')
+import mrop
+
+
+class RecordingOutput(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return super().write(s)
+
+
+def mapper_identity(row):
+    yield row
+
+
+data = [{'doc_id': i, 'word': 'word_{}'.format(i)} for i in range(5)]
+text = '\n'.join(json.dumps(row) for row in data)
+
+graph = mrop.ComputeGraph() \
+    .map(mapper_identity)
+graph.compile()
+
+output = RecordingOutput()
+graph.run(input=io.StringIO(text), output=output, flush_size=2)
+
+
+def test_run_output():
+    assert output.getvalue() == text
+
+
+def test_run_batches():
+    assert output.writes == 3
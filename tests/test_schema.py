@@ -0,0 +1,103 @@
+import io
+import json
+import pickle
+import sys
+
+import pytest
+
+sys.path.append('../')
+import mrop
+
+
+def mapper_split(row):
+    for word in row['text'].split():
+        yield {'doc_id': row['doc_id'], 'word': word}
+
+
+def reducer_count(rows):
+    yield {'word': rows[0]['word'], 'count': len(rows)}
+
+
+data = [
+    {'doc_id': 1, 'text': 'hello little world'},
+    {'doc_id': 2, 'text': 'hello world'}
+]
+
+
+def build_graph(schema):
+    words = mrop.ComputeGraph(schema=schema) \
+        .map(mapper_split)
+    words.source = data
+
+    counts = mrop.ComputeGraph() \
+        .input(words) \
+        .sort('word', buffer_size=2) \
+        .reduce(reducer_count, 'word')
+
+    graph = mrop.ComputeGraph() \
+        .input(words) \
+        .join(counts, key='word')
+    graph.compile()
+    return graph
+
+
+plain = build_graph(None)
+plain.compute(keep_results=True)
+
+compact = build_graph(['doc_id', 'word'])
+compact.compute(keep_results=True)
+
+
+def test_schema_records():
+    words = compact.compute_order[0]
+    assert all(type(row).fields == ('doc_id', 'word') for row in words.result)
+    assert words.result == plain.compute_order[0].result
+    assert words.result[0]['word'] == 'hello'
+
+
+def test_schema_result():
+    assert compact.result == plain.result
+
+
+def test_schema_output():
+    graph = mrop.ComputeGraph() \
+        .input(compact.compute_order[0])
+    graph.compile()
+    output = io.StringIO()
+    graph.write_result(output)
+    rows = [json.loads(line) for line in output.getvalue().split('\n')]
+    assert rows == plain.compute_order[0].result
+
+
+def test_schema_mismatch():
+    graph = mrop.ComputeGraph(schema=['doc_id']) \
+        .map(mapper_split)
+    graph.source = data
+    graph.compile()
+    with pytest.raises(ValueError):
+        graph.compute()
+
+
+def test_reserved_field_names():
+    fields = ['keys', 'values', 'items', 'get', 'copy', 'fields', 'slots']
+    row = dict(zip(fields, range(len(fields))))
+    record = mrop.mrop.record_maker(tuple(fields))(row)
+    assert dict(record) == row
+    assert record.copy() == row
+    assert record.get('copy') == 4 and record.get('missing') is None
+    assert list(record.keys()) == fields
+    assert list(record.values()) == list(range(len(fields)))
+    assert 'fields' in record and [] not in record
+    assert pickle.loads(pickle.dumps(record)) == row
+
+    records = mrop.ComputeGraph(schema=fields)
+    records.source = [row]
+    extra = mrop.ComputeGraph()
+    extra.source = [{'keys': 0, 'extra': 'joined'}]
+    graph = mrop.ComputeGraph() \
+        .input(records) \
+        .join(extra, key='keys')
+    graph.compile()
+    graph.compute(keep_results=True)
+    assert type(records.result[0]).fields == tuple(fields)
+    assert graph.result == [dict(row, extra='joined')]
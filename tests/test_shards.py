@@ -0,0 +1,138 @@
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append('../')
+import mrop
+
+
+def mapper_split(row):
+    for word in row['text'].split():
+        yield {'word': word}
+
+
+def reducer_count(rows):
+    yield {'word': rows[0]['word'], 'count': len(rows)}
+
+
+def row_counter(state, row):
+    state['row_count'] += 1
+    return state
+
+
+data = [{'doc_id': i, 'text': 'a b c d'[:1 + 2 * (i % 4)]} for i in range(5000)]
+directory = tempfile.mkdtemp()
+sizes = [1000, 2500, 0, 1500]
+paths = []
+for number, size in enumerate(sizes):
+    start = sum(sizes[:number])
+    content = ''.join(json.dumps(row) + '\n'
+                      for row in data[start:start + size]).encode()
+    path = os.path.join(directory, 'part-{}.json'.format(number))
+    if number == 1:
+        path += '.gz'
+        content = gzip.compress(content)
+    with open(path, 'wb') as f:
+        f.write(content)
+    paths.append(path)
+pattern = os.path.join(directory, 'part-*')
+
+
+def build():
+    graph = mrop.ComputeGraph() \
+        .map(mapper_split) \
+        .sort('word') \
+        .reduce(reducer_count, 'word')
+    graph.compile()
+    return graph
+
+
+def run(input, **kwargs):
+    out = io.StringIO()
+    build().run(input=input, output=out, **kwargs)
+    return [json.loads(line) for line in out.getvalue().split('\n')]
+
+
+expected = [{'word': word, 'count': count} for word, count in
+            [('a', 5000), ('b', 3750), ('c', 2500), ('d', 1250)]]
+
+
+def test_ordered_shards():
+    shards = mrop.Input(paths, readers=2)
+    assert list(shards) == data
+    assert shards.shard_rows == dict(zip(paths, sizes))
+
+
+def test_unordered_shards():
+    shards = mrop.Input(pattern, streaming=True, ordered=False)
+    rows = list(shards)
+    assert sorted(rows, key=lambda row: row['doc_id']) == data
+    assert shards.shard_rows == dict(zip(paths, sizes))
+
+
+def test_process_shards():
+    shards = mrop.Input(paths, readers=2, processes=True)
+    assert list(shards) == data
+    assert shards.shard_rows == dict(zip(paths, sizes))
+    assert run(pattern, processes=True, ordered=False) == expected
+
+
+def test_run_shards():
+    assert run(pattern) == expected
+    assert run(paths, streaming=True, readers=1) == expected
+
+
+def test_shared_shards():
+    words = mrop.ComputeGraph() \
+        .map(mapper_split)
+    counter = mrop.ComputeGraph() \
+        .fold(row_counter, {'row_count': 0})
+    graph = mrop.ComputeGraph() \
+        .input(words) \
+        .sort('word') \
+        .reduce(reducer_count, 'word') \
+        .join(counter, strategy='cross')
+    graph.compile()
+
+    out = io.StringIO()
+    graph.run(subgraph_inputs={words: paths, counter: list(paths)},
+              output=out, streaming=True)
+    res = [json.loads(line) for line in out.getvalue().split('\n')]
+    assert res == [dict(row, row_count=len(data)) for row in expected]
+
+
+def test_shard_profile():
+    profile = mrop.Profile()
+    run(paths, profile=profile)
+    source = profile.as_dict()[0]['stages'][0]
+    assert source['rows_out'] == len(data)
+    assert source['shards'] == dict(zip(paths, sizes))
+
+
+def test_shard_fingerprint():
+    assert mrop.Input(paths).fingerprint() == mrop.Input(pattern).fingerprint()
+    assert mrop.Input(paths).fingerprint() != \
+        mrop.Input(paths, ordered=False).fingerprint()
+
+
+def test_stopped_shards():
+    shards = mrop.Input(paths, streaming=True)
+    limit = mrop.Limit(10)
+    limit.set_input_gen(shards)
+    assert list(limit) == data[:10]
+    assert all(shards.shard_rows[path] == size
+               for path, size in zip(paths, sizes) if path in shards.shard_rows)
+    assert threading.active_count() == 1
+
+
+def test_missing_shards():
+    try:
+        mrop.Input(os.path.join(directory, 'missing-*'))
+    except ValueError:
+        pass
+    else:
+        assert False
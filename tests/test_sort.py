@@ -38,3 +38,45 @@ true_res = sorted(true_res)
 
 def test_sort():
     assert res == true_res
+
+external_graph = mrop.ComputeGraph() \
+    .map(split_input) \
+    .sort('word', buffer_size=7)
+external_graph.source = data
+external_graph.compile()
+external_graph.compute()
+
+external_res = [row['word'] for row in external_graph.result]
+
+
+def test_external_sort():
+    assert external_res == true_res
+
+
+def mapper_identity(row):
+    yield row
+
+
+presorted_graph = mrop.ComputeGraph() \
+    .map(split_input) \
+    .sort('word') \
+    .map(mapper_identity, preserves_order=True) \
+    .sort('word')
+presorted_graph.source = data
+presorted_graph.compile()
+presorted_graph.compute()
+
+presorted_res = [row['word'] for row in presorted_graph.result]
+
+
+def test_redundant_sort_elided():
+    assert len(presorted_graph.plan) == 3
+    assert presorted_res == true_res
+
+narrow_sort = mrop.Sort('word', buffer_size=3, merge_width=2)
+narrow_sort.set_input_gen([row for item in data for row in split_input(item)])
+narrow_res = [row['word'] for row in narrow_sort]
+
+
+def test_multipass_external_sort():
+    assert narrow_res == true_res
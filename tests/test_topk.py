@@ -0,0 +1,77 @@
+import sys
+
+sys.path.append('../')
+import mrop
+
+
+data = [{'doc_id': i % 5, 'word': 'w{}'.format(i % 11), 'pmi': (i * 7) % 13}
+        for i in range(200)]
+
+
+def top_by_group(rows, k, largest=True):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row['doc_id'], []).append(row)
+    return [top for group in groups.values()
+            for top in sorted(group, key=lambda row: row['pmi'],
+                              reverse=largest)[:k]]
+
+
+def compute(graph, source=data):
+    graph.source = source
+    graph.compile()
+    graph.compute()
+    return graph.result
+
+
+pulled = []
+
+
+def counted(rows):
+    for row in rows:
+        pulled.append(row)
+        yield row
+
+
+def mapper_identity(row):
+    yield row
+
+
+def test_top_k_by_group():
+    res = compute(mrop.ComputeGraph().top_k('doc_id', 3, by='pmi'))
+    assert res == top_by_group(data, 3)
+
+
+def test_top_k_smallest():
+    res = compute(mrop.ComputeGraph().top_k('doc_id', 4, by='pmi',
+                                            largest=False))
+    assert res == top_by_group(data, 4, largest=False)
+
+
+def test_top_k_sorted_groups():
+    graph = mrop.ComputeGraph().sort('doc_id').top_k('doc_id', 2, by='pmi')
+    res = compute(graph)
+    assert 'TopK' in graph.dump_plan()
+    assert res == top_by_group(sorted(data, key=lambda row: row['doc_id']), 2)
+
+
+def test_top_k_global():
+    res = compute(mrop.ComputeGraph().top_k(None, 5, by=['pmi', 'word']))
+    assert res == sorted(data, key=lambda row: (row['pmi'], row['word']),
+                         reverse=True)[:5]
+
+
+def test_sort_limit():
+    graph = mrop.ComputeGraph().sort('pmi').limit(7)
+    res = compute(graph)
+    plan = graph.dump_plan().split('plan:')[1]
+    assert 'TopK' in plan and 'Sort' not in plan
+    assert res == sorted(data, key=lambda row: row['pmi'])[:7]
+
+
+def test_limit_stops_input():
+    del pulled[:]
+    res = compute(mrop.ComputeGraph().map(mapper_identity).limit(3),
+                  counted(data))
+    assert res == data[:3]
+    assert len(pulled) == 3